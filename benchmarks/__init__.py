@@ -0,0 +1,6 @@
+"""Benchmarks of the hot paths of pylicensing.
+
+Run them from the root of the repository with `python -m benchmarks`, see
+`python -m benchmarks --help` for the options. The `KeyManager` benchmarks run
+against a `MemoryCollection`, so no database is needed.
+"""
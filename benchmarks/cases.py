@@ -0,0 +1,256 @@
+"""The formats and cases benchmarked.
+
+A case is prepared once per repetition with the size and format it runs
+with, returning the function to time. Preparing is not timed, so it sets up
+whatever state the function consumes, e.g. a fresh collection to insert into.
+
+Cases registered with `memory=True` additionally report the memory the
+result of their function keeps allocated, per key.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Sequence
+
+from pylicensing import (
+    Key,
+    KeyFormat,
+    KeyManager,
+    MemoryCollection,
+    Snapshot,
+    hwid_tools,
+)
+from pylicensing.key import generate_key, generate_keys
+from pylicensing.validation import check_hwid, conforms_format, conforms_format_many
+
+SECRET = b"benchmark-secret"
+
+FORMATS: dict[str, KeyFormat] = {
+    "short": KeyFormat(2, 4, "-"),
+    "default": KeyFormat(5, 5, "-", numeric_characters=True),
+    "long": KeyFormat(
+        8,
+        8,
+        "-",
+        lowercase_ascii=True,
+        numeric_characters=True,
+        special_characters=True,
+    ),
+    "numeric": KeyFormat(4, 6, "-", uppercase_ascii=False, numeric_characters=True),
+    "signed": KeyFormat(
+        5, 5, "-", numeric_characters=True, signature_length=6, embed_metadata=True
+    ),
+}
+
+Prepare = Callable[[int, KeyFormat], Callable[[], object]]
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    group: str
+    prepare: Prepare
+    memory: bool = False
+
+
+CASES: list[Case] = []
+
+
+def case(group: str, *, memory: bool = False) -> Callable[[Prepare], Prepare]:
+    def register(prepare: Prepare) -> Prepare:
+        CASES.append(Case(prepare.__name__, group, prepare, memory))
+        return prepare
+
+    return register
+
+
+def _secret(format: KeyFormat) -> bytes | None:
+    return SECRET if format.signature_length else None
+
+
+def _signing(format: KeyFormat) -> dict:
+    """The arguments signed formats need to generate keys with."""
+    if not format.signature_length:
+        return {}
+    valid_until = datetime.now().replace(microsecond=0) + timedelta(30)
+    return {"secret": SECRET, "valid_until": valid_until, "hwid_limit": 2}
+
+
+def _keys(n: int, format: KeyFormat) -> list[Key]:
+    return Key.create_many(format, n, "Bench", 2, timedelta(30), secret=_secret(format))
+
+
+def _manager(keys: Sequence[Key] = ()) -> KeyManager:
+    manager = KeyManager(MemoryCollection())
+    manager.ensure_indexes()
+    if keys:
+        manager.add_many(keys)
+    return manager
+
+
+@case("generation")
+def generate_key_single(n: int, format: KeyFormat):
+    signing = _signing(format)
+    return lambda: [generate_key(format, **signing) for _ in range(n)]
+
+
+@case("generation")
+def generate_keys_batch(n: int, format: KeyFormat):
+    signing = _signing(format)
+    return lambda: generate_keys(format, n, **signing)
+
+
+@case("generation")
+def key_create(n: int, format: KeyFormat):
+    secret = _secret(format)
+    valid_for = timedelta(30)
+    return lambda: [
+        Key.create(format, "Bench", 2, valid_for, secret=secret) for _ in range(n)
+    ]
+
+
+@case("generation")
+def key_create_many(n: int, format: KeyFormat):
+    return lambda: _keys(n, format)
+
+
+@case("validation")
+def conforms_format_single(n: int, format: KeyFormat):
+    keys = generate_keys(format, n, **_signing(format))
+    return lambda: [conforms_format(key, format) for key in keys]
+
+
+@case("validation")
+def conforms_format_batch(n: int, format: KeyFormat):
+    keys = generate_keys(format, n, **_signing(format))
+    return lambda: conforms_format_many(keys, format)
+
+
+@case("validation")
+def check_hwid_registered(n: int, format: KeyFormat):
+    # a fixed HWID, so the case runs offline and on hosts without a machine ID
+    hwid_tools.set_provider(hwid_tools.StaticProvider("BENCH-HWID"))
+    keys = _keys(n, format)
+    for key in keys:
+        check_hwid(key)
+    return lambda: [check_hwid(key) for key in keys]
+
+
+@case("serialization")
+def to_database_data(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    return lambda: [key.to_database_data() for key in keys]
+
+
+@case("serialization", memory=True)
+def key_from_document(n: int, format: KeyFormat):
+    documents = [key.to_database_data() for key in _keys(n, format)]
+    return lambda: [Key.from_document(document) for document in documents]
+
+
+@case("serialization", memory=True)
+def key_from_kwargs(n: int, format: KeyFormat):
+    documents = [key.to_database_data() for key in _keys(n, format)]
+
+    def construct() -> list[Key]:
+        keys = [Key(**document) for document in documents]
+        for key in keys:
+            key.mark_saved()
+        return keys
+
+    return construct
+
+
+@case("key_manager")
+def add_to_collection(n: int, format: KeyFormat):
+    manager, keys = _manager(), _keys(n, format)
+    return lambda: [manager.add_to_collection(key) for key in keys]
+
+
+@case("key_manager")
+def add_many(n: int, format: KeyFormat):
+    manager, keys = _manager(), _keys(n, format)
+    return lambda: manager.add_many(keys)
+
+
+@case("key_manager")
+def get(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    manager = _manager(keys)
+    return lambda: [manager.get(key.key) for key in keys]
+
+
+@case("key_manager")
+def get_many(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    manager = _manager(keys)
+    strings = [key.key for key in keys]
+    return lambda: manager.get_many(strings)
+
+
+@case("key_manager")
+def exists(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    manager = _manager(keys)
+    return lambda: [manager.exists(key.key) for key in keys]
+
+
+@case("key_manager")
+def exists_many(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    manager = _manager(keys)
+    strings = [key.key for key in keys]
+    return lambda: manager.exists_many(strings)
+
+
+@case("key_manager")
+def update(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    manager = _manager(keys)
+    for key in keys:
+        key.owner = "Changed"
+    return lambda: [manager.update(key) for key in keys]
+
+
+@case("key_manager")
+def activate(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    manager = _manager(keys)
+    return lambda: [manager.activate(key.key, "HWID") for key in keys]
+
+
+@case("key_manager")
+def iter_keys(n: int, format: KeyFormat):
+    manager = _manager(_keys(n, format))
+    return lambda: sum(1 for _ in manager.iter_keys())
+
+
+@case("key_manager", memory=True)
+def export_columns(n: int, format: KeyFormat):
+    manager = _manager(_keys(n, format))
+    return lambda: manager.export_columns()
+
+
+# the snapshots are written to a directory removed along with the process
+_SNAPSHOTS = tempfile.TemporaryDirectory(prefix="pylicensing-benchmarks-")
+
+
+@case("snapshot")
+def export_snapshot(n: int, format: KeyFormat):
+    manager = _manager(_keys(n, format))
+    path = os.path.join(_SNAPSHOTS.name, "export.snapshot")
+    return lambda: manager.export_snapshot(path, format=format)
+
+
+@case("snapshot")
+def snapshot_get(n: int, format: KeyFormat):
+    keys = _keys(n, format)
+    path = os.path.join(_SNAPSHOTS.name, "get.snapshot")
+    _manager(keys).export_snapshot(path, format=format)
+    snapshot = Snapshot(path)
+    strings = [key.key for key in keys]
+    return lambda: [snapshot.get(key) for key in strings]
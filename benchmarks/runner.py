@@ -0,0 +1,192 @@
+"""Runs the benchmarks and compares their results against a baseline."""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from typing import Iterable, Optional
+
+from pylicensing import KeyFormat
+
+from .cases import CASES, FORMATS, Case
+
+
+def measure(case: Case, size: int, format_name: str, min_time: float) -> dict:
+    """Times a case, repeating it until it ran for `min_time` seconds, at least
+    three times and at most fifty. Only the prepared function is timed."""
+    format = FORMATS[format_name]
+    timings: list[float] = []
+    while len(timings) < 3 or (sum(timings) < min_time and len(timings) < 50):
+        run = case.prepare(size, format)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    best = min(timings)
+    result = {
+        "case": case.name,
+        "group": case.group,
+        "format": format_name,
+        "size": size,
+        "repeats": len(timings),
+        "best": best,
+        "median": statistics.median(timings),
+        "ops_per_second": size / best if best else float("inf"),
+    }
+    if case.memory:
+        result["bytes_per_op"] = retained(case, size, format)
+    return result
+
+
+def retained(case: Case, size: int, format: KeyFormat) -> float:
+    """Returns the bytes per key the result of a case keeps allocated, as
+    traced by `tracemalloc` while it runs once more."""
+    run = case.prepare(size, format)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        kept = run()
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return allocated / size
+
+
+def run(
+    sizes: Iterable[int],
+    formats: Iterable[str],
+    pattern: Optional[str] = None,
+    min_time: float = 0.2,
+) -> dict:
+    """Runs every case matching the pattern with every size and format,
+    returns the results along with a description of the environment."""
+    results = []
+    for case in CASES:
+        if pattern and pattern not in f"{case.group}.{case.name}":
+            continue
+        for format_name in formats:
+            for size in sizes:
+                result = measure(case, size, format_name, min_time)
+                results.append(result)
+                print(
+                    f"{case.group}.{case.name:<24} {format_name:<8} {size:>8} "
+                    f"{result['best'] * 1e3:>10.3f}ms "
+                    f"{result['ops_per_second']:>14,.0f} ops/s"
+                    + (
+                        f" {result['bytes_per_op']:>8,.0f} B/key"
+                        if "bytes_per_op" in result
+                        else ""
+                    ),
+                    file=sys.stderr,
+                )
+
+    try:
+        package = version("pylicensing")
+    except PackageNotFoundError:
+        package = "unknown"
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pylicensing": package,
+        },
+        "results": results,
+    }
+
+
+def _identity(result: dict) -> tuple:
+    return result["case"], result["format"], result["size"]
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Returns the results that got slower than their baseline by more than the
+    threshold, e.g. 0.25 for 25%. Results missing in either are skipped."""
+    previous = {_identity(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(_identity(result))
+        if before is None or not before["best"]:
+            continue
+
+        slowdown = result["best"] / before["best"] - 1
+        if slowdown > threshold:
+            regressions.append(
+                {**result, "baseline": before["best"], "slowdown": slowdown}
+            )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        default="1,1000,100000",
+        help="comma seperated amounts of keys per case, up to 1000000",
+    )
+    parser.add_argument(
+        "--formats",
+        default=",".join(FORMATS),
+        help=f"comma seperated formats out of {', '.join(FORMATS)}",
+    )
+    parser.add_argument(
+        "-k",
+        dest="pattern",
+        help="only run the cases containing this, e.g. key_manager",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="the seconds to repeat each case for at least",
+    )
+    parser.add_argument("-o", "--output", help="the file to write the JSON results to")
+    parser.add_argument("--baseline", help="a results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="the slowdown over the baseline to report as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    formats = args.formats.split(",")
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown formats: {', '.join(sorted(unknown))}")
+
+    results = run(sizes, formats, args.pattern, args.min_time)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as fp:
+        regressions = compare(results, json.load(fp), args.threshold)
+    for result in regressions:
+        print(
+            f"REGRESSION {result['group']}.{result['case']} {result['format']} "
+            f"{result['size']}: {result['slowdown']:.0%} slower",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
@@ -3,7 +3,7 @@ import os
 import dotenv
 from pymongo import MongoClient
 
-from pylicensing import KeyFormat, KeyManager, validation, exceptions
+from pylicensing import ActivationStatus, KeyFormat, KeyManager, hwid_tools, validation
 
 
 if __name__ == "__main__":
@@ -34,23 +34,23 @@ if __name__ == "__main__":
     client: MongoClient = MongoClient(os.environ.get("ACCESS_CONN"))
     key_manager = KeyManager(client.test.example)
 
-    # Now, we get the key from the database. If a key is not found, a LookupError is raised.
-    # If the key is found, we get a `Key` object which includes all data of the key.
-    try:
-        license_key = key_manager.get(key)
-    except LookupError:
+    # Now, we activate the key on this device. This checks that the key exists and has not
+    # expired, and registers the HWID of the device if it is not already, given the key has a
+    # free HWID slot left. All of this happens in a single atomic database call.
+    result = key_manager.activate(key, hwid_tools.get_device_hwid())
+
+    if result.status == ActivationStatus.NOT_FOUND:
         print("Key does not exist!")
         exit()
 
     # Now we can check whether the key has expired
-    if license_key.expired:
+    if result.status == ActivationStatus.EXPIRED:
         print("Key has expired!")
         exit()
 
-    try:
-        validation.check_hwid(license_key)
-    except exceptions.ExceededMaximumHWIDError:
-        print("Login failed. Exceeded the maximum amount of HWIDs.") 
+    if result.status == ActivationStatus.SEATS_EXHAUSTED:
+        print("Login failed. Exceeded the maximum amount of HWIDs.")
         exit()
-    key_manager.update(license_key)
-    print("Login successful.")
\ No newline at end of file
+
+    # the activated key, with all of its data, is available as `result.key`
+    print("Login successful.")
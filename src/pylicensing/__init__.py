@@ -1,3 +1,7 @@
-from .database import KeyManager
+from .async_database import AsyncKeyManager
+from .database import ActivationResult, ActivationStatus, KeyManager
+from .export import KeyColumns
 from .key import Key, KeyFormat
-from . import hwid_tools
\ No newline at end of file
+from .snapshot import Snapshot
+from .storage import MemoryCollection, SQLiteCollection
+from . import hwid_tools, instrumentation
\ No newline at end of file
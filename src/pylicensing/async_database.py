@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, TypeVar
+
+from .cache import KeyCache
+from .database import (
+    ActivationResult,
+    BulkInsertResult,
+    BulkUpdateResult,
+    KeyManager,
+)
+from .export import KeyColumns
+from .key import Key
+from .storage import KeyStorage
+
+T = TypeVar("T")
+
+
+class AsyncKeyManager:
+    """Asyncio front end of a `KeyManager`, for license servers running on an
+    event loop.
+
+    Every call is handed to a bounded pool of threads that run the blocking
+    `KeyManager` operations, so the event loop never waits on the database.
+    Thousands of calls can be awaited at once, at most `max_workers` of them
+    talk to the database at the same time, the rest queue up.
+
+    The manager should be closed once it is no longer needed, either through
+    `close` or by using it as an async context manager.
+
+    Parameters
+    ----------
+    collection :class:`KeyStorage | KeyManager`:
+        The collection the keys are stored in, or the `KeyManager` to wrap.
+
+    max_workers :class:`int`:
+        The amount of threads to run database calls on.
+
+    cache :class:`KeyCache | None`:
+        The cache of the `KeyManager`, if it is created from a collection.
+    """
+
+    def __init__(
+        self,
+        collection: KeyStorage | KeyManager,
+        *,
+        max_workers: int = 32,
+        cache: Optional[KeyCache] = None,
+    ) -> None:
+        if isinstance(collection, KeyManager):
+            self._manager = collection
+        else:
+            self._manager = KeyManager(collection, cache=cache)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="pylicensing"
+        )
+
+    @property
+    def manager(self) -> KeyManager:
+        return self._manager
+
+    async def _run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    async def ensure_indexes(self) -> list[str]:
+        """See `KeyManager.ensure_indexes`."""
+        return await self._run(self._manager.ensure_indexes)
+
+    async def add_to_collection(self, key: Key, *, ignore_exists: bool = False) -> bool:
+        """See `KeyManager.add_to_collection`."""
+        return await self._run(
+            self._manager.add_to_collection, key, ignore_exists=ignore_exists
+        )
+
+    async def add_many(self, keys: Iterable[Key], **kwargs: Any) -> BulkInsertResult:
+        """See `KeyManager.add_many`."""
+        return await self._run(self._manager.add_many, keys, **kwargs)
+
+    async def remove_from_collection(
+        self, key: Key, *, ignore_nonexistent: bool = False
+    ) -> None:
+        """See `KeyManager.remove_from_collection`."""
+        await self._run(
+            self._manager.remove_from_collection,
+            key,
+            ignore_nonexistent=ignore_nonexistent,
+        )
+
+    async def update(self, key: Key) -> None:
+        """See `KeyManager.update`."""
+        await self._run(self._manager.update, key)
+
+    async def bulk_update(self, filter: dict, update: dict | list) -> BulkUpdateResult:
+        """See `KeyManager.bulk_update`."""
+        return await self._run(self._manager.bulk_update, filter, update)
+
+    async def bulk_update_keys(
+        self, keys: Iterable[Key], update: Optional[dict | list] = None, **kwargs: Any
+    ) -> BulkUpdateResult:
+        """See `KeyManager.bulk_update_keys`."""
+        return await self._run(self._manager.bulk_update_keys, keys, update, **kwargs)
+
+    async def activate(self, key: str, hwid: str) -> ActivationResult:
+        """See `KeyManager.activate`."""
+        return await self._run(self._manager.activate, key, hwid)
+
+    async def exists(self, key: str) -> bool:
+        """See `KeyManager.exists`."""
+        return await self._run(self._manager.exists, key)
+
+    async def exists_many(self, keys: Iterable[str], **kwargs: Any) -> set[str]:
+        """See `KeyManager.exists_many`."""
+        return await self._run(self._manager.exists_many, keys, **kwargs)
+
+    async def get(self, key: str) -> Key:
+        """See `KeyManager.get`."""
+        return await self._run(self._manager.get, key)
+
+    async def get_many(
+        self, keys: Iterable[str], **kwargs: Any
+    ) -> dict[str, Optional[Key]]:
+        """See `KeyManager.get_many`."""
+        return await self._run(self._manager.get_many, keys, **kwargs)
+
+    async def iter_keys(
+        self,
+        filter: Optional[dict] = None,
+        *,
+        fields: Optional[Iterable[str]] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Key] | AsyncIterator[dict]:
+        """See `KeyManager.iter_keys`.
+
+        The batches are fetched from the cursor on the thread pool, so only one
+        batch is held in memory at a time.
+        """
+        keys = await self._run(
+            self._manager.iter_keys, filter, fields=fields, batch_size=batch_size
+        )
+        while batch := await self._run(lambda: list(islice(keys, batch_size))):
+            for key in batch:
+                yield key
+
+    async def count_keys(self, filter: Optional[dict] = None) -> int:
+        """See `KeyManager.count_keys`."""
+        return await self._run(self._manager.count_keys, filter)
+
+    async def export_columns(
+        self, filter: Optional[dict] = None, **kwargs: Any
+    ) -> KeyColumns:
+        """See `KeyManager.export_columns`."""
+        return await self._run(self._manager.export_columns, filter, **kwargs)
+
+    async def export_snapshot(
+        self, path: str | os.PathLike, filter: Optional[dict] = None, **kwargs: Any
+    ) -> int:
+        """See `KeyManager.export_snapshot`."""
+        return await self._run(self._manager.export_snapshot, path, filter, **kwargs)
+
+    async def get_all_keys(self, *, batch_size: int = 1000) -> AsyncIterator[Key]:
+        """Iterates over all keys in the collection as `Key` objects, see
+        `iter_keys`."""
+        async for key in self.iter_keys(batch_size=batch_size):
+            yield key
+
+    async def close(self) -> None:
+        """Shuts down the thread pool once all pending calls are done."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self._executor.shutdown, wait=True)
+        )
+
+    async def __aenter__(self) -> AsyncKeyManager:
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .key import Key
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """A snapshot of the counters of a `KeyCache`.
+
+    Parameters
+    ----------
+    hits :class:`int`:
+        Lookups answered from the cache.
+
+    misses :class:`int`:
+        Lookups that had to load the key, including expired entries.
+
+    coalesced :class:`int`:
+        Misses that waited for a load already in flight instead of loading.
+
+    evictions :class:`int`:
+        Entries dropped to make room for new ones.
+
+    expirations :class:`int`:
+        Entries dropped because they outlived the ttl.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class _Load:
+    """A load of a key in flight, other threads missing on the same key wait
+    for it rather than loading the key again."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.key: Optional[Key] = None
+        self.error: Optional[BaseException] = None
+        self.stale = False
+
+
+class KeyCache:
+    """Thread-safe read-through cache of `Key`s by their key-string.
+
+    The cache holds at most `maxsize` keys, evicting the least recently used
+    one when full. Entries expire `ttl` seconds after they were stored, so
+    changes made to the collection by other processes are picked up.
+
+    Concurrent misses on the same key-string are coalesced into one load.
+    Keys that could not be found are not cached.
+
+    Every lookup returns a copy of the cached `Key`, so modifying it does not
+    affect the cache or other callers.
+
+    Parameters
+    ----------
+    maxsize :class:`int`:
+        The maximum amount of keys to hold.
+
+    ttl :class:`float | None`:
+        The seconds an entry stays valid for, `None` to never expire entries.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl: Optional[float] = 60.0,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError("Cache size must be greater than 0")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[Key, float]] = OrderedDict()
+        self._loading: dict[str, _Load] = {}
+        self._hits = self._misses = self._coalesced = 0
+        self._evictions = self._expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a key-string is cached and not expired, without counting as
+        a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (
+                self.ttl is None or self._clock() < entry[1]
+            )
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                self._hits,
+                self._misses,
+                self._coalesced,
+                self._evictions,
+                self._expirations,
+            )
+
+    def get(self, key: str) -> Optional[Key]:
+        """Returns a copy of a cached `Key`, `None` if it is not cached."""
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return _copy(cached)
+
+    def get_or_load(self, key: str, load: Callable[[str], Key]) -> Key:
+        """Returns a copy of a cached `Key`, loading it on a miss.
+
+        If another thread is already loading the same key, this waits for its
+        result instead. Errors raised by `load` are raised to all waiters.
+        """
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                self._hits += 1
+                return _copy(cached)
+
+            self._misses += 1
+            pending = self._loading.get(key)
+            owner = pending is None
+            if pending is None:
+                pending = self._loading[key] = _Load()
+            else:
+                self._coalesced += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            assert pending.key is not None
+            return _copy(pending.key)
+
+        try:
+            pending.key = load(key)
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._loading[key]
+                if pending.key is not None and not pending.stale:
+                    self._store(pending.key)
+            pending.done.set()
+        return _copy(pending.key)
+
+    def put(self, key: Key) -> None:
+        """Stores a copy of a `Key`, replacing the entry of its key-string."""
+        with self._lock:
+            self._store(_copy(key))
+            if key.key in self._loading:
+                self._loading[key.key].stale = True
+
+    def invalidate(self, key: str) -> None:
+        """Drops the entry of a key-string, if it is cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+            if key in self._loading:
+                self._loading[key].stale = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for pending in self._loading.values():
+                pending.stale = True
+
+    def _lookup(self, key: str) -> Optional[Key]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        cached, expires = entry
+        if self.ttl is not None and self._clock() >= expires:
+            del self._entries[key]
+            self._expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return cached
+
+    def _store(self, key: Key) -> None:
+        expires = self._clock() + self.ttl if self.ttl is not None else 0.0
+        self._entries[key.key] = (key, expires)
+        self._entries.move_to_end(key.key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+
+def _copy(key: Key) -> Key:
+    clone = copy.copy(key)
+    clone.hwids = list(key.hwids)
+    return clone
@@ -1,8 +1,112 @@
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from enum import IntEnum
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
 from bson.objectid import ObjectId
-from pymongo.collection import Collection
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
+from .cache import KeyCache
 from .exceptions import KeyAlreadyExistsError, KeyDoesntExistError
-from .key import Key
+from .export import PROJECTION, KeyColumns
+from .instrumentation import CountingCollection, instrumented
+from .key import Key, KeyFormat, generate_key
+from .snapshot import write_snapshot
+from .storage import KeyStorage
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+# the projection of a query covered by the index on the key-string
+_SNAPSHOT_FIELDS = {"key": 1, "valid_until": 1, "hwid_limit": 1, "hwids": 1, "_id": 0}
+_KEY_ONLY = {"key": 1, "_id": 0}
+
+# dates are moved in milliseconds by the database
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+@dataclass
+class BulkInsertResult:
+    """The outcome of `KeyManager.add_many`.
+
+    Parameters
+    ----------
+    inserted :class:`list[Key]`:
+        The keys that were inserted, their `_id` is set.
+
+    duplicates :class:`list[Key]`:
+        The keys that were not inserted because their key-string already
+        exists, either in the collection or earlier in the same batch.
+    """
+
+    inserted: list[Key] = field(default_factory=list)
+    duplicates: list[Key] = field(default_factory=list)
+
+
+@dataclass
+class BulkUpdateResult:
+    """The outcome of a bulk update through a `KeyManager`.
+
+    Parameters
+    ----------
+    matched :class:`int`:
+        The amount of keys that matched.
+
+    modified :class:`int`:
+        The amount of keys that were actually changed.
+
+    missing :class:`list[Key]`:
+        The keys `KeyManager.bulk_update_keys` did not find in the collection.
+    """
+
+    matched: int = 0
+    modified: int = 0
+    missing: list[Key] = field(default_factory=list)
+
+    def __add__(self, other: BulkUpdateResult) -> BulkUpdateResult:
+        return BulkUpdateResult(
+            self.matched + other.matched,
+            self.modified + other.modified,
+            self.missing + other.missing,
+        )
+
+
+class ActivationStatus(IntEnum):
+    """The outcome of activating a key on a device."""
+
+    OK = 0
+    NOT_FOUND = 1
+    EXPIRED = 2
+    SEATS_EXHAUSTED = 3
+
+
+@dataclass(frozen=True)
+class ActivationResult:
+    """The outcome of `KeyManager.activate`.
+
+    An `ActivationResult` is truthy if the activation succeeded.
+
+    Parameters
+    ----------
+    status :class:`ActivationStatus`:
+        Whether the activation succeeded, or why it did not.
+
+    key :class:`Key | None`:
+        The key as it is stored after the activation, `None` if it was not found.
+    """
+
+    status: ActivationStatus
+    key: Optional[Key] = None
+
+    def __bool__(self) -> bool:
+        return self.status == ActivationStatus.OK
 
 
 class KeyManager:
@@ -10,20 +114,70 @@ class KeyManager:
 
     Provides access to database CRUD operations.
 
+    Call `ensure_indexes` once to create the indexes the manager relies on,
+    the unique index on the key-string also lets `add_to_collection` skip
+    checking whether a key exists before inserting it.
+
     Parameters
     ----------
-    collection :class:`Collection`:
-        The collection the keys are stored in.
+    collection :class:`KeyStorage`:
+        The collection the keys are stored in, a pymongo `Collection` or one
+        of the local backends in `pylicensing.storage`.
+
+    cache :class:`KeyCache | None`:
+        The cache to serve `get` and `exists` from, keys added, updated or
+        removed through the manager are refreshed in the cache.
     """
 
-    def __init__(self, collection: Collection) -> None:
-        self._collection = collection
+    def __init__(
+        self, collection: KeyStorage, *, cache: Optional[KeyCache] = None
+    ) -> None:
+        # counts the calls to the collection for the instrumentation
+        self._collection = CountingCollection(collection)
+        self._cache = cache
+        # whether the unique index on the key-string exists, looked up once
+        self._indexed: Optional[bool] = None
+
+    @property
+    def collection(self) -> KeyStorage:
+        return self._collection.wrapped
 
     @property
-    def collection(self) -> Collection:
-        return self._collection
+    def cache(self) -> Optional[KeyCache]:
+        return self._cache
+
+    @instrumented("key_manager.ensure_indexes")
+    def ensure_indexes(self) -> list[str]:
+        """Creates the indexes of the collection, if they do not exist yet.
+
+        The key-string gets a unique index, it is what keys are looked up by
+        and what keeps the same key from being inserted twice, even by
+        concurrent writers. Lookups by `_id` use the default `_id` index.
+
+        The expiration date gets an index for `find_expiring` and
+        `purge_expired` to query by range.
+
+        Returns the names of the indexes.
+        """
+        names = [
+            self._collection.create_index("key", unique=True),
+            self._collection.create_index("valid_until"),
+        ]
+        self._indexed = True
+        return names
 
-    def add_to_collection(self, key: Key, *, ignore_exists: bool = False) -> None:
+    def _has_unique_key_index(self) -> bool:
+        """Returns whether the key-string has a unique index, asking the
+        collection only the first time."""
+        if self._indexed is None:
+            self._indexed = any(
+                list(index["key"]) == [("key", 1)] and index.get("unique", False)
+                for index in self._collection.index_information().values()
+            )
+        return self._indexed
+
+    @instrumented("key_manager.add_to_collection")
+    def add_to_collection(self, key: Key, *, ignore_exists: bool = False) -> bool:
         """Adds a `Key` to the collection.
 
         The key is converted to a dictionary using the keys `to_database_data`,
@@ -31,24 +185,164 @@ class KeyManager:
         to be generated by mongodb. Once the key has been inserted, the keys
         `_id` will be updated to the inserted id.
 
+        If the key-string has a unique index, e.g. created by `ensure_indexes`,
+        the index rejects keys that already exist. Otherwise the collection is
+        checked for the key before inserting it, costing another round trip.
+        Whether the index exists is looked up once per manager.
+
         Parameters
         ----------
         key :class:`Key`:
             The key to add to the collection.
 
         ignore_exists :class:`bool`:
-            Whether to ignore the fact that the key already exists.
-            In the case of this happening, the key will be inserted regardless.
+            Whether to ignore the fact that the key already exists. Without the
+            unique index, the key will be inserted regardless. With the index
+            in place, the key is not inserted and `False` is returned.
+
+        Returns
+        -------
+        Whether the key was inserted.
         """
-        if not ignore_exists and self._collection.find_one({"key": key.key}):
-            raise KeyAlreadyExistsError(
-                f"{key.key} already exists in {self._collection.name}!"
-            )
+        if self._has_unique_key_index():
+            try:
+                result = self._collection.insert_one(key.to_database_data())
+            except DuplicateKeyError as e:
+                if ignore_exists:
+                    logger.debug("'%s' already exists, skipped it", key.key)
+                    return False
+                raise KeyAlreadyExistsError(
+                    f"{key.key} already exists in {self._collection.name}!"
+                ) from e
+        else:
+            if not ignore_exists and self._collection.find_one({"key": key.key}):
+                raise KeyAlreadyExistsError(
+                    f"{key.key} already exists in {self._collection.name}!"
+                )
+            result = self._collection.insert_one(key.to_database_data())
 
-        result = self._collection.insert_one(key.to_database_data())
         key._id = result.inserted_id
-        print(f"'{key.key}' has been inserted into {self._collection.name} at {key._id}!")
+        key.mark_saved()
+        if self._cache is not None:
+            self._cache.put(key)
+        logger.debug(
+            "'%s' has been inserted into %s at %s",
+            key.key,
+            self._collection.name,
+            key._id,
+        )
+        return True
+
+    @instrumented("key_manager.add_many")
+    def add_many(
+        self,
+        keys: Iterable[Key],
+        *,
+        chunk_size: int = 1000,
+        format: Optional[KeyFormat] = None,
+        secret: Optional[bytes | str] = None,
+        max_retries: int = 5,
+    ) -> BulkInsertResult:
+        """Adds many `Key`s to the collection using unordered bulk inserts.
+
+        The keys are inserted in chunks of `chunk_size`, one round trip each.
+        Once inserted, the `_id` of every key is set to its inserted id.
+
+        Duplicates are detected by the unique index on the key-string, e.g.
+        created by `ensure_indexes`. Without the index, every chunk is first
+        checked for key-strings that already exist, costing another round
+        trip per chunk, and keys inserted concurrently are not detected. If
+        the `KeyFormat` of the keys is given, keys that turn out to be
+        duplicates get a new key-string generated and are inserted again,
+        thus all keys end up in the collection. Otherwise, they are reported
+        in the returned `BulkInsertResult`.
+
+        Parameters
+        ----------
+        keys :class:`Iterable[Key]`:
+            The keys to add to the collection.
+
+        chunk_size :class:`int`:
+            The amount of keys to insert per round trip.
+
+        format :class:`KeyFormat | None`:
+            The format to generate new key-strings for duplicates with.
+
+        secret :class:`bytes | str | None`:
+            The secret to sign new key-strings with, if the format is signed.
+
+        max_retries :class:`int`:
+            How often to generate new key-strings for the same key at most.
+
+        Raises
+        ------
+        `BulkWriteError`
+            If a key could not be inserted for another reason than a duplicate.
+        """
+        result = BulkInsertResult()
+        keys = iter(keys)
+        while chunk := list(islice(keys, chunk_size)):
+            for attempt in range(max_retries + 1):
+                inserted, chunk = self._insert_chunk(chunk)
+                result.inserted.extend(inserted)
+                if not chunk or format is None or attempt == max_retries:
+                    break
+
+                for key in chunk:
+                    key.key = generate_key(
+                        format,
+                        secret=secret,
+                        valid_until=key.valid_until,
+                        hwid_limit=key.hwid_limit,
+                    )
+            result.duplicates.extend(chunk)
+        return result
+
+    def _insert_chunk(self, keys: list[Key]) -> tuple[list[Key], list[Key]]:
+        """Inserts a chunk of keys in a single `insert_many`, returns the keys
+        that were inserted and the ones that are duplicates."""
+        unique: dict[str, Key] = {}
+        duplicates = []
+        for key in keys:
+            if key.key in unique:
+                duplicates.append(key)
+            else:
+                unique[key.key] = key
+
+        if not self._has_unique_key_index():
+            existing = self._collection.find(
+                {"key": {"$in": list(unique)}}, {"key": 1, "_id": 0}
+            )
+            for document in existing:
+                # without the index, a key-string may be stored more than once
+                if (key := unique.pop(document["key"], None)) is not None:
+                    duplicates.append(key)
+            if not unique:
+                return [], duplicates
+
+        documents = [key.to_database_data() for key in unique.values()]
+        failed: set[int] = set()
+        try:
+            self._collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            failed = {error["index"] for error in errors}
 
+        inserted = []
+        for i, (key, document) in enumerate(zip(unique.values(), documents)):
+            if i in failed:
+                duplicates.append(key)
+            else:
+                key._id = document["_id"]
+                key.mark_saved()
+                inserted.append(key)
+                if self._cache is not None:
+                    self._cache.put(key)
+        return inserted, duplicates
+
+    @instrumented("key_manager.remove_from_collection")
     def remove_from_collection(
         self, key: Key, *, ignore_nonexistent: bool = False
     ) -> None:
@@ -73,47 +367,598 @@ class KeyManager:
             data = {"key": key.key}
 
         result = self._collection.delete_one(data)
+        if self._cache is not None:
+            self._cache.invalidate(key.key)
         if not result.deleted_count and not ignore_nonexistent:
             raise KeyDoesntExistError(
                 f"{key.key} does not exist in {self._collection.name}!"
             )
-        print(f"'{key.key}' has been removed from {self._collection.name}!")
+        logger.debug("'%s' has been removed from %s", key.key, self._collection.name)
 
+    @instrumented("key_manager.update")
     def update(self, key: Key) -> None:
         """Updates a `Key` in the collection. This is useful when a new HWID
-        has been added to a key, or the expiration date has changed."""
-        update = {"$set": key.to_database_data()}
-        self._collection.update_one({"_id": key._id}, update)
-        print(f"'{key.key}' has been updated!")
+        has been added to a key, or the expiration date has changed.
+
+        Only the fields that changed since the key was loaded or last saved are
+        written, see `Key.dirty_fields`. HWIDs appended to the key are added
+        to the stored ones rather than replacing them, so HWIDs registered by
+        someone else in the meantime are kept. If nothing changed, the
+        collection is not touched at all.
+
+        The key is found by its `_id` if available, otherwise by the key-string
+        it was loaded with.
+
+        Raises
+        ------
+        `KeyDoesntExistError`
+            If the key could not be found in the collection.
+        """
+        changes = _changes(key)
+        if changes is None:
+            return
+
+        result = self._collection.update_one(*changes)
+        if not result.matched_count:
+            raise KeyDoesntExistError(
+                f"{key.key} does not exist in {self._collection.name}!"
+            )
+        self._saved(key)
+        logger.debug("'%s' has been updated", key.key)
+
+    def _saved(self, key: Key) -> None:
+        """Marks a key as saved after writing its changes, refreshing it in the
+        cache."""
+        saved = key.saved_state
+        key.mark_saved()
+        if self._cache is not None:
+            if saved is not None and saved["key"] != key.key:
+                self._cache.invalidate(saved["key"])
+            self._cache.put(key)
+
+    @instrumented("key_manager.bulk_update")
+    def bulk_update(self, filter: dict, update: dict | list) -> BulkUpdateResult:
+        """Applies an update to every key matching a filter, in one round trip.
+
+        The update is run by the database through `update_many`, e.g.
+        `{"$set": {"owner": "Bert"}}` or an update pipeline. Since the manager
+        can not tell which keys changed, its cache is cleared.
+
+        Parameters
+        ----------
+        filter :class:`dict`:
+            The query to match the keys against, e.g. `{"owner": "Freddie"}`.
+
+        update :class:`dict | list`:
+            The update document or pipeline to apply.
+        """
+        result = self._collection.update_many(filter, update)
+        if self._cache is not None:
+            self._cache.clear()
+        return BulkUpdateResult(result.matched_count, result.modified_count)
+
+    @instrumented("key_manager.bulk_update_keys")
+    def bulk_update_keys(
+        self,
+        keys: Iterable[Key],
+        update: Optional[dict | list] = None,
+        *,
+        chunk_size: int = 1000,
+    ) -> BulkUpdateResult:
+        """Updates many `Key`s in the collection, one round trip per chunk.
+
+        If an update is given, it is applied to all of the keys through
+        `update_many`, matching a chunk of keys by their `_id` or key-string.
+        The keys themselves are left as they are, reload them to see the
+        result. Otherwise, the changes made to every key are written like
+        `update` does, as one `bulk_write` per chunk, and keys without
+        changes are skipped.
+
+        Keys that are not in the collection are reported in the `missing` of
+        the result rather than raising, the other keys are still updated. Only
+        the keys that were found are marked as saved. Finding out which keys
+        are missing costs another round trip, only if some of a chunk are.
+
+        Parameters
+        ----------
+        keys :class:`Iterable[Key]`:
+            The keys to update.
 
+        update :class:`dict | list | None`:
+            The update document or pipeline to apply to all of the keys.
+
+        chunk_size :class:`int`:
+            The amount of keys to update per round trip.
+        """
+        result = BulkUpdateResult()
+        keys = iter(keys)
+        while chunk := list(islice(keys, chunk_size)):
+            if update is not None:
+                result += self._update_chunk(chunk, update)
+                continue
+
+            changed = [(key, changes) for key in chunk if (changes := _changes(key))]
+            if not changed:
+                continue
+
+            requests = [UpdateOne(*changes) for _, changes in changed]
+            written = self._collection.bulk_write(requests, ordered=False)
+            missing: list[Key] = []
+            if written.matched_count < len(changed):
+                missing = self._missing([(key, changes[0]) for key, changes in changed])
+            result += BulkUpdateResult(
+                written.matched_count, written.modified_count, missing
+            )
+            skipped = {id(key) for key in missing}
+            for key, _ in changed:
+                if id(key) not in skipped:
+                    self._saved(key)
+        return result
+
+    def _missing(self, filters: list[tuple[Key, dict]]) -> list[Key]:
+        """Returns the keys whose filter, by `_id` or key-string, matches no
+        document in the collection."""
+        ids = [filter["_id"] for _, filter in filters if "_id" in filter]
+        strings = [filter["key"] for _, filter in filters if "_id" not in filter]
+        found = self._collection.find(
+            {"$or": [{"_id": {"$in": ids}}, {"key": {"$in": strings}}]},
+            {"_id": 1, "key": 1},
+        )
+        found_ids, found_strings = set(), set()
+        for document in found:
+            found_ids.add(document["_id"])
+            found_strings.add(document["key"])
+
+        missing = []
+        for key, filter in filters:
+            if "_id" in filter:
+                if filter["_id"] not in found_ids:
+                    missing.append(key)
+            elif filter["key"] not in found_strings:
+                missing.append(key)
+        return missing
+
+    def _update_chunk(self, keys: list[Key], update: dict | list) -> BulkUpdateResult:
+        ids = [key._id for key in keys if key._id is not None]
+        strings = [key.key for key in keys if key._id is None]
+        if ids and strings:
+            filter = {"$or": [{"_id": {"$in": ids}}, {"key": {"$in": strings}}]}
+        elif ids:
+            filter = {"_id": {"$in": ids}}
+        else:
+            filter = {"key": {"$in": strings}}
+
+        result = self._collection.update_many(filter, update)
+        if self._cache is not None:
+            for key in keys:
+                self._cache.invalidate(key.key)
+        missing: list[Key] = []
+        if result.matched_count < len(keys):
+            missing = self._missing(
+                [
+                    (key, {"_id": key._id} if key._id is not None else {"key": key.key})
+                    for key in keys
+                ]
+            )
+        return BulkUpdateResult(result.matched_count, result.modified_count, missing)
+
+    def extend_validity(self, filter: dict, by: timedelta) -> BulkUpdateResult:
+        """Moves the expiration date of every key matching a filter by a
+        duration, e.g. `extend_validity({"owner": "Freddie"}, timedelta(30))`."""
+        extended = {"$add": [{"$toDate": "$valid_until"}, by // _MILLISECOND]}
+        return self.bulk_update(filter, [{"$set": {"valid_until": extended}}])
+
+    def reset_hwids(self, filter: dict) -> BulkUpdateResult:
+        """Unregisters all HWIDs of every key matching a filter."""
+        return self.bulk_update(filter, {"$set": {"hwids": []}})
+
+    def find_expiring(
+        self,
+        before: datetime,
+        *,
+        after: Optional[datetime] = None,
+        fields: Optional[Iterable[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Key] | Iterator[dict]:
+        """Lazily iterates over the keys that expire before a date, including
+        the ones that already have, using the index on the expiration date.
+
+        Parameters
+        ----------
+        before :class:`datetime`:
+            The date the keys expire before.
+
+        after :class:`datetime | None`:
+            The date the keys expire at or after, e.g. `datetime.now()` to
+            skip the keys that already expired.
+
+        fields :class:`Iterable[str] | None`:
+            The fields to fetch, see `iter_keys`.
+
+        batch_size :class:`int`:
+            The amount of keys to fetch per round trip.
+        """
+        return self.iter_keys(
+            _expiry_filter(before, after), fields=fields, batch_size=batch_size
+        )
+
+    @instrumented("key_manager.purge_expired")
+    def purge_expired(
+        self,
+        *,
+        before: Optional[datetime] = None,
+        archive: Optional[KeyStorage] = None,
+        batch_size: int = 1000,
+    ) -> int:
+        """Deletes the keys that expired, in batches, returns how many.
+
+        Every batch is fetched through the index on the expiration date and
+        deleted in one round trip. If an archive collection is given, each
+        batch is copied to it before it is deleted, keys already in the archive
+        are left as they are there.
+
+        Purging stops early if nothing of a batch could be deleted, rather
+        than fetching the same batch over and over.
+
+        Parameters
+        ----------
+        before :class:`datetime | None`:
+            The date the keys expired before, defaults to now.
+
+        archive :class:`KeyStorage | None`:
+            The collection to move the expired keys to.
+
+        batch_size :class:`int`:
+            The amount of keys to purge per batch.
+        """
+        filter = _expiry_filter(before or datetime.now())
+        purged = 0
+        while True:
+            cursor = self._collection.find(filter, limit=batch_size)
+            documents = list(cursor)
+            if not documents:
+                return purged
+
+            if archive is not None:
+                try:
+                    archive.insert_many(documents, ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details["writeErrors"]
+                    if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                        raise
+
+            ids = [document["_id"] for document in documents]
+            deleted = self._collection.delete_many({"_id": {"$in": ids}}).deleted_count
+            purged += deleted
+            if self._cache is not None:
+                for document in documents:
+                    self._cache.invalidate(document["key"])
+            if not deleted:
+                # the same batch would be fetched again
+                return purged
+
+    @instrumented("key_manager.convert_legacy_dates")
+    def convert_legacy_dates(self) -> int:
+        """Converts the dates of keys stored as ISO strings by older versions to
+        native dates, in one round trip. Returns the amount of keys converted.
+
+        Keys with string dates can still be read, but `find_expiring` and
+        `purge_expired` have to query them separately, without the benefit
+        of the index covering the native dates alone.
+        """
+        filter = {
+            "$or": [
+                {"created": {"$type": "string"}},
+                {"valid_until": {"$type": "string"}},
+            ]
+        }
+        dates = {
+            field: {"$toDate": f"${field}"} for field in ("created", "valid_until")
+        }
+        return self.bulk_update(filter, [{"$set": dates}]).modified
+
+    @instrumented("key_manager.activate")
+    def activate(self, key: str, hwid: str) -> ActivationResult:
+        """Activates a key on a device in a single atomic round trip.
+
+        The key is looked up by its key-string and, if it has not expired, the
+        HWID is registered on it unless it already is, given there is a free
+        HWID slot left. Keys without a HWID limit accept any device and have
+        nothing registered.
+
+        Checking and registering happen in one `find_one_and_update`, so two
+        devices activating the same key at once can not both take its last
+        slot, unlike checking the key locally and calling `update`.
+
+        Parameters
+        ----------
+        key :class:`str`:
+            The key-string of the key to activate.
+
+        hwid :class:`str`:
+            The HWID of the device to activate the key on, see
+            `hwid_tools.get_device_hwid`.
+        """
+        now = datetime.now()
+        # legacy documents store the expiration date as an ISO string
+        active = {"$gt": [{"$toDate": "$valid_until"}, now]}
+        register = {
+            "$and": [
+                active,
+                {"$gt": ["$hwid_limit", 0]},
+                {"$not": [{"$in": [hwid, "$hwids"]}]},
+                {"$lt": [{"$size": "$hwids"}, "$hwid_limit"]},
+            ]
+        }
+        pipeline = [
+            {
+                "$set": {
+                    "hwids": {
+                        "$cond": [
+                            register,
+                            {"$concatArrays": ["$hwids", [hwid]]},
+                            "$hwids",
+                        ]
+                    }
+                }
+            }
+        ]
+        data = self._collection.find_one_and_update(
+            {"key": key}, pipeline, return_document=ReturnDocument.AFTER
+        )
+        if data is None:
+            return ActivationResult(ActivationStatus.NOT_FOUND)
+
+        activated = Key.from_document(data)
+        if self._cache is not None:
+            self._cache.put(activated)
+
+        if activated.valid_until <= now:
+            status = ActivationStatus.EXPIRED
+        elif activated.hwid_limit and hwid not in activated.hwids:
+            status = ActivationStatus.SEATS_EXHAUSTED
+        else:
+            status = ActivationStatus.OK
+        return ActivationResult(status, activated)
+
+    @instrumented("key_manager.exists")
     def exists(self, key: str) -> bool:
         """Checks whether a `Key` exists in the collection.
-        
-        This is done by calling `get_key` with the `Key` and catching
-        the `LookupError`.        
+
+        Keys in the cache are known to exist. Otherwise only the key-string is
+        fetched, which the index on it covers, rather than the whole key.
         """
-        try:
-            self.get(key)
+        if self._cache is not None and key in self._cache:
             return True
-        except LookupError:
-            return False
-        
+        return self._collection.find_one({"key": key}, _KEY_ONLY) is not None
+
+    @instrumented("key_manager.exists_many")
+    def exists_many(self, keys: Iterable[str], *, chunk_size: int = 1000) -> set[str]:
+        """Returns which of many key-strings exist in the collection.
+
+        The key-strings are checked with one `$in` query per chunk of
+        `chunk_size`, skipping the ones in the cache. To get a mask in the
+        order of the keys instead, use `[key in found for key in keys]`.
+        """
+        found: set[str] = set()
+        keys = iter(keys)
+        while chunk := list(islice(keys, chunk_size)):
+            if self._cache is not None:
+                cached = {key for key in chunk if key in self._cache}
+                found |= cached
+                chunk = [key for key in chunk if key not in cached]
+            if chunk:
+                cursor = self._collection.find({"key": {"$in": chunk}}, _KEY_ONLY)
+                found.update(data["key"] for data in cursor)
+        return found
+
+    @instrumented("key_manager.get")
     def get(self, key: str) -> Key:
-        """Returns a `Key` in the database, given it's key-string."""
+        """Returns a `Key` in the database, given it's key-string.
+
+        If the manager has a cache, the key is served from it if possible.
+        """
+        if self._cache is not None:
+            return self._cache.get_or_load(key, self._fetch)
+        return self._fetch(key)
+
+    @instrumented("key_manager.get_many")
+    def get_many(
+        self, keys: Iterable[str], *, chunk_size: int = 1000
+    ) -> dict[str, Optional[Key]]:
+        """Returns many `Key`s in the database, given their key-strings.
+
+        The keys are fetched with one `$in` query per chunk of `chunk_size`,
+        rather than one query per key. The returned dictionary is in the order
+        of the key-strings, those that could not be found map to `None`.
+
+        See `iter_many` to stream the keys instead of holding all of them.
+        """
+        return dict(self.iter_many(keys, chunk_size=chunk_size))
+
+    def iter_many(
+        self, keys: Iterable[str], *, chunk_size: int = 1000
+    ) -> Iterator[tuple[str, Optional[Key]]]:
+        """Lazily iterates over many `Key`s in the database, given their
+        key-strings, yielding each key-string with its `Key`, or `None` if it
+        could not be found.
+
+        The key-strings are consumed and looked up one chunk at a time, one
+        `$in` query per chunk, so any amount of keys can be streamed through.
+        Keys in the cache are served from it.
+        """
+        keys = iter(keys)
+        while chunk := list(islice(keys, chunk_size)):
+            found: dict[str, Key] = {}
+            if self._cache is not None:
+                for string in chunk:
+                    cached = self._cache.get(string)
+                    if cached is not None:
+                        found[string] = cached
+
+            missing = list(dict.fromkeys(k for k in chunk if k not in found))
+            if missing:
+                for data in self._collection.find({"key": {"$in": missing}}):
+                    key = found[data["key"]] = Key.from_document(data)
+                    if self._cache is not None:
+                        self._cache.put(key)
+
+            for string in chunk:
+                yield string, found.get(string)
+
+    def _fetch(self, key: str) -> Key:
         data = self._collection.find_one({"key": key})
         if not data:
             raise LookupError(f"Could not find key {key} in {self._collection.name}")
-        return Key(**data)
-    
+        return Key.from_document(data)
+
+    def iter_keys(
+        self,
+        filter: Optional[dict] = None,
+        *,
+        fields: Optional[Iterable[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Key] | Iterator[dict]:
+        """Lazily iterates over the keys in the collection matching a filter.
+
+        The filter is applied by the database and the documents are fetched in
+        batches of `batch_size` as the iteration goes, so only one batch is held
+        in memory no matter how many keys match.
+
+        Parameters
+        ----------
+        filter :class:`dict | None`:
+            The query to match the keys against, e.g. `{"owner": "Freddie"}`.
+
+        fields :class:`Iterable[str] | None`:
+            The fields to fetch. If given, only those fields are sent by the
+            database and the documents are yielded as dictionaries instead of
+            `Key` objects. Include `_id` to receive it as well.
+
+        batch_size :class:`int`:
+            The amount of documents to fetch per round trip.
+        """
+        if fields is None:
+            cursor = self._collection.find(filter or {}, batch_size=batch_size)
+            return (Key.from_document(data) for data in cursor)
+
+        projection = {field: 1 for field in fields}
+        projection.setdefault("_id", 0)
+        return self._collection.find(filter or {}, projection, batch_size=batch_size)
+
+    def iter_ids(
+        self, filter: Optional[dict] = None, *, batch_size: int = 1000
+    ) -> Iterator[ObjectId]:
+        """Lazily iterates over the `_id` of the keys matching a filter, fetching
+        nothing else."""
+        cursor = self._collection.find(filter or {}, {"_id": 1}, batch_size=batch_size)
+        return (data["_id"] for data in cursor)
+
+    @instrumented("key_manager.count_keys")
+    def count_keys(self, filter: Optional[dict] = None) -> int:
+        """Returns the amount of keys matching a filter, counted by the database."""
+        return self._collection.count_documents(filter or {})
+
     def get_all_keys(self) -> list[Key]:
-        """Returns a list of all keys in the collection as `Key` objects."""
-        results = self._collection.find()
+        """Returns a list of all keys in the collection as `Key` objects.
+
+        Every key is held in memory at once, use `iter_keys` for large
+        collections.
+        """
+        return list(self.iter_keys())
+
+    @instrumented("key_manager.export_columns")
+    def export_columns(
+        self, filter: Optional[dict] = None, *, batch_size: int = 1000
+    ) -> KeyColumns:
+        """Exports the keys matching a filter as columns, for analytics.
+
+        Only the exported fields are fetched, in batches of `batch_size`, and
+        every document is appended to the column buffers right away, so no
+        `Key` objects are built. See `KeyColumns` for turning the result into
+        NumPy arrays, an Arrow table or columnar JSON.
+        """
+        columns = KeyColumns()
+        columns.extend(
+            self._collection.find(filter or {}, PROJECTION, batch_size=batch_size)
+        )
+        return columns
+
+    @instrumented("key_manager.export_snapshot")
+    def export_snapshot(
+        self,
+        path: str | os.PathLike,
+        filter: Optional[dict] = None,
+        *,
+        format: Optional[KeyFormat] = None,
+        batch_size: int = 1000,
+    ) -> int:
+        """Writes the keys matching a filter to a snapshot file for lookups
+        without the database, returns the amount of keys written.
+
+        Only the fields a snapshot stores are fetched. See `snapshot.Snapshot`
+        for reading it.
+
+        Parameters
+        ----------
+        path :class:`str | os.PathLike`:
+            The file to write the snapshot to, replaced if it exists.
+
+        filter :class:`dict | None`:
+            The query to match the keys to include against.
+
+        format :class:`KeyFormat | None`:
+            The format of the keys, stored in the snapshot for its readers.
+
+        batch_size :class:`int`:
+            The amount of documents to fetch per round trip.
+        """
+        documents = self._collection.find(
+            filter or {}, _SNAPSHOT_FIELDS, batch_size=batch_size
+        )
+        count = write_snapshot(path, documents, format)
+        logger.debug("Wrote a snapshot of %d keys to %s", count, path)
+        return count
+
+
+def _expiry_filter(before: datetime, after: Optional[datetime] = None) -> dict:
+    """The filter of the keys expiring in a range of dates, covering keys that
+    store their dates as ISO strings as well. Dates and strings never compare
+    equal, so each of the two conditions only matches its own type."""
+    dates: dict[str, datetime] = {"$lt": before}
+    strings = {"$lt": before.isoformat()}
+    if after is not None:
+        dates["$gte"] = after
+        strings["$gte"] = after.isoformat()
+    return {"$or": [{"valid_until": dates}, {"valid_until": strings}]}
+
 
-        keys = []
-        for key in results:
-            keys.append(Key(**key))
-        return keys
+def _changes(key: Key) -> Optional[tuple[dict, dict]]:
+    """Returns the filter and update that write the changes made to a key
+    since it was loaded or last saved, `None` if there are none."""
+    dirty = key.dirty_fields
+    if not dirty:
+        return None
 
+    saved = key.saved_state
+    data = key.to_database_data()
+    update: dict[str, dict] = {}
+    if "hwids" in dirty and saved is not None:
+        added = _appended(saved["hwids"], key.hwids)
+        if added is not None:
+            dirty.discard("hwids")
+            update["$addToSet"] = {"hwids": {"$each": added}}
+    if dirty:
+        update["$set"] = {field: data[field] for field in dirty}
 
+    if key._id is not None:
+        return {"_id": key._id}, update
+    return {"key": saved["key"] if saved is not None else key.key}, update
 
 
+def _appended(saved: list, current: list) -> Optional[list]:
+    """Returns the HWIDs appended to the saved ones, `None` if they were
+    changed otherwise."""
+    if len(current) <= len(saved) or current[: len(saved)] != saved:
+        return None
+    return current[len(saved) :]
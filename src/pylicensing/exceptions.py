@@ -10,6 +10,10 @@ class KeyDoesntExistError(QueryError):
     """Raised when an expected key does not exist, for example during deletion"""
 
 
+class InvalidSnapshotError(Exception):
+    """Raised when a file is not a key snapshot, or one of an unknown version"""
+
+
 class LicenseKeyError(Exception):
     """Base class for all license key errors"""
 
@@ -19,6 +23,13 @@ class LicenseKeyError(Exception):
     def __str__(self) -> str:
         return f"Unknown error for {self.key}"
 
+class InvalidSignatureError(LicenseKeyError):
+    """Raised when the signature of a signed key does not verify"""
+
+    def __str__(self) -> str:
+        return f"{self.key} does not carry a valid signature"
+
+
 class ExceededMaximumHWIDError(LicenseKeyError):
     def __str__(self) -> str:
         return (
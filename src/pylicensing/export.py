@@ -0,0 +1,186 @@
+"""Columnar export of the keys in a collection, for analytics.
+
+`KeyManager.export_columns` streams the documents matching a filter into a
+`KeyColumns`, which keeps every field in a typed buffer of its own instead of
+building a `Key` per document. From there the columns are handed to NumPy or
+Arrow as whole arrays, or serialized as columnar JSON or msgpack:
+
+    columns = manager.export_columns({"owner": "Freddie"})
+    arrays = columns.to_numpy()
+    expired = arrays["valid_until"] < np.datetime64("now")
+    saturation = arrays["hwid_count"] / np.maximum(arrays["hwid_limit"], 1)
+
+NumPy, pyarrow and msgpack are optional, each is only imported by the method
+that needs it.
+"""
+
+from __future__ import annotations
+
+import json
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+# the fields fetched for an export, the HWIDs are only counted
+PROJECTION = {
+    "key": 1,
+    "owner": 1,
+    "hwid_limit": 1,
+    "hwids": 1,
+    "created": 1,
+    "valid_until": 1,
+    "_id": 0,
+}
+
+# the value of a missing date, the same as `NaT` in NumPy
+NAT = -(2**63)
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def milliseconds(value: Any) -> int:
+    """Turns a stored date into milliseconds since the epoch, `NAT` if it is
+    missing. Dates are stored in UTC and older documents store them as ISO
+    strings."""
+    if type(value) is datetime and value.tzinfo is None:
+        return (value - _EPOCH) // _MILLISECOND
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        return NAT
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MILLISECOND
+
+
+class KeyColumns:
+    """The keys of a collection as columns, one typed buffer per field.
+
+    The strings are kept in lists, the integers and the dates in `array`
+    buffers of 64 bit integers. Dates are counted in milliseconds since the
+    epoch in UTC, the precision MongoDB stores them with, with `NAT` for
+    missing dates.
+
+    Attributes
+    ----------
+    key :class:`list[str]`:
+        The key-strings.
+
+    owner :class:`list[str]`:
+        The owners of the keys.
+
+    hwid_limit :class:`array`:
+        The HWID limits of the keys.
+
+    hwid_count :class:`array`:
+        The amount of HWIDs registered on each key.
+
+    created :class:`array`:
+        The creation dates of the keys.
+
+    valid_until :class:`array`:
+        The expiration dates of the keys.
+    """
+
+    def __init__(self) -> None:
+        self.key: list[str] = []
+        self.owner: list[str] = []
+        self.hwid_limit = array("q")
+        self.hwid_count = array("q")
+        self.created = array("q")
+        self.valid_until = array("q")
+
+    def __len__(self) -> int:
+        return len(self.key)
+
+    def append(self, document: dict) -> None:
+        """Appends the fields of a key document to the columns."""
+        self.extend((document,))
+
+    def extend(self, documents: Iterable[dict]) -> None:
+        """Appends the fields of every key document to the columns."""
+        key, owner = self.key.append, self.owner.append
+        hwid_limit, hwid_count = self.hwid_limit.append, self.hwid_count.append
+        created, valid_until = self.created.append, self.valid_until.append
+        for document in documents:
+            get = document.get
+            key(document["key"])
+            owner(get("owner", ""))
+            hwid_limit(get("hwid_limit") or 0)
+            hwid_count(len(get("hwids") or ()))
+            created(milliseconds(get("created")))
+            valid_until(milliseconds(get("valid_until")))
+
+    def to_numpy(self) -> dict[str, Any]:
+        """Returns the columns as NumPy arrays, by field.
+
+        The strings become unicode arrays, the integers `int64` arrays and the
+        dates `datetime64[ms]` arrays with `NaT` for missing dates.
+        """
+        import numpy as np
+
+        def integers(buffer: array) -> Any:
+            return np.frombuffer(buffer, dtype=np.int64).copy()
+
+        return {
+            "key": np.array(self.key, dtype=str),
+            "owner": np.array(self.owner, dtype=str),
+            "hwid_limit": integers(self.hwid_limit),
+            "hwid_count": integers(self.hwid_count),
+            "created": integers(self.created).view("datetime64[ms]"),
+            "valid_until": integers(self.valid_until).view("datetime64[ms]"),
+        }
+
+    def to_arrow(self) -> Any:
+        """Returns the columns as a `pyarrow.Table`, with the dates as
+        `timestamp[ms]` columns that are null for missing dates."""
+        import numpy as np
+        import pyarrow as pa
+
+        columns = {}
+        for name, values in self.to_numpy().items():
+            mask = np.isnat(values) if values.dtype.kind == "M" else None
+            columns[name] = pa.array(values, mask=mask)
+        return pa.table(columns)
+
+    def to_dict(self) -> dict[str, list]:
+        """Returns the columns as lists of plain values, by field. The dates are
+        milliseconds since the epoch, `None` if missing."""
+        return {
+            "key": self.key,
+            "owner": self.owner,
+            "hwid_limit": self.hwid_limit.tolist(),
+            "hwid_count": self.hwid_count.tolist(),
+            "created": [None if d == NAT else d for d in self.created],
+            "valid_until": [None if d == NAT else d for d in self.valid_until],
+        }
+
+    def to_json(self) -> bytes:
+        """Serializes the columns as a JSON object of arrays, see `to_dict`.
+
+        Encoding a handful of flat arrays is far faster than encoding an object
+        per key, and the output is smaller as the field names appear once.
+        """
+        return json.dumps(self.to_dict(), separators=(",", ":")).encode()
+
+    def to_msgpack(self) -> bytes:
+        """Serializes the columns with msgpack, in the layout of `to_json`."""
+        import msgpack  # type: ignore[import]
+
+        return msgpack.packb(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data: dict[str, list]) -> KeyColumns:
+        """Returns the columns serialized by `to_dict`, e.g. a loaded
+        `to_json` export."""
+        columns = cls()
+        columns.key = list(data["key"])
+        columns.owner = list(data["owner"])
+        columns.hwid_limit = array("q", data["hwid_limit"])
+        columns.hwid_count = array("q", data["hwid_count"])
+        columns.created = array("q", (NAT if d is None else d for d in data["created"]))
+        columns.valid_until = array(
+            "q", (NAT if d is None else d for d in data["valid_until"])
+        )
+        return columns
@@ -1,30 +1,271 @@
+"""Determining the HWID of the current device.
+
+The HWID is obtained from the current `HWIDProvider`, by default the
+`machineid` of the device, determined once per process:
+
+    hwid_tools.set_provider(
+        hwid_tools.CachedProvider(
+            hwid_tools.MachineIDProvider("my-app"),
+            path="~/.my-app/hwid",
+            salt="my-app",
+        )
+    )
+
+Providers can be combined, e.g. to let an environment variable override the
+HWID, or replaced by a `StaticProvider` in tests.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
 import machineid  # type: ignore[import]
 
 from . import exceptions
+from .instrumentation import instrumented
 from .key import Key
 
+logger = logging.getLogger(__name__)
+
+
+class HWIDProvider(ABC):
+    """Base class of the providers of the HWID of the current device.
+
+    Subclasses implement `get`, raising a `HWIDNotDeterminedError` if the HWID
+    can not be determined.
+    """
+
+    @abstractmethod
+    def get(self) -> str: ...
+
+
+class MachineIDProvider(HWIDProvider):
+    """Provides the hashed HWID of the device using `machineid`, which reads it
+    from the system on every call.
+
+    See here for reference: https://github.com/denisbrodbeck/machineid.
+
+    Parameters
+    ----------
+    app_id :class:`str`:
+        The ID of the application, the machine ID is hashed with it so every
+        application sees a different HWID.
+    """
+
+    def __init__(self, app_id: str = "") -> None:
+        self.app_id = app_id
+
+    def get(self) -> str:
+        try:
+            return machineid.hashed_id(self.app_id)
+        except Exception as e:
+            logger.warning("HWID grab failed! %s", e)
+            raise exceptions.HWIDNotDeterminedError(e)
+
+
+class StaticProvider(HWIDProvider):
+    """Provides a fixed HWID, e.g. to stub the HWID in tests."""
+
+    def __init__(self, hwid: str) -> None:
+        self.hwid = hwid
+
+    def get(self) -> str:
+        return self.hwid
+
+
+class EnvironmentProvider(HWIDProvider):
+    """Provides the HWID set in an environment variable, falling back to
+    another provider if it is not set.
+
+    Parameters
+    ----------
+    fallback :class:`HWIDProvider | None`:
+        The provider to use if the variable is not set. If not given, a
+        `HWIDNotDeterminedError` is raised instead.
+
+    variable :class:`str`:
+        The name of the environment variable.
+    """
+
+    def __init__(
+        self,
+        fallback: Optional[HWIDProvider] = None,
+        variable: str = "PYLICENSING_HWID",
+    ) -> None:
+        self.fallback = fallback
+        self.variable = variable
+
+    def get(self) -> str:
+        hwid = os.environ.get(self.variable)
+        if hwid:
+            return hwid
+        if self.fallback is None:
+            raise exceptions.HWIDNotDeterminedError(f"${self.variable} is not set")
+        return self.fallback.get()
+
+
+class CompositeProvider(HWIDProvider):
+    """Provides a fingerprint combining the HWIDs of several providers, the
+    SHA-256 of their HWIDs in order. It fails if any of them does."""
+
+    def __init__(self, *providers: HWIDProvider) -> None:
+        if not providers:
+            raise ValueError("A composite provider needs at least one provider")
+        self.providers = providers
+
+    def get(self) -> str:
+        digest = hashlib.sha256()
+        for provider in self.providers:
+            digest.update(provider.get().encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+
+class CachedProvider(HWIDProvider):
+    """Provides the HWID of another provider, asking it only once per process.
 
+    With a `path`, the HWID is also stored in that file, so later processes
+    read it from there instead of asking the provider. The file is signed
+    with the `salt` of the application along with the name of the host, a file
+    written by another application or copied from another host is ignored and
+    replaced. This saves determining the HWID, it does not keep a determined
+    user from planting a HWID.
+
+    Parameters
+    ----------
+    provider :class:`HWIDProvider`:
+        The provider to ask for the HWID.
+
+    path :class:`str | os.PathLike | None`:
+        The file to store the HWID in, `~` is expanded.
+
+    salt :class:`str | bytes`:
+        The secret of the application to sign the file with.
+    """
+
+    def __init__(
+        self,
+        provider: HWIDProvider,
+        path: Optional[str | os.PathLike] = None,
+        *,
+        salt: str | bytes = b"",
+    ) -> None:
+        self.provider = provider
+        self.path = os.path.expanduser(path) if path is not None else None
+        self._salt = salt.encode() if isinstance(salt, str) else salt
+        self._hwid: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        hwid = self._hwid
+        if hwid is not None:
+            return hwid
+
+        with self._lock:
+            if self._hwid is None:
+                self._hwid = self._load()
+            return self._hwid
+
+    def clear(self) -> None:
+        """Forgets the HWID, the next call asks the provider again. The file is
+        removed as well."""
+        with self._lock:
+            self._hwid = None
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _signature(self, hwid: str) -> str:
+        host = f"{platform.node()}\0{sys.platform}\0{hwid}"
+        return hmac.new(self._salt, host.encode(), hashlib.sha256).hexdigest()
+
+    def _load(self) -> str:
+        if self.path is None:
+            return self.provider.get()
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            hwid = data["hwid"]
+            if hmac.compare_digest(data["signature"], self._signature(hwid)):
+                return hwid
+            logger.info("Ignoring the HWID cached in %s, it does not match", self.path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.info("Ignoring the unreadable HWID cache %s: %s", self.path, e)
+
+        hwid = self.provider.get()
+        self._store(hwid)
+        return hwid
+
+    def _store(self, hwid: str) -> None:
+        data = {"hwid": hwid, "signature": self._signature(hwid)}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning("Failed to cache the HWID in %s: %s", self.path, e)
+
+
+_provider: HWIDProvider = CachedProvider(MachineIDProvider())
+
+
+def get_provider() -> HWIDProvider:
+    """Returns the provider `get_device_hwid` uses."""
+    return _provider
+
+
+def set_provider(provider: HWIDProvider) -> None:
+    """Replaces the provider `get_device_hwid` uses.
+
+    Wrap the provider in a `CachedProvider` to determine the HWID only once.
+
+    Raises
+    ------
+    `TypeError`
+        If the provider has no `get` method
+    """
+    if not callable(getattr(provider, "get", None)):
+        raise TypeError(f"{provider!r} is not a HWID provider, it has no get method")
+
+    global _provider
+    _provider = provider
+
+
+@instrumented("hwid.get_device_hwid")
 def get_device_hwid() -> str:
-    """Returns the hashed HWID of the current device using `machineid`.
+    """Returns the HWID of the current device from the current provider.
+
+    By default this is the hashed ID of `machineid`, determined on the first
+    call and remembered for the lifetime of the process.
 
     If the HWID grab failed, a `HWIDNotDeterminedError` will be raised from
     the original exception.
-
-    See here for reference: https://github.com/denisbrodbeck/machineid.
     """
-    try:
-        machine_id = machineid.hashed_id()
-        return machine_id
-    except Exception as e:
-        print(f"HWID grab failed! {e}")
-        raise exceptions.HWIDNotDeterminedError(e)
+    return _provider.get()
 
-def add_device_hwid(key: Key) -> None:
+
+def add_device_hwid(key: Key, hwid: Optional[str] = None) -> None:
     """Adds the HWID of the current device to a `Key`.
 
     Note that this will only update the `Key` instance, and not update the key
     in the database.
 
+    Pass the `hwid` if it was already determined, otherwise it is obtained
+    through `get_device_hwid`.
+
     Raises
     ------
     `ExceededMaximumHWIDError`
@@ -39,16 +280,20 @@ def add_device_hwid(key: Key) -> None:
     if len(key.hwids) >= key.hwid_limit:
         raise exceptions.ExceededMaximumHWIDError(key)
 
-    machine_id = get_device_hwid()
+    machine_id = hwid if hwid is not None else get_device_hwid()
     if machine_id in key.hwids:
         raise exceptions.HWIDAlreadyRegisteredError(machine_id)
 
     key.hwids.append(machine_id)
 
 
-def device_hwid_allowed(key: Key) -> bool:
-    """Returns whether the HWID of the current device is registered on a `Key`."""
-    return get_device_hwid() in key.hwids or not key.hwid_limit
-
-
+def device_hwid_allowed(key: Key, hwid: Optional[str] = None) -> bool:
+    """Returns whether the HWID of the current device is registered on a `Key`,
+    always `True` if the key is not HWID limited.
 
+    Pass the `hwid` if it was already determined, otherwise it is obtained
+    through `get_device_hwid`.
+    """
+    if not key.hwid_limit:
+        return True
+    return (hwid if hwid is not None else get_device_hwid()) in key.hwids
@@ -0,0 +1,260 @@
+"""Instrumentation of the operations of pylicensing.
+
+The `KeyManager` operations, format validation and HWID acquisition report
+an `OperationEvent` to every listener added through `add_listener` once they
+finish, whether they succeeded or raised. A listener is any callable taking
+the event, e.g. a `Metrics` object or a function forwarding to a monitoring
+system:
+
+    metrics = Metrics()
+    add_listener(metrics)
+    ...
+    print(metrics.snapshot()["key_manager.get"].quantile(0.99))
+
+As long as no listener is added, instrumented operations only pay for a
+single check of the listeners.
+"""
+
+from __future__ import annotations
+
+import bisect
+import functools
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional, TypeVar
+
+from .cache import KeyCache
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+Listener = Callable[["OperationEvent"], None]
+
+# the upper bounds of the latency histogram buckets in seconds, from 1µs to
+# 10s in 1-2.5-5 steps, slower operations fall into a final overflow bucket
+BUCKETS: tuple[float, ...] = tuple(
+    base * 10.0**exponent for exponent in range(-6, 1) for base in (1, 2.5, 5)
+) + (10.0,)
+
+_listeners: tuple[Listener, ...] = ()
+_listeners_lock = threading.Lock()
+_local = threading.local()
+
+
+@dataclass(frozen=True)
+class OperationEvent:
+    """A finished operation, as it is reported to the listeners.
+
+    Parameters
+    ----------
+    name :class:`str`:
+        The name of the operation, e.g. `"key_manager.get"`.
+
+    duration :class:`float`:
+        The seconds the operation took.
+
+    round_trips :class:`int`:
+        The calls made to the collection by `KeyManager` operations, including
+        those of nested operations.
+
+    error :class:`BaseException | None`:
+        The exception the operation raised, if any.
+    """
+
+    name: str
+    duration: float
+    round_trips: int = 0
+    error: Optional[BaseException] = None
+
+
+def add_listener(listener: Listener) -> None:
+    """Adds a listener to report every operation to."""
+    global _listeners
+    with _listeners_lock:
+        _listeners = (*_listeners, listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    """Removes a listener, if it was added."""
+    global _listeners
+    with _listeners_lock:
+        _listeners = tuple(other for other in _listeners if other is not listener)
+
+
+def _emit(event: OperationEvent) -> None:
+    for listener in _listeners:
+        try:
+            listener(event)
+        except Exception:
+            logger.exception("Instrumentation listener %r failed", listener)
+
+
+def _round_trips() -> int:
+    return getattr(_local, "round_trips", 0)
+
+
+def count_round_trip() -> None:
+    """Counts a call to the collection towards the operations running on the
+    current thread."""
+    _local.round_trips = getattr(_local, "round_trips", 0) + 1
+
+
+def instrumented(name: str) -> Callable[[F], F]:
+    """Decorates a function to report an `OperationEvent` named `name` to the
+    listeners every time it is called."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _listeners:
+                return func(*args, **kwargs)
+
+            trips = _round_trips()
+            error = None
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                _emit(OperationEvent(name, duration, _round_trips() - trips, error))
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class CountingCollection:
+    """Wraps a collection, counting every call made to it as a round trip of
+    the operation running on the current thread. Without listeners, calls
+    are passed straight through."""
+
+    def __init__(self, collection: Any) -> None:
+        self.wrapped = collection
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.wrapped, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args: Any, **kwargs: Any) -> Any:
+            if _listeners:
+                count_round_trip()
+            return attr(*args, **kwargs)
+
+        # remember the wrapper so later calls skip __getattr__
+        self.__dict__[name] = call
+        return call
+
+
+@dataclass
+class OperationStats:
+    """The statistics `Metrics` collected for one operation.
+
+    Parameters
+    ----------
+    calls :class:`int`:
+        How often the operation was called.
+
+    total_time :class:`float`:
+        The seconds spent in the operation, summed over all calls.
+
+    round_trips :class:`int`:
+        The calls made to the collection, summed over all calls.
+
+    errors :class:`dict[str, int]`:
+        How often the operation raised, by the name of the exception type.
+
+    histogram :class:`list[int]`:
+        The amount of calls per latency bucket, see `BUCKETS`. The last entry
+        counts the calls slower than the last bucket.
+    """
+
+    calls: int = 0
+    total_time: float = 0.0
+    round_trips: int = 0
+    errors: dict[str, int] = field(default_factory=dict)
+    histogram: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+
+    @property
+    def mean(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the latency bucket the `q` quantile of the
+        calls falls into, `inf` if it is the overflow bucket."""
+        if not self.calls:
+            return 0.0
+
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """A listener collecting latency histograms, call, round trip and error
+    counts per operation, along with the statistics of the caches it tracks.
+
+    Parameters
+    ----------
+    caches :class:`dict[str, KeyCache] | None`:
+        The caches to report the statistics of in `cache_stats`, by name.
+    """
+
+    def __init__(self, caches: Optional[dict[str, KeyCache]] = None) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, OperationStats] = {}
+        self._caches: dict[str, KeyCache] = dict(caches or {})
+
+    def __call__(self, event: OperationEvent) -> None:
+        bucket = bisect.bisect_left(BUCKETS, event.duration)
+        with self._lock:
+            stats = self._stats.get(event.name)
+            if stats is None:
+                stats = self._stats[event.name] = OperationStats()
+            stats.calls += 1
+            stats.total_time += event.duration
+            stats.round_trips += event.round_trips
+            stats.histogram[bucket] += 1
+            if event.error is not None:
+                error = type(event.error).__name__
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def track_cache(self, name: str, cache: KeyCache) -> None:
+        """Reports the statistics of a cache in `cache_stats`."""
+        with self._lock:
+            self._caches[name] = cache
+
+    def snapshot(self) -> dict[str, OperationStats]:
+        """Returns a copy of the statistics of every operation seen so far."""
+        with self._lock:
+            return {
+                name: OperationStats(
+                    s.calls,
+                    s.total_time,
+                    s.round_trips,
+                    dict(s.errors),
+                    list(s.histogram),
+                )
+                for name, s in self._stats.items()
+            }
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        """Returns the statistics of the tracked caches, by name."""
+        with self._lock:
+            caches = dict(self._caches)
+        return {name: asdict(cache.stats) for name, cache in caches.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,286 @@
+"""Streaming issuance of very large batches of keys.
+
+Keys are generated in chunks across a pool of worker processes, every
+worker draws from its own CSPRNG stream. The records are serialized by the
+workers and written to a sink as soon as their chunk is done, so the keys
+of a batch are never held in memory all at once.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+from .key import Key, KeyFormat
+
+FIELDS = ("key", "owner", "hwid_limit", "created", "valid_until", "hwids", "ip")
+
+
+def _json_default(value: object) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class Sink(ABC):
+    """Base class of the files issued keys are written to.
+
+    Records are written as they come in. If `records_per_file` is given, the
+    output is split into numbered files of at most that many records, i.e
+    `keys.jsonl` becomes `keys-00000.jsonl`, `keys-00001.jsonl`...
+
+    Parameters
+    ----------
+    path :class:`str | Path`:
+        The file to write the records to.
+
+    records_per_file :class:`int | None`:
+        The maximum amount of records per file, unlimited if `None`.
+
+    Raises
+    ------
+    `ValueError`
+        If `records_per_file` is less than 1
+    """
+
+    def __init__(
+        self, path: str | Path, *, records_per_file: Optional[int] = None
+    ) -> None:
+        if records_per_file is not None and records_per_file < 1:
+            raise ValueError(
+                f"records_per_file must be at least 1, not {records_per_file}"
+            )
+
+        self.path = Path(path)
+        self.records_per_file = records_per_file
+        self.paths: list[Path] = []
+        self.written = 0
+        self._file: Optional[io.TextIOWrapper] = None
+        self._file_records = 0
+
+    @staticmethod
+    @abstractmethod
+    def serialize(records: list[dict]) -> list[str]:
+        """Turns a list of records into the lines to write, one per record."""
+
+    def header(self) -> str:
+        """The text every file starts with."""
+        return ""
+
+    def write(self, lines: list[str]) -> None:
+        """Writes serialized records, starting a new file when one is full."""
+        while lines:
+            if self._file is None or self._file_records == self.records_per_file:
+                self._next_file()
+
+            room = len(lines)
+            if self.records_per_file is not None:
+                room = self.records_per_file - self._file_records
+
+            assert self._file is not None
+            self._file.writelines(lines[:room])
+            self._file_records += len(lines[:room])
+            self.written += len(lines[:room])
+            lines = lines[room:]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _next_file(self) -> None:
+        self.close()
+        path = self.path
+        if self.records_per_file is not None:
+            path = path.with_name(f"{path.stem}-{len(self.paths):05d}{path.suffix}")
+
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._file.write(self.header())
+        self._file_records = 0
+        self.paths.append(path)
+
+    def __enter__(self) -> Sink:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class JSONLSink(Sink):
+    """Writes every record as a JSON object on its own line."""
+
+    @staticmethod
+    def serialize(records: list[dict]) -> list[str]:
+        dumps = json.JSONEncoder(default=_json_default, ensure_ascii=False).encode
+        return [dumps(record) + "\n" for record in records]
+
+
+class CSVSink(Sink):
+    """Writes the records as CSV rows below a header row. The HWIDs of a key
+    are written as a JSON list, a missing ip as an empty field."""
+
+    @staticmethod
+    def serialize(records: list[dict]) -> list[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        lines = []
+        for record in records:
+            writer.writerow(_csv_value(record[field]) for field in FIELDS)
+            lines.append(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+        return lines
+
+    def header(self) -> str:
+        return ",".join(FIELDS) + "\r\n"
+
+
+def _csv_value(value: object) -> object:
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _DigestSet:
+    """Fixed size open addressing set of 64-bit key hashes.
+
+    Keeping the hash of every issued key rather than the key itself costs
+    8 bytes per slot. The table has at least twice as many slots as keys,
+    rounded up to a power of two, so between 16 and 32 bytes per key. Two
+    distinct keys sharing a hash is harmless, the second key is dropped and
+    another one is generated in its place.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        size = 1 << max(4, (2 * capacity - 1).bit_length())
+        self._mask = size - 1
+        self._slots = array("Q", bytes(8 * size))
+
+    def add(self, key: str) -> bool:
+        """Adds the hash of a key, returns whether it was not in the set yet."""
+        digest = (hash(key) & 0xFFFFFFFFFFFFFFFF) or 1
+        slots, mask = self._slots, self._mask
+        i = digest & mask
+        while slots[i]:
+            if slots[i] == digest:
+                return False
+            i = (i + 1) & mask
+        slots[i] = digest
+        return True
+
+
+def _issue_chunk(
+    format: KeyFormat,
+    n: int,
+    owner: str,
+    hwid_limit: int,
+    valid_for: timedelta,
+    ip: Optional[str],
+    serialize: Callable[[list[dict]], list[str]],
+    secret: Optional[bytes | str],
+) -> tuple[list[str], list[str]]:
+    """Creates a chunk of keys, returns the key strings and their serialized
+    database records."""
+    keys = Key.create_many(format, n, owner, hwid_limit, valid_for, ip, secret=secret)
+    return [k.key for k in keys], serialize([k.to_database_data() for k in keys])
+
+
+def issue_keys(
+    format: KeyFormat,
+    n: int,
+    sink: Sink,
+    owner: str,
+    hwid_limit: int,
+    valid_for: timedelta,
+    ip: Optional[str] = None,
+    *,
+    secret: Optional[bytes | str] = None,
+    processes: Optional[int] = None,
+    chunk_size: int = 10_000,
+) -> int:
+    """Issues `n` distinct keys and streams their database records to a sink.
+
+    The keys are created in chunks of `chunk_size` across a pool of worker
+    processes. Only a few chunks are in flight at once and every chunk is
+    written as soon as it is done, so memory stays flat no matter how many
+    keys are issued, aside from the 16 bytes per key `_DigestSet` needs to
+    guarantee that no key is issued twice across workers.
+
+    Parameters
+    ----------
+    format :class:`KeyFormat`:
+        The format of the keys to issue.
+
+    n :class:`int`:
+        The amount of keys to issue.
+
+    sink :class:`Sink`:
+        The sink to write the records to, i.e a `JSONLSink` or `CSVSink`.
+
+    secret :class:`bytes | str | None`:
+        The secret to sign the keys with, required if the format is signed.
+        It is handed to the worker processes along with every chunk.
+
+    processes :class:`int | None`:
+        The amount of worker processes, defaults to the amount of cores.
+        With 1 or less, the keys are created in the current process.
+
+    chunk_size :class:`int`:
+        The amount of keys a worker creates at a time.
+
+    Returns
+    -------
+    The amount of records written, which is always `n`.
+    """
+    if n > format.compiled.keyspace:
+        raise ValueError(f"{format} does not allow for {n} distinct keys")
+
+    if format.signature_length and secret is None:
+        raise ValueError("A secret is required to issue signed keys")
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    issued = _DigestSet(n)
+    args = (owner, hwid_limit, valid_for, ip, type(sink).serialize, secret)
+    written = 0
+
+    def write(keys: list[str], lines: list[str]) -> None:
+        nonlocal written
+        fresh = [line for key, line in zip(keys, lines) if issued.add(key)]
+        fresh = fresh[: n - written]
+        sink.write(fresh)
+        written += len(fresh)
+
+    if processes <= 1:
+        while written < n:
+            write(*_issue_chunk(format, min(chunk_size, n - written), *args))
+        return written
+
+    with ProcessPoolExecutor(processes) as pool:
+        in_flight: dict[Future, int] = {}
+        while written < n:
+            requested = sum(in_flight.values())
+            while written + requested < n and len(in_flight) < 2 * processes:
+                size = min(chunk_size, n - written - requested)
+                in_flight[pool.submit(_issue_chunk, format, size, *args)] = size
+                requested += size
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                write(*future.result())
+
+        for future in in_flight:
+            future.cancel()
+    return written
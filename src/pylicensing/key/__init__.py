@@ -1,2 +1,3 @@
+from ._generate import generate_key, generate_keys
 from .format import KeyFormat
 from .key import Key
\ No newline at end of file
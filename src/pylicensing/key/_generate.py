@@ -1,75 +1,180 @@
-import random
-import string
+import os
+import threading
+from datetime import datetime
+from typing import Optional
 
-from .format import KeyFormat
+from ._signing import encode_metadata, sign
+from .format import CompiledFormat, KeyFormat
 
 
-def generate_key(format: KeyFormat) -> str:
-    """Returns a key string given a format.
-
-    Once created, it will be ensured that the key actually includes at least
-    one of each allowed character recursively until it does.
-    """
-    key = format.seperator.join(
-        _generate_section(format) for _ in range(format.sections)
-    )
-    return _add_missing_characters(key, format)
+class _RandomStream:
+    """Buffered access to the operating systems CSPRNG (`os.urandom`).
 
+    Reading a few bytes at a time from `os.urandom` costs a syscall each, so
+    the bytes are pulled in large blocks and handed out from the buffer.
 
-def _generate_section(format: KeyFormat) -> str:
-    """Generates a singular section of a key, the length and allowed
-    characters depend on a passed `KeyFormat`.
+    The buffer is discarded when the process id changes, that way forked
+    worker processes never hand out the same bytes as their parent.
     """
-    mapped = {
-        string.ascii_uppercase: format.uppercase_ascii,
-        string.ascii_lowercase: format.lowercase_ascii,
-        "".join(str(i) for i in range(10)): format.numeric_characters,
-        r"!§$%&/()[]\/+#<>": format.special_characters,
-    }
-    allowed = "".join(k for k, v in mapped.items() if v)
-    return "".join(random.choice(allowed) for _ in range(format.chars_per_section))
-
-
-def _add_missing_characters(key: str, format: KeyFormat) -> str:
-    """Adds missing characters to a key string recursively, until it meets the
-    formats requirements.
 
-    For example, say a format specified to allow numeric characters. By chance,
-    no numeric character was chosen during key creation.
-
-    The key would now not conform to a `KeyFormat` that specifies to allow
-    numeric characters.
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buffer = b""
+        self._pos = 0
+        self._pid = os.getpid()
+
+    def read(self, n: int) -> bytes:
+        """Returns `n` random bytes."""
+        if n >= self.BLOCK_SIZE:
+            return os.urandom(n)
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._buffer, self._pos = b"", 0
+
+            if self._pos + n > len(self._buffer):
+                self._buffer = self._buffer[self._pos :] + os.urandom(self.BLOCK_SIZE)
+                self._pos = 0
+
+            data = self._buffer[self._pos : self._pos + n]
+            self._pos += n
+            return data
+
+    def below(self, n: int) -> int:
+        """Returns a uniformly distributed integer in `[0, n)`."""
+        size = (n.bit_length() + 7) // 8
+        limit = (256**size // n) * n
+        while True:
+            value = int.from_bytes(self.read(size), "little")
+            if value < limit:
+                return value % n
+
+    def choices(self, byte_table: tuple[dict, int], n: int) -> str:
+        """Returns `n` characters drawn using a table built by `format.byte_table`.
+
+        The random bytes are decoded to latin-1, so every byte maps onto the
+        code point of the same value, and then translated. The table maps
+        every byte onto a character or `None`, which drops it.
+        """
+        table, accepted = byte_table
+        parts: list[str] = []
+        missing = n
+        while missing > 0:
+            raw = self.read(missing * 256 // accepted + 16)
+            chunk = raw.decode("latin-1").translate(table)
+            parts.append(chunk)
+            missing -= len(chunk)
+        return "".join(parts)[:n]
+
+
+_random = _RandomStream()
+
+
+def keyspace_size(format: KeyFormat) -> int:
+    """Returns the amount of distinct keys that can be generated for a format."""
+    return format.compiled.keyspace
+
+
+def generate_key(
+    format: KeyFormat,
+    *,
+    secret: Optional[bytes | str] = None,
+    valid_until: Optional[datetime] = None,
+    hwid_limit: int = 0,
+) -> str:
+    """Returns a key string given a format.
 
-    FIXME: Could definitely be improved in terms of lines.
+    See `generate_keys`, this is a batch of one.
     """
-
-    def replace(key: str, index: int, new_char: str) -> str:
-        if key[index] == format.seperator:
-            index += 1
-        return key[:index] + new_char + key[index + 1 :]
-
-    if format.lowercase_ascii and not any(c.islower() for c in key):
-        key = replace(
-            key, random.randrange(len(key)), random.choice(string.ascii_lowercase)
-        )
-        return _add_missing_characters(key, format)
-
-    if format.uppercase_ascii and not any(c.isupper() for c in key):
-        key = replace(
-            key, random.randrange(len(key)), random.choice(string.ascii_uppercase)
-        )
-        return _add_missing_characters(key, format)
-
-    if format.numeric_characters and not any(c.isnumeric() for c in key):
-        key = replace(
-            key,
-            random.randrange(len(key)),
-            random.choice("".join(str(i) for i in range(10))),
-        )
-        return _add_missing_characters(key, format)
-
-    if format.special_characters and not any(c in r"!§$%&/()[]\/+#<>" for c in key):
-        key = replace(
-            key, random.randrange(len(key)), random.choice(r"!§$%&/()[]\/+#<>")
-        )
-    return key
+    return generate_keys(
+        format, 1, secret=secret, valid_until=valid_until, hwid_limit=hwid_limit
+    )[0]
+
+
+def generate_keys(
+    format: KeyFormat,
+    n: int,
+    *,
+    secret: Optional[bytes | str] = None,
+    valid_until: Optional[datetime] = None,
+    hwid_limit: int = 0,
+) -> list[str]:
+    """Returns `n` distinct key strings given a format.
+
+    Every key is drawn from the operating systems CSPRNG. One character of
+    every class the format requires is placed at a random position of the key
+    up front, the rest of the key is drawn from all allowed characters, so
+    the keys always conform to the format without any patching afterwards.
+
+    Keys that came up more than once in the batch are replaced, if the format
+    does not allow for `n` distinct keys a `ValueError` is raised.
+
+    Parameters
+    ----------
+    format :class:`KeyFormat`:
+        The format of the keys to generate.
+
+    n :class:`int`:
+        The amount of keys to generate.
+
+    secret :class:`bytes | str | None`:
+        The secret to sign the keys with, required if the format is signed.
+
+    valid_until :class:`datetime | None`:
+        The expiration date to embed into the keys, required if the format
+        embeds metadata.
+
+    hwid_limit :class:`int`:
+        The HWID limit to embed into the keys, if the format embeds metadata.
+    """
+    compiled = format.compiled
+    if n > compiled.keyspace:
+        raise ValueError(f"{format} does not allow for {n} distinct keys")
+
+    metadata = None
+    if format.signature_length and secret is None:
+        raise ValueError("A secret is required to generate signed keys")
+    if format.embed_metadata:
+        if valid_until is None:
+            raise ValueError("An expiration date is required to embed metadata")
+        metadata = encode_metadata(format, valid_until, hwid_limit)
+
+    cuts = range(0, compiled.chars, format.chars_per_section)
+    seperator = format.seperator
+
+    keys: dict[str, None] = {}
+    while len(keys) < n:
+        parts = _random_parts(compiled, n - len(keys))
+        if secret is not None and format.signature_length:
+            parts = sign(format, parts, secret, metadata)
+
+        for key in parts:
+            sections = [key[c : c + format.chars_per_section] for c in cuts]
+            keys[seperator.join(sections)] = None
+    return list(keys)
+
+
+def _random_parts(compiled: CompiledFormat, n: int) -> list[str]:
+    """Returns the random parts of `n` keys, each containing at least one
+    character of every class the format requires."""
+    length = compiled.random_chars
+    body = _random.choices(compiled.byte_table, n * length)
+    required = [_random.choices(t, n) for t in compiled.class_byte_tables]
+
+    parts = []
+    for i in range(n):
+        chars = list(body[i * length : (i + 1) * length])
+        taken: list[int] = []
+        for drawn in required:
+            pos = _random.below(length - len(taken))
+            for t in taken:
+                if pos >= t:
+                    pos += 1
+            taken.append(pos)
+            taken.sort()
+            chars[pos] = drawn[i]
+        parts.append("".join(chars))
+    return parts
@@ -0,0 +1,117 @@
+import hmac
+from datetime import datetime, timedelta
+from hashlib import sha256
+from typing import Optional
+
+from .format import METADATA_BITS, KeyFormat
+
+METADATA_EPOCH = datetime(2020, 1, 1)
+MAX_HOURS = 2 ** (METADATA_BITS - 8) - 1
+MAX_HWID_LIMIT = 2**8 - 1
+
+
+def _to_chars(value: int, alphabet: str, length: int) -> str:
+    """Encodes an integer as `length` digits in base `len(alphabet)`."""
+    base = len(alphabet)
+    chars = [""] * length
+    for i in range(length - 1, -1, -1):
+        value, digit = divmod(value, base)
+        chars[i] = alphabet[digit]
+    return "".join(chars)
+
+
+def _from_chars(chars: str, alphabet: str) -> int:
+    value = 0
+    for char in chars:
+        value = value * len(alphabet) + alphabet.index(char)
+    return value
+
+
+def encode_metadata(format: KeyFormat, valid_until: datetime, hwid_limit: int) -> str:
+    """Encodes the expiration date and HWID limit of a key into the characters
+    of its format. The expiration date is rounded up to the next full hour,
+    so a key is never considered expired before it actually is.
+
+    Raises a `ValueError` if either does not fit the metadata.
+    """
+    hours = -((METADATA_EPOCH - valid_until) // timedelta(hours=1))
+    if not 0 <= hours <= MAX_HOURS:
+        raise ValueError(f"{valid_until} cannot be embedded into a key")
+    if not 0 <= hwid_limit <= MAX_HWID_LIMIT:
+        raise ValueError(f"HWID limit of {hwid_limit} cannot be embedded into a key")
+
+    value = hours << 8 | hwid_limit
+    return _to_chars(value, format.compiled.alphabet, format.compiled.metadata_chars)
+
+
+def decode_metadata(format: KeyFormat, chars: str) -> tuple[datetime, int]:
+    """Decodes the expiration date and HWID limit encoded by `encode_metadata`."""
+    value = _from_chars(chars, format.compiled.alphabet)
+    return METADATA_EPOCH + timedelta(hours=value >> 8), value & 0xFF
+
+
+def _keyed_mac(format: KeyFormat, secret: bytes | str) -> hmac.HMAC:
+    """Returns the HMAC of a format and secret, already fed with the parts of
+    the message every key of the format shares.
+
+    It is deliberately not cached across calls, that would keep the secrets
+    alive for the lifetime of the process. `sign` reuses it for a batch.
+    """
+    if isinstance(secret, str):
+        secret = secret.encode()
+
+    mac = hmac.new(secret, digestmod=sha256)
+    mac.update(
+        "|".join(
+            (
+                "pylicensing-v1",
+                f"{format.sections}:{format.chars_per_section}:{format.seperator}",
+                format.compiled.alphabet,
+                "",
+            )
+        ).encode()
+    )
+    return mac
+
+
+def signature(format: KeyFormat, payload: str, secret: bytes | str) -> str:
+    """Returns the truncated HMAC-SHA256 of the payload of a key, encoded in the
+    characters of its format.
+
+    The format is part of the signed message, so a key signed for one format
+    does not verify against another.
+    """
+    return _signature(format, _keyed_mac(format, secret), payload)
+
+
+def _signature(format: KeyFormat, keyed: hmac.HMAC, payload: str) -> str:
+    mac = keyed.copy()
+    mac.update(payload.encode())
+
+    alphabet = format.compiled.alphabet
+    length = format.signature_length
+    value = int.from_bytes(mac.digest(), "big") % len(alphabet) ** length
+    return _to_chars(value, alphabet, length)
+
+
+def sign(
+    format: KeyFormat,
+    random_parts: list[str],
+    secret: bytes | str,
+    metadata: Optional[str] = None,
+) -> list[str]:
+    """Appends the metadata and signature to the random part of every key."""
+    metadata = metadata or ""
+    keyed = _keyed_mac(format, secret)
+    return [
+        payload + _signature(format, keyed, payload)
+        for payload in (part + metadata for part in random_parts)
+    ]
+
+
+def split_signed(format: KeyFormat, key: str) -> tuple[str, str, str]:
+    """Splits a signed key into its payload, metadata and signature."""
+    chars = key.replace(format.seperator, "")
+    payload = chars[: -format.signature_length]
+    metadata = payload[len(payload) - format.compiled.metadata_chars :]
+    return payload, metadata, chars[-format.signature_length :]
@@ -1,4 +1,20 @@
+from __future__ import annotations
+
+import re
+import string
 from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import combinations
+
+UPPERCASE = string.ascii_uppercase
+LOWERCASE = string.ascii_lowercase
+NUMERIC = string.digits
+SPECIALS = r"!§$%&/()[]\/+#<>"
+
+LOWER, UPPER, NUMBER, SPECIAL = 1, 2, 4, 8
+
+# bits of the metadata signed keys may carry, hours of validity and HWID limit
+METADATA_BITS = 20 + 8
 
 
 @dataclass(frozen=True)
@@ -15,6 +31,16 @@ class KeyFormat:
 
     If attempting to create a format with no characters allowed, a `ValueError`
     will be raised as it is not possible.
+
+    The lookup tables needed to generate and validate keys of a format are
+    built once, on first use of `compiled`, and then kept on the format.
+
+    A format with a `signature_length` produces signed keys, the last
+    characters of such a key are a truncated HMAC of the others, which allows
+    to reject forged keys offline given the secret they were signed with. With
+    `embed_metadata`, the expiration date and HWID limit of the key are also
+    encoded in the characters before the signature, so they can be read from
+    the key itself. See `validation.verify_signature`.
     """
 
     sections: int
@@ -24,6 +50,8 @@ class KeyFormat:
     uppercase_ascii: bool = field(kw_only=True, default=True)
     numeric_characters: bool = field(kw_only=True, default=False)
     special_characters: bool = field(kw_only=True, default=False)
+    signature_length: int = field(kw_only=True, default=0)
+    embed_metadata: bool = field(kw_only=True, default=False)
 
     def __post_init__(self) -> None:
         if not self.sections:
@@ -38,7 +66,7 @@ class KeyFormat:
         elif (
             self.seperator.isnumeric()
             or self.seperator.isalpha()
-            or self.seperator in r"!§$%&/()[]\/+#<>"
+            or self.seperator in SPECIALS
         ):
             raise ValueError(f"Invalid seperator")
 
@@ -51,3 +79,189 @@ class KeyFormat:
             )
         ):
             raise ValueError("Key format cannot forbid all characters!")
+
+        elif self.signature_length < 0:
+            raise ValueError("Signature length cannot be negative")
+
+        elif self.embed_metadata and not self.signature_length:
+            raise ValueError("Metadata can only be embedded into signed keys")
+
+        elif self.alphabet_size**self.signature_length >= 2**256:
+            raise ValueError("Signature is longer than its HMAC-SHA256 digest")
+
+        elif self.random_length < self.required_classes:
+            raise ValueError(
+                f"Key format requires {self.required_classes} kinds of characters "
+                f"but only has room for {max(self.random_length, 0)}"
+            )
+
+    @property
+    def alphabet_size(self) -> int:
+        """The amount of distinct characters a key of this format can contain."""
+        return (
+            26 * self.lowercase_ascii
+            + 26 * self.uppercase_ascii
+            + 10 * self.numeric_characters
+            + len(set(SPECIALS)) * self.special_characters
+        )
+
+    @property
+    def metadata_length(self) -> int:
+        """The amount of characters the embedded metadata of a key takes up."""
+        if not self.embed_metadata:
+            return 0
+        length = 1
+        while self.alphabet_size**length < 2**METADATA_BITS:
+            length += 1
+        return length
+
+    @property
+    def random_length(self) -> int:
+        """The amount of randomly generated characters in a key of this format."""
+        return (
+            self.sections * self.chars_per_section
+            - self.signature_length
+            - self.metadata_length
+        )
+
+    @property
+    def required_classes(self) -> int:
+        """The amount of character classes every key of this format must contain."""
+        return sum(
+            (
+                self.lowercase_ascii,
+                self.uppercase_ascii,
+                self.numeric_characters,
+                self.special_characters,
+            )
+        )
+
+    @cached_property
+    def compiled(self) -> CompiledFormat:
+        """The `CompiledFormat` of this format, built once and then memoized."""
+        return CompiledFormat(self)
+
+
+class CompiledFormat:
+    """Precomputed lookup tables of a `KeyFormat`.
+
+    Generating and validating keys needs the characters a format allows, the
+    character classes it requires and where its seperators go. Rather than
+    working these out again on every call, they are computed once per format.
+
+    Character classes are expressed as bitmasks (`LOWER`, `UPPER`, `NUMBER`
+    and `SPECIAL`), `class_table` is a `str.translate` table that maps every
+    ASCII character (and the specials) onto the character of its class mask,
+    the seperator is mapped onto the empty mask. Characters outside of the
+    table are classified by `classify`.
+
+    Attributes
+    ----------
+    alphabet :class:`str`:
+        All characters a key of the format may be generated from.
+
+    charsets :class:`tuple[str, ...]`:
+        The characters of every class the format requires, in class order.
+
+    byte_table :class:`tuple[dict, int]`:
+        Maps a random byte onto a character of the `alphabet`, see `byte_table`.
+
+    class_byte_tables :class:`tuple[tuple[dict, int], ...]`:
+        The byte table of every charset in `charsets`.
+
+    allowed :class:`int`:
+        The mask of all classes the format allows, and thus also requires.
+
+    length :class:`int`:
+        The total length of a key, including its seperators.
+
+    seperator_positions :class:`tuple[int, ...]`:
+        The indices of the seperators within a key.
+
+    structure :class:`re.Pattern`:
+        Matches any string made up of the sections of the format, regardless
+        of the characters within the sections.
+
+    chars :class:`int`:
+        The amount of characters of a key, not counting its seperators.
+
+    random_chars :class:`int`:
+        The amount of random characters of a key, those not taken up by the
+        embedded metadata or signature of signed keys.
+
+    metadata_chars :class:`int`:
+        The amount of characters of the metadata embedded into a signed key.
+
+    keyspace :class:`int`:
+        The amount of distinct random parts of a key. A valid key contains at
+        least one character of every class, so keys missing any are excluded.
+    """
+
+    def __init__(self, format: KeyFormat) -> None:
+        self.format = format
+        classes = (
+            (UPPER, UPPERCASE, format.uppercase_ascii),
+            (LOWER, LOWERCASE, format.lowercase_ascii),
+            (NUMBER, NUMERIC, format.numeric_characters),
+            (SPECIAL, "".join(dict.fromkeys(SPECIALS)), format.special_characters),
+        )
+        self.charsets = tuple(chars for _, chars, allowed in classes if allowed)
+        self.alphabet = "".join(self.charsets)
+        self.byte_table = byte_table(self.alphabet)
+        self.class_byte_tables = tuple(byte_table(chars) for chars in self.charsets)
+        self.allowed = sum(mask for mask, _, allowed in classes if allowed)
+
+        self.chars = format.sections * format.chars_per_section
+        self.random_chars = format.random_length
+        self.metadata_chars = format.metadata_length
+        self.length = self.chars + format.sections - 1
+        self.seperator_positions = tuple(
+            (format.chars_per_section + 1) * i - 1 for i in range(1, format.sections)
+        )
+        section = f"[^{re.escape(format.seperator)}]{{{format.chars_per_section}}}"
+        self.structure = re.compile(
+            f"{section}(?:{re.escape(format.seperator)}{section})"
+            f"{{{format.sections - 1}}}"
+        )
+
+        self.keyspace = sum(
+            (-1) ** missing
+            * (len(self.alphabet) - len("".join(excluded))) ** self.random_chars
+            for missing in range(len(self.charsets) + 1)
+            for excluded in combinations(self.charsets, missing)
+        )
+
+        self.class_table = {code: chr(classify(chr(code))) for code in range(128)}
+        self.class_table.update({ord(c): chr(SPECIAL) for c in SPECIALS})
+        self.class_table[ord(format.seperator)] = chr(0)
+
+    def classes(self, chars: str) -> str:
+        """Translates every character to the character of its class mask."""
+        codes = chars.translate(self.class_table)
+        if codes.isascii():
+            return codes
+        return "".join(c if c.isascii() else chr(classify(c)) for c in codes)
+
+
+def classify(char: str) -> int:
+    """Returns the class mask of a single character."""
+    return (
+        (LOWER if char.islower() else 0)
+        | (UPPER if char.isupper() else 0)
+        | (NUMBER if char.isnumeric() else 0)
+        | (SPECIAL if char in SPECIALS else 0)
+    )
+
+
+def byte_table(alphabet: str) -> tuple[dict, int]:
+    """Builds the table mapping a random byte onto a character of the alphabet,
+    along with the amount of bytes that are accepted by the table.
+
+    Bytes that would introduce modulo bias are mapped to `None`, which drops
+    them when the table is used with `str.translate`.
+    """
+    limit = 256 - 256 % len(alphabet)
+    table = {
+        b: alphabet[b % len(alphabet)] if b < limit else None for b in range(256)
+    }
+    return table, limit
@@ -6,11 +6,14 @@ from typing import Optional
 
 from bson.objectid import ObjectId
 
-from ._generate import generate_key
+from ._generate import generate_key, generate_keys
 from .format import KeyFormat
 
+# the fields stored in the database, whose changes a `Key` keeps track of
+FIELDS = ("key", "owner", "hwid_limit", "created", "valid_until", "hwids", "ip")
 
-@dataclass
+
+@dataclass(slots=True)
 class Key:
     """Key information container.
 
@@ -28,6 +31,14 @@ class Key:
 
     A `key` object is hashable, because the key is not expected to change during
     it's lifetime, thus they are hashed by key.
+
+    Once a key has been loaded from or saved to the database, it keeps track of
+    the fields that changed since, see `dirty_fields`. This lets `KeyManager`
+    write only what changed when updating it.
+
+    Keys are slotted, they carry no per-instance `__dict__`, which keeps
+    loading large amounts of them from the database cheap in memory. Keys
+    loaded from documents are built through `from_document`.
     """
 
     key: str
@@ -38,6 +49,46 @@ class Key:
     hwids: list = field(default_factory=list)
     ip: Optional[str] = None
     _id: ObjectId | None = None
+    _saved: Optional[tuple] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        # documents written by older versions store the dates as ISO strings
+        if isinstance(self.created, str):
+            self.created = datetime.fromisoformat(self.created)
+        if isinstance(self.valid_until, str):
+            self.valid_until = datetime.fromisoformat(self.valid_until)
+
+    @classmethod
+    def from_document(cls, document: dict) -> Key:
+        """Returns the `Key` stored in a document, as it is read from the
+        database, marked as saved.
+
+        The fields are assigned directly instead of being passed through
+        `__init__`, and the dates are only parsed if the document stores them
+        as ISO strings. The HWIDs list of the document is taken over, not
+        copied, so the document should not be modified afterwards.
+        """
+        key = cls.__new__(cls)
+        key.key = document["key"]
+        key.owner = document["owner"]
+        key.hwid_limit = document["hwid_limit"]
+        created = document["created"]
+        key.created = (
+            datetime.fromisoformat(created) if isinstance(created, str) else created
+        )
+        valid_until = document["valid_until"]
+        key.valid_until = (
+            datetime.fromisoformat(valid_until)
+            if isinstance(valid_until, str)
+            else valid_until
+        )
+        key.hwids = document.get("hwids", [])
+        key.ip = document.get("ip")
+        key._id = document.get("_id")
+        key._saved = key._snapshot()
+        return key
 
     @classmethod
     def create(
@@ -46,34 +97,107 @@ class Key:
         owner: str,
         hwid_limit: int,
         valid_for: timedelta,
-        ip: Optional[str] = None
+        ip: Optional[str] = None,
+        *,
+        secret: Optional[bytes | str] = None,
     ) -> Key:
         """Returns a `Key` created from a `KeyFormat` and other details.\n
         The key will be randomly generated using said format during creation.
+
+        If the format is signed, the `secret` to sign the key with must be given.
         """
+        valid_until = (datetime.now() + valid_for).replace(microsecond=0)
         return cls(
-            generate_key(format),
+            generate_key(
+                format, secret=secret, valid_until=valid_until, hwid_limit=hwid_limit
+            ),
             owner,
             hwid_limit,
             created=datetime.now().replace(microsecond=0),
-            valid_until=(datetime.now() + valid_for).replace(microsecond=0),
+            valid_until=valid_until,
             ip=ip
         )
 
+    @classmethod
+    def create_many(
+        cls,
+        format: KeyFormat,
+        n: int,
+        owner: str,
+        hwid_limit: int,
+        valid_for: timedelta,
+        ip: Optional[str] = None,
+        *,
+        secret: Optional[bytes | str] = None,
+    ) -> list[Key]:
+        """Returns `n` distinct `Key`s created from a `KeyFormat` and other details.\n
+        The keys are generated as a single batch, see `generate_keys`.
+        """
+        created = datetime.now().replace(microsecond=0)
+        valid_until = (datetime.now() + valid_for).replace(microsecond=0)
+        keys = generate_keys(
+            format, n, secret=secret, valid_until=valid_until, hwid_limit=hwid_limit
+        )
+        return [cls(key, owner, hwid_limit, created, valid_until, ip=ip) for key in keys]
+
     @property
     def expired(self) -> bool:
         return datetime.now() >= self.valid_until
 
+    @property
+    def dirty_fields(self) -> set[str]:
+        """The fields that changed since the key was loaded from or last saved to
+        the database. All fields are dirty if the key has never been either."""
+        if self._saved is None:
+            return set(FIELDS)
+        return {
+            name
+            for name, current, saved in zip(FIELDS, self._snapshot(), self._saved)
+            if current != saved
+        }
+
+    @property
+    def saved_state(self) -> Optional[dict]:
+        """The fields of the key as they were when it was last loaded or saved,
+        `None` if it never was."""
+        if self._saved is None:
+            return None
+        saved = dict(zip(FIELDS, self._saved))
+        saved["hwids"] = list(saved["hwids"])
+        return saved
+
+    def _snapshot(self) -> tuple:
+        # a tuple in the order of FIELDS is far smaller than a dict, and the
+        # HWIDs are frozen so later changes to the list do not leak into it
+        return (
+            self.key,
+            self.owner,
+            self.hwid_limit,
+            self.created,
+            self.valid_until,
+            tuple(self.hwids),
+            self.ip,
+        )
+
+    def mark_saved(self) -> None:
+        """Records the current fields of the key as the ones in the database,
+        clearing its dirty fields."""
+        self._saved = self._snapshot()
+
     def to_database_data(self) -> dict:
         """Turns a `Key` into the data that is valuable for the database.
 
-        For this, the `__dict__` of the `Key` is copied and the `_id` is popped
-        off, since mongodb sets its own `_id`.
+        The document is built from the fields directly, leaving out the `_id`,
+        since mongodb sets its own `_id`. The dates are kept as `datetime`
+        objects, which are stored as native dates so they can be queried by
+        range and indexed. The HWIDs list is shared with the key, not copied.
         """
-        data = self.__dict__.copy()
-        data.pop("_id")
-
-        data["created"] = data["created"].isoformat()
-        data["valid_until"] = data["valid_until"].isoformat()
-
-        return data
+        return {
+            "key": self.key,
+            "owner": self.owner,
+            "hwid_limit": self.hwid_limit,
+            "created": self.created,
+            "valid_until": self.valid_until,
+            "hwids": self.hwids,
+            "ip": self.ip,
+        }
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from .database import KeyManager
+from .key import Key, KeyFormat
+from .validation import check_format
+
+
+@dataclass(frozen=True)
+class RegisteredFormat:
+    """A `KeyFormat` in a `FormatRegistry`, along with the `KeyManager` of the
+    collection its keys are stored in, if any."""
+
+    format: KeyFormat
+    manager: Optional[KeyManager] = None
+    name: Optional[str] = None
+
+
+class FormatRegistry:
+    """Resolves a key to the `KeyFormat` it belongs to, out of many formats.
+
+    The formats are indexed by their shape: the length of their keys, their
+    seperator and the positions of the seperators. Resolving a key looks up
+    its shape, so only the formats of that exact shape are checked against
+    it. Keys whose length matches no format are rejected right away.
+
+    Formats of the same shape can still be told apart by their characters,
+    at the cost of checking the key against each of them.
+    """
+
+    def __init__(self) -> None:
+        # key length -> seperator -> seperator positions -> formats
+        self._shapes: dict[int, dict[str, dict[tuple, list[RegisteredFormat]]]] = {}
+        self._entries: list[RegisteredFormat] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[RegisteredFormat]:
+        return iter(self._entries)
+
+    def register(
+        self,
+        format: KeyFormat,
+        manager: Optional[KeyManager] = None,
+        *,
+        name: Optional[str] = None,
+    ) -> RegisteredFormat:
+        """Registers a `KeyFormat`, optionally with the `KeyManager` its keys are
+        managed by. Raises a `ValueError` if the format is already registered."""
+        if any(entry.format == format for entry in self._entries):
+            raise ValueError(f"{format} is already registered")
+
+        entry = RegisteredFormat(format, manager, name)
+        compiled = format.compiled
+        seperators = self._shapes.setdefault(compiled.length, {})
+        positions = seperators.setdefault(format.seperator, {})
+        positions.setdefault(compiled.seperator_positions, []).append(entry)
+        self._entries.append(entry)
+        return entry
+
+    def candidates(self, key: Key | str) -> list[RegisteredFormat]:
+        """Returns the registered formats whose shape matches the key, without
+        looking at its characters."""
+        if isinstance(key, Key):
+            key = key.key
+
+        seperators = self._shapes.get(len(key))
+        if not seperators:
+            return []
+
+        # formats with different seperators can share the positions, e.g. any
+        # single section formats of the same length
+        found: list[RegisteredFormat] = []
+        buckets = 0
+        for seperator, shapes in seperators.items():
+            positions = []
+            pos = key.find(seperator)
+            while pos != -1:
+                positions.append(pos)
+                pos = key.find(seperator, pos + 1)
+
+            entries = shapes.get(tuple(positions))
+            if entries:
+                found.extend(entries)
+                buckets += 1
+        if buckets > 1:
+            found.sort(key=self._entries.index)
+        return found
+
+    def resolve(self, key: Key | str) -> Optional[RegisteredFormat]:
+        """Returns the registered format a key conforms to, `None` if there is
+        none. If the key conforms to several, the first registered one wins."""
+        for entry in self.candidates(key):
+            if check_format(key, entry.format):
+                return entry
+        return None
+
+    def format_for(self, key: Key | str) -> Optional[KeyFormat]:
+        """Returns the `KeyFormat` a key conforms to, `None` if there is none."""
+        entry = self.resolve(key)
+        return entry.format if entry else None
+
+    def manager_for(self, key: Key | str) -> Optional[KeyManager]:
+        """Returns the `KeyManager` of the format a key conforms to, `None` if the
+        key conforms to no format or its format has no manager."""
+        entry = self.resolve(key)
+        return entry.manager if entry else None
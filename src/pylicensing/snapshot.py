@@ -0,0 +1,298 @@
+"""Binary snapshots of a key collection, for lookups without a database.
+
+Edge nodes and air-gapped installs that can not reach the database can still
+tell whether a key exists and when it expires from a snapshot, written with
+`KeyManager.export_snapshot` (or `write_snapshot`) and shipped to them:
+
+    manager.export_snapshot("keys.snapshot", format=KEY_FORMAT)
+    ...
+    with Snapshot("keys.snapshot") as snapshot:
+        entry = snapshot.get(key)
+        if entry is None or entry.expired:
+            ...
+
+A snapshot is a header followed by one fixed-width record per key, sorted by
+key. The header holds the `KeyFormat` of the keys, if given, as JSON. Each
+record holds the key, padded with null bytes to the width of the longest
+key, its expiration date in milliseconds since the epoch, its HWID limit, the
+amount of registered HWIDs and a digest of them, see `hwid_digest`.
+
+`Snapshot` maps the file into memory rather than reading it, so opening a
+snapshot takes the same time no matter its size, and processes opening the
+same snapshot share its pages. Lookups binary search the records in the map,
+comparing only the key bytes of the records they visit.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from .exceptions import InvalidSnapshotError
+from .export import NAT, milliseconds
+from .key import KeyFormat
+
+MAGIC = b"PYLKSNAP"
+VERSION = 1
+
+# magic, version, record width, key width, record count, format length
+_HEADER = struct.Struct("<8sHHHQI")
+# valid until, hwid limit, hwid count, hwid digest, following the key bytes
+_FIELDS = struct.Struct("<qII8s")
+
+# the largest HWID limit the unsigned field holds
+_MAX_HWID_LIMIT = 2**32 - 1
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def hwid_digest(hwids: Iterable[str]) -> bytes:
+    """Returns the 8 byte digest of a set of HWIDs stored in a snapshot, which
+    does not depend on the order of the HWIDs."""
+    digest = hashlib.blake2b(digest_size=8)
+    for hwid in sorted(set(hwids)):
+        digest.update(hwid.encode())
+        digest.update(b"\0")
+    return digest.digest()
+
+
+@dataclass(frozen=True)
+class SnapshotEntry:
+    """A key as it is stored in a snapshot.
+
+    Parameters
+    ----------
+    key :class:`str`:
+        The key-string.
+
+    valid_until :class:`datetime | None`:
+        The expiration date of the key, `None` if the key has none.
+
+    hwid_limit :class:`int`:
+        The amount of HWIDs the key may be registered on.
+
+    hwid_count :class:`int`:
+        The amount of HWIDs the key was registered on.
+
+    hwid_digest :class:`bytes`:
+        The digest of the registered HWIDs, see `hwid_digest`.
+    """
+
+    key: str
+    valid_until: Optional[datetime]
+    hwid_limit: int
+    hwid_count: int
+    hwid_digest: bytes
+
+    @property
+    def expired(self) -> bool:
+        return self.valid_until is not None and datetime.now() >= self.valid_until
+
+    def hwids_match(self, hwids: Iterable[str]) -> bool:
+        """Returns whether the key was registered on exactly these HWIDs."""
+        return hwid_digest(hwids) == self.hwid_digest
+
+
+def write_snapshot(
+    path: str | os.PathLike,
+    documents: Iterable[dict],
+    format: Optional[KeyFormat] = None,
+) -> int:
+    """Writes key documents to a snapshot file, returns the amount of keys.
+
+    The documents need the `key`, `valid_until`, `hwid_limit` and `hwids`
+    fields. They are sorted in memory, so documents can be passed in any
+    order. The snapshot is written to a temporary file next to `path` and
+    then moved in place, so readers that still have the previous snapshot
+    open are not affected, and concurrent writers do not interleave.
+
+    Raises
+    ------
+    `ValueError`
+        If the HWID limit of a key is negative or does not fit the snapshot
+    """
+    records = []
+    for document in documents:
+        hwids = document.get("hwids") or ()
+        hwid_limit = document.get("hwid_limit") or 0
+        if not 0 <= hwid_limit <= _MAX_HWID_LIMIT:
+            raise ValueError(
+                f"The HWID limit of {document['key']} must be between 0 and "
+                f"{_MAX_HWID_LIMIT}, not {hwid_limit}"
+            )
+        fields = _FIELDS.pack(
+            milliseconds(document.get("valid_until")),
+            hwid_limit,
+            len(hwids),
+            hwid_digest(hwids),
+        )
+        records.append((document["key"].encode(), fields))
+    records.sort()
+
+    key_width = max((len(key) for key, _ in records), default=0)
+    metadata = json.dumps(asdict(format) if format is not None else None).encode()
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        key_width + _FIELDS.size,
+        key_width,
+        len(records),
+        len(metadata),
+    )
+
+    path = os.fspath(path)
+    temporary = None
+    try:
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path) or ".",
+            prefix=f"{os.path.basename(path)}.",
+            suffix=".tmp",
+            delete=False,
+        ) as f:
+            temporary = f.name
+            f.write(header + metadata)
+            for key, fields in records:
+                f.write(key.ljust(key_width, b"\0") + fields)
+        os.replace(temporary, path)
+    except BaseException:
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return len(records)
+
+
+def _key_struct(key_width: int) -> struct.Struct:
+    """The key bytes of a record as big-endian integers, 8 bytes at a time and
+    the rest byte by byte. The tuples unpacked with it order like the bytes,
+    and are read straight from the map rather than copying the bytes out."""
+    return struct.Struct(f">{key_width // 8}Q{key_width % 8}B")
+
+
+class Snapshot:
+    """A key snapshot, opened for lookups.
+
+    The file is memory-mapped read-only, only the pages of the records a
+    lookup visits are read from disk, nothing is loaded up front. Call
+    `close`, or use the snapshot as a context manager, to unmap it.
+
+    Parameters
+    ----------
+    path :class:`str | os.PathLike`:
+        The path of the snapshot file.
+
+    Raises
+    ------
+    `InvalidSnapshotError`
+        If the file is not a snapshot, or one written by a newer version
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise InvalidSnapshotError(f"{path} is empty") from None
+
+        self._view = memoryview(self._map)
+        try:
+            self._open(path)
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self, path: str | os.PathLike) -> None:
+        if len(self._map) < _HEADER.size:
+            raise InvalidSnapshotError(f"{path} is not a key snapshot")
+
+        magic, version, width, key_width, count, length = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise InvalidSnapshotError(f"{path} is not a key snapshot")
+        if version > VERSION:
+            raise InvalidSnapshotError(
+                f"{path} is a version {version} snapshot, only up to "
+                f"version {VERSION} is supported"
+            )
+
+        self._width = width
+        self._key_width = key_width
+        self._count = count
+        self._start = _HEADER.size + length
+        if len(self._map) < self._start + width * count:
+            raise InvalidSnapshotError(f"{path} is truncated")
+
+        metadata = json.loads(bytes(self._view[_HEADER.size : self._start]))
+        self.format: Optional[KeyFormat] = (
+            KeyFormat(**metadata) if metadata is not None else None
+        )
+        self._key = _key_struct(key_width)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._find(key) is not None
+
+    def __iter__(self) -> Iterator[SnapshotEntry]:
+        """Iterates over the entries in the order of their keys."""
+        for index in range(self._count):
+            yield self._entry(index)
+
+    def _find(self, key: str) -> Optional[int]:
+        encoded = key.encode()
+        if len(encoded) > self._key_width:
+            return None
+
+        target = self._key.unpack(encoded.ljust(self._key_width, b"\0"))
+        unpack_from, view = self._key.unpack_from, self._view
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            found = unpack_from(view, self._start + middle * self._width)
+            if found < target:
+                low = middle + 1
+            elif found > target:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _entry(self, index: int) -> SnapshotEntry:
+        offset = self._start + index * self._width
+        key = str(self._view[offset : offset + self._key_width], "utf-8")
+        key = key.rstrip("\0")
+        valid_until, hwid_limit, hwid_count, digest = _FIELDS.unpack_from(
+            self._view, offset + self._key_width
+        )
+        return SnapshotEntry(
+            key,
+            (
+                None
+                if valid_until == NAT
+                else _EPOCH + timedelta(milliseconds=valid_until)
+            ),
+            hwid_limit,
+            hwid_count,
+            digest,
+        )
+
+    def get(self, key: str) -> Optional[SnapshotEntry]:
+        """Returns the entry of a key, `None` if it is not in the snapshot."""
+        index = self._find(key)
+        return None if index is None else self._entry(index)
+
+    def close(self) -> None:
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
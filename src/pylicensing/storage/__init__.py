@@ -0,0 +1,16 @@
+"""Storage backends for `KeyManager`.
+
+`KeyManager` works with anything shaped like a pymongo `Collection`, as
+described by `KeyStorage`. Besides MongoDB itself, two local backends are
+provided, which understand the subset of the MongoDB query language the
+manager uses:
+
+- `MemoryCollection` keeps the keys in memory, for tests, benchmarks and
+  single-process deployments that do not need them to persist.
+- `SQLiteCollection` keeps the keys in a SQLite database file, for
+  deployments that want them to persist without running a MongoDB server.
+"""
+
+from .memory import MemoryCollection
+from .protocol import KeyStorage
+from .sqlite import SQLiteCollection
@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import threading
+from abc import ABC, abstractmethod
+from contextlib import AbstractContextManager
+from itertools import islice
+from typing import Any, Iterable, Iterator, Optional
+
+from bson.objectid import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+from ._cursor import Cursor
+from ._query import apply_update, normalize_sort, project
+
+DUPLICATE_KEY_ERROR = 11000
+IMMUTABLE_FIELD_ERROR = 66
+
+
+def index_fields(keys: str | list) -> list[tuple[str, int]]:
+    """Turns the keys of `create_index` into a list of field directions."""
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return [(field, direction) for field, direction in keys]
+
+
+def index_name(fields: list[tuple[str, int]]) -> str:
+    """The name MongoDB gives an index on the fields by default."""
+    return "_".join(f"{field}_{direction}" for field, direction in fields)
+
+
+class LocalCollection(ABC):
+    """The operations of a pymongo `Collection` shared by the local storage
+    backends, built on a handful of primitives each backend implements.
+
+    Every write runs inside `_transaction`, so it is atomic and safe to call
+    from many threads. A write failing on a unique index leaves the documents
+    it already wrote in place, like it would on MongoDB.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.RLock()
+
+    # primitives implemented by the backends
+
+    @abstractmethod
+    def _transaction(self) -> AbstractContextManager: ...
+
+    @abstractmethod
+    def _select(
+        self, filter: Optional[dict], sort: list[tuple[str, int]], batch_size: int
+    ) -> Iterator[dict]:
+        """Yields copies of the documents matching the filter, in order."""
+
+    @abstractmethod
+    def _insert(self, document: dict) -> None:
+        """Inserts a document, raising `DuplicateKeyError` on a unique index."""
+
+    @abstractmethod
+    def _replace(self, document: dict) -> None:
+        """Replaces the document of the same `_id`, raising `DuplicateKeyError`
+        on a unique index."""
+
+    @abstractmethod
+    def _delete(self, _id: Any) -> None: ...
+
+    @abstractmethod
+    def create_index(self, keys: str | list, *, unique: bool = False, **_) -> str: ...
+
+    @abstractmethod
+    def index_information(self) -> dict[str, dict]: ...
+
+    @abstractmethod
+    def drop(self) -> None: ...
+
+    # the pymongo collection interface
+
+    def insert_one(self, document: dict, **_) -> InsertOneResult:
+        document.setdefault("_id", ObjectId())
+        with self._transaction():
+            self._insert(document)
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(
+        self, documents: Iterable[dict], ordered: bool = True, **_
+    ) -> InsertManyResult:
+        documents = list(documents)
+        errors = []
+        with self._transaction():
+            for i, document in enumerate(documents):
+                document.setdefault("_id", ObjectId())
+                try:
+                    self._insert(document)
+                except DuplicateKeyError as e:
+                    errors.append(_write_error(i, e, document))
+                    if ordered:
+                        break
+
+        if errors:
+            attempted = errors[-1]["index"] + 1 if ordered else len(documents)
+            inserted = attempted - len(errors)
+            raise BulkWriteError(_bulk_result(errors, nInserted=inserted))
+        return InsertManyResult([document["_id"] for document in documents], True)
+
+    def find(
+        self,
+        filter: Optional[dict] = None,
+        projection: Optional[Any] = None,
+        *,
+        sort: Optional[Any] = None,
+        skip: int = 0,
+        limit: int = 0,
+        batch_size: int = 1000,
+        **_,
+    ) -> Cursor:
+        filter = _as_filter(filter)
+        cursor = Cursor(lambda s, b: self._select(filter, s, b), projection)
+        if sort is not None:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit).batch_size(batch_size)
+
+    def find_one(
+        self, filter: Optional[Any] = None, projection: Optional[Any] = None, **kwargs
+    ) -> Optional[dict]:
+        kwargs.pop("limit", None)
+        return next(self.find(filter, projection, limit=1, **kwargs), None)
+
+    def count_documents(
+        self, filter: dict, *, skip: int = 0, limit: int = 0, **_
+    ) -> int:
+        documents = self._select(filter, [], 1000)
+        return sum(1 for _ in islice(documents, skip, skip + limit if limit else None))
+
+    def estimated_document_count(self, **_) -> int:
+        return self.count_documents({})
+
+    def delete_one(self, filter: dict, **_) -> DeleteResult:
+        return self._delete_matching(filter, 1)
+
+    def delete_many(self, filter: dict, **_) -> DeleteResult:
+        return self._delete_matching(filter, None)
+
+    def update_one(
+        self, filter: dict, update: dict | list, upsert: bool = False, **_
+    ) -> UpdateResult:
+        return self._update_matching(filter, update, upsert, 1)
+
+    def update_many(
+        self, filter: dict, update: dict | list, upsert: bool = False, **_
+    ) -> UpdateResult:
+        return self._update_matching(filter, update, upsert, None)
+
+    def replace_one(
+        self, filter: dict, replacement: dict, upsert: bool = False, **_
+    ) -> UpdateResult:
+        if any(field.startswith("$") for field in replacement):
+            raise ValueError("replacement can not include $ operators")
+        return self._update_matching(filter, replacement, upsert, 1, replace=True)
+
+    def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict | list,
+        projection: Optional[Any] = None,
+        sort: Optional[Any] = None,
+        upsert: bool = False,
+        return_document: bool = False,
+        **_,
+    ) -> Optional[dict]:
+        order = normalize_sort(sort) if sort is not None else []
+        with self._transaction():
+            before = next(self._select(filter, order, 1), None)
+            if before is None:
+                if not upsert:
+                    return None
+                after = self._upsert(filter, update)
+                return project(after, projection) if return_document else None
+
+            after = self._apply(before, update)
+            if after != before:
+                self._replace(after)
+        return project(after if return_document else before, projection)
+
+    def find_one_and_delete(
+        self, filter: dict, projection: Optional[Any] = None, **_
+    ) -> Optional[dict]:
+        with self._transaction():
+            document = next(self._select(filter, [], 1), None)
+            if document is not None:
+                self._delete(document["_id"])
+        return None if document is None else project(document, projection)
+
+    def bulk_write(self, requests: Iterable[Any], ordered: bool = True, **_):
+        """Runs a batch of pymongo write operations, `InsertOne`, `UpdateOne`,
+        `UpdateMany`, `ReplaceOne`, `DeleteOne` and `DeleteMany`, in order."""
+        counts = dict(nInserted=0, nUpserted=0, nMatched=0, nModified=0, nRemoved=0)
+        upserted, errors = [], []
+        with self._transaction():
+            for i, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self.insert_one(request._doc)
+                        counts["nInserted"] += 1
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        limit = 1 if isinstance(request, DeleteOne) else None
+                        result = self._delete_matching(request._filter, limit)
+                        counts["nRemoved"] += result.deleted_count
+                    elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                        result = self._update_matching(
+                            request._filter,
+                            request._doc,
+                            bool(request._upsert),
+                            None if isinstance(request, UpdateMany) else 1,
+                            replace=isinstance(request, ReplaceOne),
+                        )
+                        counts["nMatched"] += result.matched_count
+                        counts["nModified"] += result.modified_count
+                        if result.upserted_id is not None:
+                            counts["nUpserted"] += 1
+                            upserted.append({"index": i, "_id": result.upserted_id})
+                    else:
+                        raise TypeError(f"{request!r} is not a valid request")
+                except DuplicateKeyError as e:
+                    errors.append(_write_error(i, e, getattr(request, "_doc", None)))
+                    if ordered:
+                        break
+
+        raw = _bulk_result(errors, upserted=upserted, **counts)
+        if errors:
+            raise BulkWriteError(raw)
+        return BulkWriteResult(raw, True)
+
+    # helpers
+
+    def _delete_matching(self, filter: dict, limit: Optional[int]) -> DeleteResult:
+        with self._transaction():
+            documents = list(islice(self._select(filter, [], 1000), limit))
+            for document in documents:
+                self._delete(document["_id"])
+        return DeleteResult({"n": len(documents), "ok": 1.0}, True)
+
+    def _update_matching(
+        self,
+        filter: dict,
+        update: dict | list,
+        upsert: bool,
+        limit: Optional[int],
+        *,
+        replace: bool = False,
+    ) -> UpdateResult:
+        with self._transaction():
+            documents = list(islice(self._select(filter, [], 1000), limit))
+            if not documents and upsert:
+                _id = self._upsert(filter, update, replace=replace)["_id"]
+                return UpdateResult({"n": 1, "nModified": 0, "upserted": _id}, True)
+
+            modified = 0
+            for document in documents:
+                if replace:
+                    updated = {"_id": document["_id"], **update}
+                else:
+                    updated = self._apply(document, update)
+                if updated != document:
+                    self._replace(updated)
+                    modified += 1
+        return UpdateResult({"n": len(documents), "nModified": modified}, True)
+
+    def _apply(self, document: dict, update: dict | list) -> dict:
+        updated = apply_update(document, update)
+        if updated.get("_id") != document["_id"]:
+            raise WriteError(
+                "Performing an update on the path '_id' would modify the "
+                "immutable field '_id'",
+                IMMUTABLE_FIELD_ERROR,
+            )
+        return updated
+
+    def _upsert(self, filter: dict, update: dict | list, replace: bool = False) -> dict:
+        seed = {
+            field: value
+            for field, value in filter.items()
+            if not field.startswith("$")
+            and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        document = {**seed, **update} if replace else apply_update(seed, update)
+        document.setdefault("_id", ObjectId())
+        self._insert(document)
+        return document
+
+
+def _as_filter(filter: Optional[Any]) -> Optional[dict]:
+    if filter is None or isinstance(filter, dict):
+        return filter
+    return {"_id": filter}
+
+
+def _write_error(index: int, error: DuplicateKeyError, document: Any) -> dict:
+    return {
+        "index": index,
+        "code": DUPLICATE_KEY_ERROR,
+        "errmsg": str(error),
+        "op": document,
+    }
+
+
+def _bulk_result(errors: list, *, upserted: Optional[list] = None, **counts) -> dict:
+    return {
+        "writeErrors": errors,
+        "writeConcernErrors": [],
+        "nInserted": 0,
+        "nUpserted": 0,
+        "nMatched": 0,
+        "nModified": 0,
+        "nRemoved": 0,
+        "upserted": upserted or [],
+        **counts,
+    }
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import Any, Callable, Iterator, Optional
+
+from ._query import normalize_sort, projector
+
+# (sort, batch size) -> the matching documents in order
+Source = Callable[[list[tuple[str, int]], int], Iterator[dict]]
+
+
+class Cursor:
+    """The result of `find` on a local storage backend.
+
+    Like a pymongo `Cursor`, the query only runs once the cursor is iterated,
+    until then it can be refined with `sort`, `skip`, `limit` and
+    `batch_size`, each of which returns the cursor itself.
+    """
+
+    def __init__(self, source: Source, projection: Optional[Any] = None) -> None:
+        self._source = source
+        self._projection = projection
+        self._sort: list[tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._batch_size = 1000
+        self._iterator: Optional[Iterator[dict]] = None
+
+    def _check_unused(self) -> None:
+        if self._iterator is not None:
+            raise RuntimeError("Cannot refine a cursor that is already iterated")
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> Cursor:
+        self._check_unused()
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> Cursor:
+        self._check_unused()
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> Cursor:
+        self._check_unused()
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int) -> Cursor:
+        self._check_unused()
+        self._batch_size = max(batch_size, 1)
+        return self
+
+    def __iter__(self) -> Cursor:
+        return self
+
+    def __next__(self) -> dict:
+        if self._iterator is None:
+            documents = self._source(self._sort, self._batch_size)
+            stop = self._skip + self._limit if self._limit else None
+            documents = islice(documents, self._skip, stop)
+            self._iterator = map(projector(self._projection), documents)
+        return next(self._iterator)
+
+    def close(self) -> None:
+        self._iterator = iter(())
+
+    def __enter__(self) -> Cursor:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
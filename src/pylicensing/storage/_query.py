@@ -0,0 +1,324 @@
+"""The subset of the MongoDB query language the local storage backends support.
+
+Filters, update documents, update pipelines, projections and sorts are
+evaluated against plain `dict` documents, following the semantics of
+MongoDB closely enough for everything `KeyManager` sends. Only the operators
+the manager issues are supported, anything else raises `NotImplementedError`.
+Only top-level fields are supported, dotted paths are not.
+
+Supported filter operators: equality, `$gt`, `$gte`, `$lt`, `$lte`, `$in`,
+`$type` and `$or`.
+
+Supported update operators: `$set` and `$addToSet`, or a pipeline of `$set`
+stages.
+
+Supported expression operators: `$and`, `$not`, `$gt`, `$gte`, `$lt`, `$lte`,
+`$cond`, `$in`, `$size`, `$concatArrays`, `$add` and `$toDate`.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from functools import cmp_to_key
+from typing import Any, Callable, Iterable, Optional
+
+from bson.objectid import ObjectId
+
+MISSING = object()
+
+# the order MongoDB sorts and compares values of different types in
+_TYPE_ORDER: list[tuple[type | tuple[type, ...], int, str]] = [
+    (type(None), 1, "null"),
+    ((int, float), 2, "number"),
+    (str, 3, "string"),
+    (dict, 4, "object"),
+    ((list, tuple), 5, "array"),
+    (bytes, 6, "binData"),
+    (ObjectId, 7, "objectId"),
+    (bool, 8, "bool"),
+    (datetime, 9, "date"),
+]
+
+
+def _bracket(value: Any) -> tuple[int, str]:
+    if value is MISSING or value is None:
+        return 1, "null" if value is None else "missing"
+    if isinstance(value, bool):
+        return 8, "bool"
+    for types, order, name in _TYPE_ORDER:
+        if isinstance(value, types):
+            return order, name
+    return 99, type(value).__name__
+
+
+def type_name(value: Any) -> str:
+    """Returns the BSON type name of a value as `$type` reports it."""
+    return _bracket(value)[1]
+
+
+def compare(a: Any, b: Any) -> int:
+    """Compares two values across types the way MongoDB sorts them."""
+    order_a, order_b = _bracket(a)[0], _bracket(b)[0]
+    if order_a != order_b:
+        return -1 if order_a < order_b else 1
+    if order_a == 1:
+        return 0
+    if order_a == 5:
+        for x, y in zip(a, b):
+            if result := compare(x, y):
+                return result
+        return (len(a) > len(b)) - (len(a) < len(b))
+    if order_a == 4:
+        return compare(list(a.items()), list(b.items()))
+    if order_a == 9:
+        a, b = _naive_utc(a), _naive_utc(b)
+    return (a > b) - (a < b)
+
+
+def _naive_utc(date: datetime) -> datetime:
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _same_bracket(a: Any, b: Any) -> bool:
+    return _bracket(a)[0] == _bracket(b)[0]
+
+
+def _equals(value: Any, target: Any) -> bool:
+    """Equality of a field value as a query sees it, arrays match if any of
+    their elements does, or the array as a whole."""
+    if target is None:
+        return value is MISSING or value is None
+    if value is MISSING:
+        return False
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(_equals(item, target) for item in value)
+    return _same_bracket(value, target) and compare(value, target) == 0
+
+
+def _compares(value: Any, target: Any, accept: Callable[[int], bool]) -> bool:
+    if isinstance(value, list):
+        return any(_compares(item, target, accept) for item in value)
+    if value is MISSING or not _same_bracket(value, target):
+        return False
+    return accept(compare(value, target))
+
+
+_COMPARISONS: dict[str, Callable[[int], bool]] = {
+    "$gt": lambda c: c > 0,
+    "$gte": lambda c: c >= 0,
+    "$lt": lambda c: c < 0,
+    "$lte": lambda c: c <= 0,
+}
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if not (
+        isinstance(condition, dict)
+        and condition
+        and all(op.startswith("$") for op in condition)
+    ):
+        return _equals(value, condition)
+
+    for op, target in condition.items():
+        if op in _COMPARISONS:
+            ok = _compares(value, target, _COMPARISONS[op])
+        elif op == "$in":
+            if isinstance(value, (str, ObjectId)):
+                # the common lookup of many keys, equal only to their own type
+                ok = value in (
+                    target.hashed if isinstance(target, _Members) else target
+                )
+            else:
+                ok = any(_equals(value, t) for t in target)
+        elif op == "$type":
+            names = target if isinstance(target, list) else [target]
+            ok = value is not MISSING and type_name(value) in names
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported")
+        if not ok:
+            return False
+    return True
+
+
+class _Members(list):
+    """The values of an `$in`, along with a set of those that can be looked up
+    by hash."""
+
+    def __init__(self, values: Iterable) -> None:
+        super().__init__(values)
+        self.hashed = frozenset(v for v in self if isinstance(v, (str, ObjectId)))
+
+
+def prepare(filter: Optional[dict]) -> Optional[dict]:
+    """Returns a filter that matches the same documents, faster when it is
+    matched against many of them."""
+    if not filter:
+        return filter
+
+    prepared: dict = {}
+    for field, condition in filter.items():
+        if field == "$or":
+            condition = [prepare(branch) for branch in condition]
+        elif isinstance(condition, dict) and isinstance(condition.get("$in"), list):
+            condition = {**condition, "$in": _Members(condition["$in"])}
+        prepared[field] = condition
+    return prepared
+
+
+def matches(document: dict, filter: Optional[dict]) -> bool:
+    """Returns whether a document matches a query filter."""
+    if not filter:
+        return True
+
+    for field, condition in filter.items():
+        if field == "$or":
+            ok = any(matches(document, f) for f in condition)
+        elif field.startswith("$"):
+            raise NotImplementedError(f"Query operator {field} is not supported")
+        else:
+            ok = _matches_condition(document.get(field, MISSING), condition)
+        if not ok:
+            return False
+    return True
+
+
+def _parse_date(value: Any) -> Any:
+    if isinstance(value, str):
+        return _naive_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    return value
+
+
+def _add(values: list) -> Any:
+    date = next((v for v in values if isinstance(v, datetime)), None)
+    numbers = sum(v for v in values if not isinstance(v, datetime))
+    if date is None:
+        return numbers
+    return date + timedelta(milliseconds=numbers)
+
+
+def evaluate(expression: Any, document: dict) -> Any:
+    """Evaluates an aggregation expression against a document."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = document.get(expression[1:], MISSING)
+        return None if value is MISSING else value
+
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+
+    if not isinstance(expression, dict) or not expression:
+        return expression
+
+    (op, args), *rest = expression.items()
+    if not op.startswith("$") or rest:
+        return {key: evaluate(value, document) for key, value in expression.items()}
+
+    if op == "$cond":
+        if isinstance(args, dict):
+            args = [args["if"], args["then"], args["else"]]
+        condition, then, otherwise = args
+        chosen = then if evaluate(condition, document) else otherwise
+        return evaluate(chosen, document)
+
+    values = evaluate(args if isinstance(args, list) else [args], document)
+    if op == "$and":
+        return all(values)
+    if op == "$not":
+        return not values[0]
+    if op in _COMPARISONS:
+        return _COMPARISONS[op](compare(*values))
+    if op == "$in":
+        return any(compare(values[0], item) == 0 for item in values[1])
+    if op == "$size":
+        return len(values[0])
+    if op == "$concatArrays":
+        return [item for value in values for item in value]
+    if op == "$add":
+        return _add(values)
+    if op == "$toDate":
+        return _parse_date(values[0])
+    raise NotImplementedError(f"Expression operator {op} is not supported")
+
+
+def apply_update(document: dict, update: dict | list) -> dict:
+    """Returns the document with an update document or pipeline applied."""
+    document = copy_document(document)
+    if isinstance(update, list):
+        for stage in update:
+            ((op, spec),) = stage.items()
+            if op == "$set":
+                values = {f: evaluate(e, document) for f, e in spec.items()}
+                document.update(values)
+            else:
+                raise NotImplementedError(f"Pipeline stage {op} is not supported")
+        return document
+
+    for op, spec in update.items():
+        for field, value in spec.items():
+            if op == "$set":
+                document[field] = value
+            elif op == "$addToSet":
+                items = value["$each"] if isinstance(value, dict) else [value]
+                array = document.setdefault(field, [])
+                for item in items:
+                    if not any(_equals(a, item) for a in array):
+                        array.append(item)
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported")
+    return document
+
+
+def project(document: dict, projection: Optional[dict | Iterable[str]]) -> dict:
+    """Returns the fields of a document selected by a projection."""
+    return projector(projection)(document)
+
+
+def projector(
+    projection: Optional[dict | Iterable[str]],
+) -> Callable[[dict], dict]:
+    """Returns a function selecting the fields of a document chosen by a
+    projection, to apply the same projection to many documents."""
+    if not projection:
+        return lambda document: document
+    if not isinstance(projection, dict):
+        projection = dict.fromkeys(projection, 1)
+
+    include = {f for f, v in projection.items() if v and f != "_id"}
+    if include:
+        fields = include | ({"_id"} if projection.get("_id", 1) else set())
+        return lambda document: {f: v for f, v in document.items() if f in fields}
+
+    excluded = {f for f, v in projection.items() if not v}
+    return lambda document: {f: v for f, v in document.items() if f not in excluded}
+
+
+def sort_documents(documents: Iterable[dict], sort: list[tuple[str, int]]) -> list:
+    """Returns the documents ordered by a sort specification."""
+
+    def compare_documents(a: dict, b: dict) -> int:
+        for field, direction in sort:
+            result = compare(a.get(field, MISSING), b.get(field, MISSING))
+            if result:
+                return result * direction
+        return 0
+
+    return sorted(documents, key=cmp_to_key(compare_documents))
+
+
+def normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> list:
+    """Turns the arguments of `Cursor.sort` into a list of field directions."""
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(field, d) for field, d in key_or_list]
+
+
+def copy_document(document: dict) -> dict:
+    """Copies a document along with its arrays, the only mutable values a key
+    document holds."""
+    return {
+        field: list(value) if isinstance(value, list) else value
+        for field, value in document.items()
+    }
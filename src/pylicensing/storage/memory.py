@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import itertools
+from contextlib import AbstractContextManager
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from ._base import DUPLICATE_KEY_ERROR, LocalCollection, index_fields, index_name
+from ._query import copy_document, matches, prepare, sort_documents
+
+# values the indexes can look documents up by, equal to each other only if
+# MongoDB considers them equal as well
+_INDEXABLE = (str, ObjectId, datetime)
+
+
+class _Index:
+    """A hash index of the documents by the value of one field.
+
+    Documents whose value can not be indexed, such as arrays, are kept aside
+    and are a candidate for any lookup.
+    """
+
+    def __init__(self, field: str, unique: bool) -> None:
+        self.field = field
+        self.unique = unique
+        self.values: dict[Any, set] = {}
+        self.unindexed: set = set()
+
+    def lookup(self, values: list) -> set:
+        found = set(self.unindexed)
+        for value in values:
+            found.update(self.values.get(value, ()))
+        return found
+
+    def check(self, document: dict, collection: str) -> None:
+        value = document.get(self.field)
+        if not self.unique or not isinstance(value, _INDEXABLE):
+            return
+        holders = self.values.get(value, set()) - {document["_id"]}
+        if holders:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {collection} "
+                f"index: {self.field}_1 dup key: {{ {self.field}: {value!r} }}",
+                DUPLICATE_KEY_ERROR,
+            )
+
+    def add(self, document: dict) -> None:
+        value = document.get(self.field)
+        if isinstance(value, _INDEXABLE):
+            self.values.setdefault(value, set()).add(document["_id"])
+        else:
+            self.unindexed.add(document["_id"])
+
+    def remove(self, document: dict) -> None:
+        value = document.get(self.field)
+        if isinstance(value, _INDEXABLE):
+            ids = self.values[value]
+            ids.discard(document["_id"])
+            if not ids:
+                del self.values[value]
+        else:
+            self.unindexed.discard(document["_id"])
+
+
+class MemoryCollection(LocalCollection):
+    """A collection held in memory, for tests, benchmarks and single-process
+    deployments that do not need the keys to persist.
+
+    Supports the operations of a pymongo `Collection` that `KeyManager` uses,
+    with the subset of the query language described in `pylicensing.storage`.
+    Documents are copied on the way in and out, so modifying a returned
+    document does not modify the collection.
+
+    Fields with an index created through `create_index` are looked up by
+    hash, queries on other fields scan the whole collection.
+
+    Parameters
+    ----------
+    name :class:`str`:
+        The name of the collection, used in error messages.
+    """
+
+    _names = itertools.count()
+
+    def __init__(self, name: Optional[str] = None) -> None:
+        super().__init__(name or f"memory{next(self._names)}")
+        self._documents: dict[Any, dict] = {}
+        self._indexes: dict[str, _Index] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _transaction(self) -> AbstractContextManager:
+        return self._lock
+
+    def create_index(self, keys: str | list, *, unique: bool = False, **_) -> str:
+        fields = index_fields(keys)
+        if len(fields) == 1:
+            field = fields[0][0]
+            with self._lock:
+                if field not in self._indexes or unique:
+                    index = _Index(field, unique)
+                    for document in self._documents.values():
+                        index.check(document, self.name)
+                        index.add(document)
+                    self._indexes[field] = index
+        return index_name(fields)
+
+    def index_information(self) -> dict[str, dict]:
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for field, index in self._indexes.items():
+            info[f"{field}_1"] = {"key": [(field, 1)], "unique": index.unique}
+        return info
+
+    def drop(self) -> None:
+        with self._lock:
+            self._documents.clear()
+            self._indexes.clear()
+
+    def _candidates(self, filter: Optional[dict]) -> list[dict]:
+        """The documents that may match the filter, narrowed down by the `_id`
+        or an indexed field the filter looks up by value."""
+        for field, condition in (filter or {}).items():
+            if isinstance(condition, dict) and set(condition) == {"$in"}:
+                values = list(condition["$in"])
+            else:
+                values = [condition]
+            if not all(isinstance(value, _INDEXABLE) for value in values):
+                continue
+
+            if field == "_id":
+                found = (self._documents.get(_id) for _id in values)
+                return [document for document in found if document is not None]
+            if field in self._indexes:
+                ids = self._indexes[field].lookup(values)
+                return [self._documents[_id] for _id in ids]
+        return list(self._documents.values())
+
+    def _select(
+        self, filter: Optional[dict], sort: list[tuple[str, int]], batch_size: int
+    ) -> Iterator[dict]:
+        prepared = prepare(filter)
+        with self._lock:
+            documents = [d for d in self._candidates(filter) if matches(d, prepared)]
+        if sort:
+            documents = sort_documents(documents, sort)
+        return (copy_document(document) for document in documents)
+
+    def _insert(self, document: dict) -> None:
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} "
+                f"index: _id_ dup key: {{ _id: {document['_id']!r} }}",
+                DUPLICATE_KEY_ERROR,
+            )
+        for index in self._indexes.values():
+            index.check(document, self.name)
+
+        document = copy_document(document)
+        self._documents[document["_id"]] = document
+        for index in self._indexes.values():
+            index.add(document)
+
+    def _replace(self, document: dict) -> None:
+        for index in self._indexes.values():
+            index.check(document, self.name)
+
+        previous = self._documents[document["_id"]]
+        for index in self._indexes.values():
+            index.remove(previous)
+        document = copy_document(document)
+        self._documents[document["_id"]] = document
+        for index in self._indexes.values():
+            index.add(document)
+
+    def _delete(self, _id: Any) -> None:
+        document = self._documents.pop(_id)
+        for index in self._indexes.values():
+            index.remove(document)
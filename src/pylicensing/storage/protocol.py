@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Iterator, Optional, Protocol, runtime_checkable
+
+
+@runtime_checkable
+class KeyStorage(Protocol):
+    """The part of the pymongo `Collection` interface `KeyManager` relies on.
+
+    A pymongo `Collection`, `MemoryCollection` and `SQLiteCollection` all
+    satisfy it. Results and errors are those of pymongo, e.g. `insert_one`
+    returns an `InsertOneResult` and violating a unique index raises a
+    `DuplicateKeyError`.
+    """
+
+    @property
+    def name(self) -> str: ...
+
+    def create_index(self, keys: Any, **kwargs: Any) -> str: ...
+
+    def index_information(self) -> dict[str, dict]: ...
+
+    def insert_one(self, document: dict, **kwargs: Any) -> Any: ...
+
+    def insert_many(self, documents: Iterable[dict], **kwargs: Any) -> Any: ...
+
+    def find_one(
+        self, filter: Optional[Any] = None, *args: Any, **kwargs: Any
+    ) -> Optional[dict]: ...
+
+    def find(
+        self, filter: Optional[dict] = None, *args: Any, **kwargs: Any
+    ) -> Iterator[dict]: ...
+
+    def count_documents(self, filter: dict, **kwargs: Any) -> int: ...
+
+    def update_one(self, filter: dict, update: Any, **kwargs: Any) -> Any: ...
+
+    def update_many(self, filter: dict, update: Any, **kwargs: Any) -> Any: ...
+
+    def find_one_and_update(
+        self, filter: dict, update: Any, *args: Any, **kwargs: Any
+    ) -> Optional[dict]: ...
+
+    def delete_one(self, filter: dict, **kwargs: Any) -> Any: ...
+
+    def delete_many(self, filter: dict, **kwargs: Any) -> Any: ...
+
+    def bulk_write(self, requests: list, **kwargs: Any) -> Any: ...
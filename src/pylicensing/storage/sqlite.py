@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional
+
+import bson
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from ._base import DUPLICATE_KEY_ERROR, LocalCollection, index_fields, index_name
+from ._query import matches, prepare, sort_documents
+
+
+def _encode(value: Any) -> Optional[str]:
+    """Encodes a value for an index column, `None` if it can not be indexed.
+
+    The type is prefixed so values of different types never compare equal
+    and dates sort chronologically within their prefix.
+    """
+    if isinstance(value, str):
+        return "s" + value
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return f"d{value:%Y-%m-%dT%H:%M:%S.%f}"
+    if isinstance(value, ObjectId):
+        return "o" + str(value)
+    return None
+
+
+def _column(field: str, value: Any) -> Optional[str]:
+    """Encodes the value of an indexed field the way it is stored, bson keeps
+    dates with millisecond precision.
+
+    Arrays can not be stored in an index column, a document holding one in an
+    indexed field is refused.
+    """
+    if isinstance(value, list):
+        raise ValueError(f"Can not index the array in the field '{field}'")
+    if isinstance(value, datetime):
+        value = value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return _encode(value)
+
+
+def _encode_id(value: Any) -> str:
+    encoded = _encode(value)
+    if encoded is None:
+        return "r" + repr(value)
+    return encoded
+
+
+_RANGES = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+class SQLiteCollection(LocalCollection):
+    """A collection stored in a SQLite database, for deployments that want the
+    keys to persist without running a MongoDB server.
+
+    Supports the operations of a pymongo `Collection` that `KeyManager` uses,
+    with the subset of the query language described in `pylicensing.storage`.
+
+    Documents are stored as BSON in a table named after the collection, so
+    they come back with the same types they would from MongoDB. Every field
+    an index is created on through `create_index` gets a column of its own
+    with a SQLite index. Queries looking up such a field, or the `_id`, by
+    value or by range are narrowed down by SQLite, the rest of the filter is
+    matched on the decoded documents. Indexed fields can not hold arrays,
+    writing such a document raises a `ValueError`.
+
+    The collection can be shared between threads. Several processes may open
+    the same database file, SQLite serializes their writes and enforces the
+    unique indexes across them. Indexes created through another connection
+    are picked up by the next operation.
+
+    Parameters
+    ----------
+    path :class:`str`:
+        The path of the database file, or `":memory:"`.
+
+    name :class:`str`:
+        The name of the collection, which is the name of its table.
+    """
+
+    def __init__(self, path: str = ":memory:", name: str = "keys") -> None:
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+            raise ValueError(f"'{name}' is not a valid collection name")
+
+        super().__init__(name)
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} "
+            "(_id TEXT PRIMARY KEY, document BLOB NOT NULL)"
+        )
+        self._schema_version = -1
+        self._columns: dict[str, str] = {}
+        self._refresh_columns()
+
+    def _refresh_columns(self) -> None:
+        """Reloads the index columns if the schema changed since they were
+        loaded, e.g. because another connection created an index."""
+        (version,) = self._conn.execute("PRAGMA schema_version").fetchone()
+        if version == self._schema_version:
+            return
+
+        rows = self._conn.execute(f"PRAGMA table_info({self.name})").fetchall()
+        self._columns = {row[1][2:]: row[1] for row in rows if row[1].startswith("f_")}
+        self._schema_version = version
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            try:
+                self._refresh_columns()
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                # a failed create_index may have added a column
+                self._schema_version = -1
+                raise
+            else:
+                self._conn.execute("COMMIT")
+            finally:
+                self._depth = 0
+
+    def create_index(self, keys: str | list, *, unique: bool = False, **_) -> str:
+        fields = index_fields(keys)
+        name = index_name(fields)
+        if len(fields) != 1 or fields[0][0] == "_id":
+            return name
+
+        field = fields[0][0]
+        column = f"f_{field}"
+        with self._transaction():
+            if field not in self._columns:
+                self._add_column(field, column)
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            try:
+                self._conn.execute(
+                    f"CREATE {kind} IF NOT EXISTS ix_{self.name}_{field} "
+                    f"ON {self.name} ({column})"
+                )
+            except sqlite3.IntegrityError as e:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} "
+                    f"index: {name}",
+                    DUPLICATE_KEY_ERROR,
+                ) from e
+        return name
+
+    def _add_column(self, field: str, column: str) -> None:
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", field):
+            raise ValueError(f"Can not index the field '{field}'")
+
+        self._conn.execute(f"ALTER TABLE {self.name} ADD COLUMN {column} TEXT")
+        rows = self._conn.execute(f"SELECT _id, document FROM {self.name}").fetchall()
+        self._conn.executemany(
+            f"UPDATE {self.name} SET {column} = ? WHERE _id = ?",
+            [(_column(field, bson.decode(doc).get(field)), _id) for _id, doc in rows],
+        )
+        self._columns[field] = column
+
+    def index_information(self) -> dict[str, dict]:
+        info: dict[str, dict] = {"_id_": {"key": [("_id", 1)]}}
+        with self._lock:
+            self._refresh_columns()
+            rows = self._conn.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = ?",
+                (self.name,),
+            ).fetchall()
+        for name, sql in rows:
+            field = name.removeprefix(f"ix_{self.name}_")
+            if sql and field in self._columns:
+                info[f"{field}_1"] = {"key": [(field, 1)], "unique": "UNIQUE" in sql}
+        return info
+
+    def drop(self) -> None:
+        with self._transaction():
+            self._conn.execute(f"DELETE FROM {self.name}")
+
+    def _prefilter(self, filter: Optional[dict]) -> tuple[str, list]:
+        """Translates the lookups of indexed fields in a filter to SQL."""
+        clauses, params = [], []
+        for field, condition in (filter or {}).items():
+            if field == "$or":
+                # only narrows down if every branch does
+                branches = [self._prefilter(branch) for branch in condition]
+                if branches and all(where != "1" for where, _ in branches):
+                    clauses.append(" OR ".join(f"({where})" for where, _ in branches))
+                    params.extend(arg for _, args in branches for arg in args)
+                continue
+
+            if field == "_id":
+                column, encode = "_id", _encode_id
+            elif field in self._columns:
+                column, encode = self._columns[field], _encode
+            else:
+                continue
+
+            clause = None
+            if not isinstance(condition, dict) or not condition:
+                value = encode(condition) if not isinstance(condition, list) else None
+                if value is not None:
+                    clause, args = f"{column} = ?", [value]
+            elif set(condition) == {"$in"}:
+                values = [encode(v) for v in condition["$in"]]
+                if values and all(v is not None for v in values):
+                    marks = ", ".join("?" * len(values))
+                    clause, args = f"{column} IN ({marks})", values
+            elif set(condition) <= set(_RANGES):
+                bounds = [(op, _encode(v)) for op, v in condition.items()]
+                if all(b and b[0] in "sd" for _, b in bounds):
+                    # keep the range within the type of its bounds
+                    prefix = bounds[0][1][0]
+                    parts = [f"{column} >= ?", f"{column} < ?"]
+                    args = [prefix, chr(ord(prefix) + 1)]
+                    for op, bound in bounds:
+                        parts.append(f"{column} {_RANGES[op]} ?")
+                        args.append(bound)
+                    clause = " AND ".join(parts)
+
+            if clause is None:
+                continue
+            clauses.append(clause)
+            params.extend(args)
+        return " AND ".join(f"({clause})" for clause in clauses) or "1", params
+
+    def _select(
+        self, filter: Optional[dict], sort: list[tuple[str, int]], batch_size: int
+    ) -> Iterator[dict]:
+        documents = self._scan(filter, batch_size)
+        if sort:
+            return iter(sort_documents(documents, sort))
+        return documents
+
+    def _scan(self, filter: Optional[dict], batch_size: int) -> Iterator[dict]:
+        """Pages through the candidate rows in `rowid` order, so no statement
+        stays open between batches and writes may happen in between."""
+        with self._lock:
+            self._refresh_columns()
+            where, params = self._prefilter(filter)
+        prepared = prepare(filter)
+        query = (
+            f"SELECT rowid, document FROM {self.name} "
+            f"WHERE rowid > ? AND {where} ORDER BY rowid LIMIT ?"
+        )
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(query, (last, *params, batch_size)).fetchall()
+            for rowid, data in rows:
+                document = bson.decode(data)
+                if matches(document, prepared):
+                    yield document
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    def _row(self, document: dict) -> tuple:
+        return (
+            _encode_id(document["_id"]),
+            bson.encode(document),
+            *(_column(field, document.get(field)) for field in self._columns),
+        )
+
+    def _duplicate(self, document: dict, error: sqlite3.IntegrityError):
+        return DuplicateKeyError(
+            f"E11000 duplicate key error collection: {self.name} ({error}) "
+            f"dup key: {{ _id: {document['_id']!r} }}",
+            DUPLICATE_KEY_ERROR,
+        )
+
+    def _insert(self, document: dict) -> None:
+        columns = ", ".join(["_id", "document", *self._columns.values()])
+        marks = ", ".join("?" * (len(self._columns) + 2))
+        try:
+            self._conn.execute(
+                f"INSERT INTO {self.name} ({columns}) VALUES ({marks})",
+                self._row(document),
+            )
+        except sqlite3.IntegrityError as e:
+            raise self._duplicate(document, e) from e
+
+    def _replace(self, document: dict) -> None:
+        _id, data, *values = self._row(document)
+        assignments = ", ".join(
+            f"{column} = ?" for column in ["document", *self._columns.values()]
+        )
+        try:
+            self._conn.execute(
+                f"UPDATE {self.name} SET {assignments} WHERE _id = ?",
+                (data, *values, _id),
+            )
+        except sqlite3.IntegrityError as e:
+            raise self._duplicate(document, e) from e
+
+    def _delete(self, _id: Any) -> None:
+        self._conn.execute(f"DELETE FROM {self.name} WHERE _id = ?", (_encode_id(_id),))
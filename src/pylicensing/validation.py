@@ -1,7 +1,68 @@
-from .hwid_tools import add_device_hwid, device_hwid_allowed
+import hmac
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from enum import IntEnum
+from typing import Any, Iterable, Optional
+
+from .exceptions import InvalidSignatureError
+from .hwid_tools import add_device_hwid, device_hwid_allowed, get_device_hwid
+from .instrumentation import instrumented
 from .key import Key, KeyFormat
+from .key._signing import decode_metadata, signature, split_signed
+from .key.format import LOWER, NUMBER, SPECIAL, UPPER, CompiledFormat
+
+logger = logging.getLogger(__name__)
+
+
+class FormatViolation(IntEnum):
+    """The reason a key does not conform to a `KeyFormat`.
+
+    The reasons are checked in the order they are defined in, a key is
+    reported with the first one it violates.
+    """
 
+    NONE = 0
+    MISSING_SEPERATOR = 1
+    SECTION_COUNT = 2
+    SECTION_LENGTH = 3
+    FORBIDDEN_LOWERCASE = 4
+    FORBIDDEN_UPPERCASE = 5
+    FORBIDDEN_NUMERIC = 6
+    FORBIDDEN_SPECIAL = 7
+    MISSING_SPECIAL = 8
+    MISSING_LOWERCASE = 9
+    MISSING_UPPERCASE = 10
+    MISSING_NUMERIC = 11
 
+
+_FORBIDDEN_VIOLATIONS = {
+    LOWER: FormatViolation.FORBIDDEN_LOWERCASE,
+    UPPER: FormatViolation.FORBIDDEN_UPPERCASE,
+    NUMBER: FormatViolation.FORBIDDEN_NUMERIC,
+    SPECIAL: FormatViolation.FORBIDDEN_SPECIAL,
+}
+_MISSING_VIOLATIONS = {
+    SPECIAL: FormatViolation.MISSING_SPECIAL,
+    LOWER: FormatViolation.MISSING_LOWERCASE,
+    UPPER: FormatViolation.MISSING_UPPERCASE,
+    NUMBER: FormatViolation.MISSING_NUMERIC,
+}
+_FORBIDDEN_NAMES = {
+    FormatViolation.FORBIDDEN_LOWERCASE: "lower",
+    FormatViolation.FORBIDDEN_UPPERCASE: "upper",
+    FormatViolation.FORBIDDEN_NUMERIC: "numeric",
+    FormatViolation.FORBIDDEN_SPECIAL: "special",
+}
+_MISSING_NAMES = {
+    FormatViolation.MISSING_SPECIAL: "special",
+    FormatViolation.MISSING_LOWERCASE: "lowercase",
+    FormatViolation.MISSING_UPPERCASE: "uppercase",
+    FormatViolation.MISSING_NUMERIC: "numeric",
+}
+
+
+@instrumented("validation.check_hwid")
 def check_hwid(key: Key) -> None:
     """Checks the HWID of a `Key`.
 
@@ -12,12 +73,86 @@ def check_hwid(key: Key) -> None:
     Note that, if the HWID is added, this will only update the key object, not the
     database entry of the key.
     """
-    if not key.hwid_limit or device_hwid_allowed(key):
-        print("HWID valid.")
+    if not key.hwid_limit:
+        logger.debug("HWID valid.")
         return
-    
-    print("New login detected, attempting to register hwid...")
-    add_device_hwid(key)
+
+    # determined once, both checks below need it
+    hwid = get_device_hwid()
+    if device_hwid_allowed(key, hwid):
+        logger.debug("HWID valid.")
+        return
+
+    logger.info("New login detected, attempting to register hwid...")
+    add_device_hwid(key, hwid)
+
+@dataclass(frozen=True)
+class FormatCheck:
+    """The result of checking a key against a `KeyFormat`.
+
+    A `FormatCheck` is truthy if the key conforms to the format. Otherwise,
+    `reason` tells why it does not and `position` points at the offending
+    character or section, if there is a single one to blame.
+
+    The human readable `message` is only built when it is asked for.
+    """
+
+    key: str
+    format: KeyFormat
+    reason: FormatViolation = FormatViolation.NONE
+    position: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return self.reason is FormatViolation.NONE
+
+    @property
+    def message(self) -> str:
+        reason, format = self.reason, self.format
+        if reason is FormatViolation.NONE:
+            return "Key format is valid"
+        if reason is FormatViolation.MISSING_SEPERATOR:
+            return f"Key has no seperator '{format.seperator}'"
+        if reason is FormatViolation.SECTION_COUNT:
+            sections = self.key.count(format.seperator) + 1
+            return f"Format has {format.sections} sections, key has {sections}"
+        if reason is FormatViolation.SECTION_LENGTH:
+            return f"Chars per section do not match {format.chars_per_section}"
+        if reason in _FORBIDDEN_NAMES:
+            char = self.key[self.position]  # type: ignore[index]
+            name = _FORBIDDEN_NAMES[reason]
+            return f"Char '{char}' does not match non {name} character format."
+        return f"Key is missing {_MISSING_NAMES[reason]} characters"
+
+
+@instrumented("validation.check_format")
+def check_format(key: Key | str, format: KeyFormat) -> FormatCheck:
+    """Checks a `Key` against a `KeyFormat`.
+
+    The structure of the key is matched against the precompiled pattern of the
+    format, then all characters are classified in a single translation, which
+    is all it takes to tell whether the key is valid.
+
+    Parameters
+    ----------
+    key :class:`Key | str`:
+        The key to check
+
+    format :class:`KeyFormat`:
+        The format that the key should follow
+
+    Returns
+    -------
+    A `FormatCheck` holding the reason the key does not conform, if any.
+    """
+    if isinstance(key, Key):
+        key = key.key
+
+    compiled = format.compiled
+    if compiled.structure.fullmatch(key) is None:
+        return FormatCheck(key, format, *_structure_violation(key, format))
+    codes = compiled.classes(key)
+    return FormatCheck(key, format, *_character_violation(codes, compiled))
+
 
 def conforms_format(
     key: Key | str, format: KeyFormat, *, show_reason: bool = False
@@ -33,69 +168,222 @@ def conforms_format(
         The format that the key should follow
 
     show_reason :class:`bool`:
-        Whether to print the reason a key is not valid in the console.
+        Whether to log the reason a key is not valid, see `check_format` for
+        a structured reason.
+    """
+    result = check_format(key, format)
+    if not result and show_reason:
+        logger.warning("Key format is not valid: %s.", result.message)
+    return bool(result)
+
+
+@dataclass(frozen=True)
+class SignedMetadata:
+    """The expiration date and HWID limit embedded into a signed key.
+
+    The expiration date is only accurate to the hour, it is rounded up to the
+    next full hour.
     """
 
-    def _show_reason(reason) -> None:
-        if show_reason:
-            print(f"Key format is not valid: {reason}.")
+    valid_until: datetime
+    hwid_limit: int
+
+    @property
+    def expired(self) -> bool:
+        return datetime.now() >= self.valid_until
+
+
+@instrumented("validation.verify_signature")
+def verify_signature(key: Key | str, format: KeyFormat, secret: bytes | str) -> bool:
+    """Returns whether a key carries a valid signature of a signed `KeyFormat`.
+
+    Unlike `conforms_format`, this rejects keys that were not created with the
+    secret, i.e forged or tampered keys, without ever querying the database.
+
+    Parameters
+    ----------
+    key :class:`Key | str`:
+        The key to verify
+
+    format :class:`KeyFormat`:
+        The signed format the key was created with
+
+    secret :class:`bytes | str`:
+        The secret the key was signed with
+    """
+    if not format.signature_length:
+        raise ValueError(f"{format} does not produce signed keys")
 
     if isinstance(key, Key):
         key = key.key
 
-    if format.seperator not in key:
-        _show_reason(f"Key has no seperator '{format.seperator}'")
+    if format.compiled.structure.fullmatch(key) is None:
         return False
 
-    sections = key.split(format.seperator)
-    if not len(sections) == format.sections:
-        _show_reason(f"Format has {format.sections} sections, key has {len(sections)}")
-        return False
+    payload, _, tag = split_signed(format, key)
+    return hmac.compare_digest(signature(format, payload, secret), tag)
 
-    if any((format.chars_per_section != len(subsection) for subsection in sections)):
-        _show_reason(f"Chars per section do not match {format.chars_per_section}")
-        return False
-    
-    char_match_problem = _characters_match_format(key, format)
-    if char_match_problem is None:
-        return True
-    
-    _show_reason(char_match_problem)
-    return False
-
-def _characters_match_format(key: str, format: KeyFormat) -> str | None:
-    """Checks whether the characters of the string match the format, i.e it
-    contains all types of characters the format specified, but not characters
-    the format does not allow.
-    
-    Returns the reason the format does not match is valid if it is invalid,
-    otherwise `None`.
+
+def signed_metadata(
+    key: Key | str, format: KeyFormat, secret: bytes | str
+) -> SignedMetadata:
+    """Returns the metadata embedded into a signed key once its signature has
+    been verified, this allows to tell whether a key expired offline.
+
+    Raises
+    ------
+    `InvalidSignatureError`
+        If the signature of the key does not verify.
+    """
+    if not format.embed_metadata:
+        raise ValueError(f"{format} does not embed metadata into its keys")
+
+    if isinstance(key, Key):
+        key = key.key
+
+    if not verify_signature(key, format, secret):
+        raise InvalidSignatureError(key)
+    return SignedMetadata(*decode_metadata(format, split_signed(format, key)[1]))
+
+
+@instrumented("validation.conforms_format_many")
+def conforms_format_many(
+    keys: Iterable[Key | str] | Any, format: KeyFormat
+) -> tuple[Any, Any]:
+    """Checks a whole batch of keys against a `KeyFormat`.
+
+    Gives the same verdict as `conforms_format` for every key, but works on the
+    batch in passes: the structure of all keys is checked first, then the
+    characters of all structurally valid keys are classified in one go.
+
+    Parameters
+    ----------
+    keys :class:`Iterable[Key | str] | numpy.ndarray`:
+        The keys to check, either as an iterable or a NumPy array of strings
+        or `Key` objects.
+
+    format :class:`KeyFormat`:
+        The format that the keys should follow
+
+    Returns
+    -------
+    A mask of whether each key conforms and the `FormatViolation` of each key,
+    `FormatViolation.NONE` for the ones that conform. For a NumPy array these
+    are a `bool` and a `uint8` array, otherwise two lists.
     """
-    key = key.replace(format.seperator, "")
-    specials = r"!§$%&/()[]\/+#<>"
-
-    for char in key:
-        if char.islower() and not format.lowercase_ascii:
-            return f"Char '{char}' does not match non lower character format."
-            
-        if char.isupper() and not format.uppercase_ascii:
-            return f"Char '{char}' does not match non upper character format."
-            
-        if char.isnumeric() and not format.numeric_characters:
-            return f"Char '{char}' does not match non numeric character format."
-            
-        if char in specials and not format.special_characters:
-            return f"Char '{char}' does not match non special character format."
-            
-    if format.special_characters and not any(c in specials for c in key):
-        return f"Key is missing special characters"
-        
-    if format.lowercase_ascii and not any(c.islower() for c in key):
-        return f"Key is missing lowercase characters"
-        
-    if format.uppercase_ascii and not any(c.isupper() for c in key):
-        return f"Key is missing uppercase characters"
-        
-    if format.numeric_characters and not any(c.isnumeric() for c in key):
-        return f"Key is missing numeric characters"
-    return None
\ No newline at end of file
+    compiled = format.compiled
+    if hasattr(keys, "dtype"):
+        return _conforms_format_array(keys, format)
+
+    keys = [key.key if isinstance(key, Key) else key for key in keys]
+    reasons = [
+        FormatViolation.NONE
+        if compiled.structure.fullmatch(key)
+        else _structure_violation(key, format)[0]
+        for key in keys
+    ]
+    _check_characters(keys, reasons, compiled)
+    return [not reason for reason in reasons], reasons
+
+
+def _conforms_format_array(keys: Any, format: KeyFormat) -> tuple:
+    """`conforms_format_many` for NumPy arrays, the structure of the keys is
+    checked with vectorized string operations."""
+    import numpy as np
+
+    compiled = format.compiled
+    if keys.dtype.kind == "O":
+        # str() of a `Key` is its repr, not the key-string
+        strings = [key.key if isinstance(key, Key) else key for key in keys.flat]
+        keys = np.array(strings, dtype=str).reshape(keys.shape)
+    keys = np.ascontiguousarray(keys, dtype=str)
+    lengths = np.char.str_len(keys)
+    seperators = np.char.count(keys, format.seperator)
+
+    reasons = np.full(keys.shape, FormatViolation.SECTION_LENGTH, dtype=np.uint8)
+    reasons[seperators != format.sections - 1] = FormatViolation.SECTION_COUNT
+    if format.sections > 1:
+        reasons[seperators == 0] = FormatViolation.MISSING_SEPERATOR
+
+    candidates = (reasons == FormatViolation.SECTION_LENGTH) & (
+        lengths == compiled.length
+    )
+    width = keys.dtype.itemsize // keys.dtype.alignment
+    if compiled.seperator_positions and keys.size and width >= compiled.length:
+        chars = keys.reshape(-1).view("U1").reshape(keys.size, -1)
+        positions = list(compiled.seperator_positions)
+        candidates.reshape(-1)[:] &= (
+            chars[:, positions] == format.seperator
+        ).all(axis=1)
+    reasons[candidates] = FormatViolation.NONE
+
+    flat = reasons.reshape(-1)
+    found = [FormatViolation(r) for r in flat.tolist()]
+    _check_characters(keys.reshape(-1).tolist(), found, compiled)
+    flat[:] = found
+    return reasons == FormatViolation.NONE, reasons
+
+
+def _structure_violation(
+    key: str, format: KeyFormat
+) -> tuple[FormatViolation, Optional[int]]:
+    """Returns the first violation of the section structure of a key, along with
+    the index the first section of a wrong length starts at."""
+    seperator = format.seperator
+    if format.sections > 1 and seperator not in key:
+        return FormatViolation.MISSING_SEPERATOR, None
+
+    if key.count(seperator) != format.sections - 1:
+        return FormatViolation.SECTION_COUNT, None
+
+    start = 0
+    for section in key.split(seperator):
+        if len(section) != format.chars_per_section:
+            return FormatViolation.SECTION_LENGTH, start
+        start += len(section) + 1
+    return FormatViolation.NONE, None
+
+
+def _character_violation(
+    codes: str, compiled: CompiledFormat
+) -> tuple[FormatViolation, Optional[int]]:
+    """Returns the first character violation of a key given the class codes of
+    its characters, along with the index of the offending character.
+
+    A character may belong to several classes, e.g. 'ⅰ' is lowercase and
+    numeric, so the codes are tested bit by bit rather than compared.
+    """
+    present = 0
+    for code in set(codes):
+        present |= ord(code)
+
+    forbidden = present & ~compiled.allowed
+    if forbidden:
+        pos = next(i for i, code in enumerate(codes) if ord(code) & forbidden)
+        mask = ord(codes[pos]) & forbidden
+        for bit, violation in _FORBIDDEN_VIOLATIONS.items():
+            if mask & bit:
+                return violation, pos
+
+    for mask, violation in _MISSING_VIOLATIONS.items():
+        if compiled.allowed & mask and not present & mask:
+            return violation, None
+    return FormatViolation.NONE, None
+
+
+def _check_characters(
+    keys: list[str], reasons: list[FormatViolation], compiled: CompiledFormat
+) -> None:
+    """Checks the characters of all keys whose structure is valid, updating
+    their reasons in place.
+
+    As all of these keys are of the same length, they are classified as one
+    string which is then cut back into the individual keys.
+    """
+    valid = [i for i, reason in enumerate(reasons) if not reason]
+    length = compiled.length
+    codes = compiled.classes("".join([keys[i] for i in valid]))
+
+    for n, i in enumerate(valid):
+        key_codes = codes[n * length : (n + 1) * length]
+        reasons[i] = _character_violation(key_codes, compiled)[0]
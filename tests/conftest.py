@@ -0,0 +1,33 @@
+import pytest
+
+from pylicensing.storage import MemoryCollection, SQLiteCollection
+
+
+class RecordingCollection:
+    """Wraps a collection, recording the name of every method called on it so
+    tests can count the round trips an operation costs."""
+
+    def __init__(self, collection) -> None:
+        self.wrapped = collection
+        self.calls: list[str] = []
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.wrapped, name)
+        if not callable(attr):
+            return attr
+
+        def record(*args, **kwargs):
+            self.calls.append(name)
+            return attr(*args, **kwargs)
+
+        return record
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def collection(request) -> RecordingCollection:
+    if request.param == "memory":
+        return RecordingCollection(MemoryCollection())
+
+    backend = SQLiteCollection(":memory:")
+    request.addfinalizer(backend.close)
+    return RecordingCollection(backend)
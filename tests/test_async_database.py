@@ -0,0 +1,57 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from pylicensing import AsyncKeyManager, Key, KeyFormat, exceptions
+
+REG_FORMAT = KeyFormat(5, 5, "-")
+
+
+def test_async_crud(collection) -> None:
+    """Checks that the async manager supports the same operations"""
+
+    async def run() -> None:
+        async with AsyncKeyManager(collection) as manager:
+            await manager.ensure_indexes()
+            key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+            await manager.add_to_collection(key)
+
+            with pytest.raises(exceptions.KeyAlreadyExistsError):
+                await manager.add_to_collection(key)
+
+            assert await manager.exists(key.key)
+            key.owner = "Bert"
+            await manager.update(key)
+            assert (await manager.get(key.key)).owner == "Bert"
+
+            await manager.remove_from_collection(key)
+            assert not await manager.exists(key.key)
+
+    asyncio.run(run())
+
+
+def test_async_concurrent_validations(collection) -> None:
+    """Checks that thousands of concurrent lookups complete"""
+    keys = Key.create_many(REG_FORMAT, 100, "Test", 1, timedelta(30))
+
+    async def run() -> list[Key]:
+        async with AsyncKeyManager(collection, max_workers=8) as manager:
+            await manager.add_many(keys)
+            return await asyncio.gather(
+                *(manager.get(keys[i % 100].key) for i in range(2000))
+            )
+
+    results = asyncio.run(run())
+    assert [key.key for key in results] == [keys[i % 100].key for i in range(2000)]
+
+
+def test_async_iterate_keys(collection) -> None:
+    keys = Key.create_many(REG_FORMAT, 250, "Test", 1, timedelta(30))
+
+    async def run() -> list[Key]:
+        async with AsyncKeyManager(collection) as manager:
+            await manager.add_many(keys)
+            return [key async for key in manager.get_all_keys(batch_size=100)]
+
+    assert {key.key for key in asyncio.run(run())} == {key.key for key in keys}
@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+
+
+def run_benchmarks(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks", "--sizes", "2", "--min-time", "0", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+
+def test_benchmarks_smoke(tmp_path) -> None:
+    """Checks that the benchmarks run and regressions are reported"""
+    output = tmp_path / "results.json"
+    process = run_benchmarks("--formats", "short,signed", "-o", str(output))
+    assert process.returncode == 0, process.stderr
+
+    results = json.loads(output.read_text())["results"]
+    assert {result["group"] for result in results} == {
+        "generation",
+        "validation",
+        "serialization",
+        "key_manager",
+        "snapshot",
+    }
+    assert all(result["ops_per_second"] > 0 for result in results)
+
+    process = run_benchmarks(
+        "-k",
+        "validation",
+        "--formats",
+        "short",
+        "--baseline",
+        str(output),
+        "--threshold",
+        "-1",
+    )
+    assert process.returncode == 1 and "REGRESSION" in process.stderr
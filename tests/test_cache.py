@@ -0,0 +1,99 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from pylicensing import Key, KeyFormat, KeyManager
+from pylicensing.cache import KeyCache
+
+REG_FORMAT = KeyFormat(5, 5, "-")
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_cached_get(collection) -> None:
+    """Checks that repeated gets are served from the cache and writes refresh it"""
+    manager = KeyManager(collection, cache=KeyCache())
+    key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    collection.insert_one(key.to_database_data())
+
+    for _ in range(10):
+        assert manager.get(key.key).owner == "Test"
+    assert collection.calls.count("find_one") == 1
+    assert manager.cache.stats.hits == 9 and manager.cache.stats.misses == 1
+
+    cached = manager.get(key.key)
+    cached.owner = "Bert"
+    assert manager.get(key.key).owner == "Test"
+
+    manager.update(cached)
+    assert manager.get(key.key).owner == "Bert"
+
+    manager.remove_from_collection(cached)
+    assert not manager.exists(key.key)
+
+
+def test_eviction_and_expiry() -> None:
+    clock = Clock()
+    cache = KeyCache(maxsize=2, ttl=10, clock=clock)
+    keys = Key.create_many(REG_FORMAT, 3, "Test", 1, timedelta(30))
+    for key in keys:
+        cache.put(key)
+
+    assert len(cache) == 2 and cache.get(keys[0].key) is None
+    assert cache.get(keys[2].key) is not None
+
+    clock.now = 10
+    assert cache.get(keys[2].key) is None
+    assert cache.stats.evictions == 1 and cache.stats.expirations == 1
+
+
+def test_coalesced_misses() -> None:
+    """Checks that concurrent misses on a key result in a single load"""
+    cache = KeyCache()
+    key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    loads = []
+
+    def load(key_string: str) -> Key:
+        loads.append(key_string)
+        time.sleep(0.05)
+        return key
+
+    threads = [
+        threading.Thread(target=cache.get_or_load, args=(key.key, load))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [key.key]
+    assert cache.stats.coalesced == 7
+
+
+def test_missing_key_not_cached(collection) -> None:
+    manager = KeyManager(collection, cache=KeyCache())
+    for _ in range(2):
+        with pytest.raises(LookupError):
+            manager.get("AAAAA-AAAAA-AAAAA-AAAAA-AAAAA")
+    assert collection.calls.count("find_one") == 2
+
+
+def test_cached_exists(collection) -> None:
+    """Checks that cached keys are known to exist without a query"""
+    manager = KeyManager(collection, cache=KeyCache())
+    key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    manager.add_to_collection(key)
+
+    calls = len(collection.calls)
+    assert manager.exists(key.key)
+    assert manager.exists_many([key.key]) == {key.key}
+    assert len(collection.calls) == calls
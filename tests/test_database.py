@@ -6,13 +6,18 @@ import pytest
 from pymongo import MongoClient
 
 from pylicensing import Key, KeyFormat, KeyManager, hwid_tools, exceptions
+from pylicensing.storage import MemoryCollection
 
 REG_FORMAT = KeyFormat(5, 5, "-")
 dotenv.load_dotenv(dotenv.find_dotenv())
-all_perm_conn: MongoClient = MongoClient(os.environ.get("ACCESS_CONN"))
-read_only_conn: MongoClient = MongoClient(os.environ.get("READ_CONN"))
 
-database_manger = KeyManager(all_perm_conn.test.keys)
+# without a connection string, the tests run against an in-memory collection
+if os.environ.get("ACCESS_CONN"):
+    all_perm_conn: MongoClient = MongoClient(os.environ.get("ACCESS_CONN"))
+    read_only_conn: MongoClient = MongoClient(os.environ.get("READ_CONN"))
+    database_manger = KeyManager(all_perm_conn.test.keys)
+else:
+    database_manger = KeyManager(MemoryCollection("keys"))
 
 
 def test_key_upload() -> None:
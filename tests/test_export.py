@@ -0,0 +1,71 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from pylicensing import Key, KeyColumns, KeyFormat, KeyManager
+
+REG_FORMAT = KeyFormat(5, 5, "-")
+
+
+def _manager(collection) -> tuple[KeyManager, list[Key]]:
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 10, "Test", 3, timedelta(30))
+    keys[0].hwids.extend(["A", "B"])
+    keys[1].owner = "Other"
+    manager.add_many(keys)
+    return manager, keys
+
+
+def test_export_columns(collection) -> None:
+    """Checks that the keys are exported as typed columns, covering legacy
+    documents storing their dates as strings"""
+    manager, keys = _manager(collection)
+    collection.insert_one(
+        {
+            "key": "LEGACY",
+            "owner": "Old",
+            "hwid_limit": 0,
+            "hwids": [],
+            "created": "2020-01-01T00:00:00",
+        }
+    )
+
+    columns = manager.export_columns()
+    assert len(columns) == 11
+    exported = dict(zip(columns.key, columns.hwid_count))
+    assert exported[keys[0].key] == 2 and exported[keys[2].key] == 0
+
+    assert len(manager.export_columns({"owner": "Other"})) == 1
+
+    data = columns.to_dict()
+    legacy = data["key"].index("LEGACY")
+    assert data["created"][legacy] == 1577836800000
+    assert data["valid_until"][legacy] is None
+    assert KeyColumns.from_dict(json.loads(columns.to_json())).to_dict() == data
+
+
+def test_export_numpy(collection) -> None:
+    np = pytest.importorskip("numpy")
+    manager, keys = _manager(collection)
+    arrays = manager.export_columns().to_numpy()
+
+    assert arrays["key"].dtype.kind == "U" and arrays["hwid_limit"].dtype == np.int64
+    assert arrays["valid_until"].dtype == np.dtype("datetime64[ms]")
+    first = list(arrays["key"]).index(keys[0].key)
+    assert arrays["valid_until"][first] == np.datetime64(keys[0].valid_until, "ms")
+    assert (arrays["valid_until"] > np.datetime64(datetime.now(), "ms")).all()
+    assert arrays["hwid_count"].sum() == 2
+
+
+def test_export_optional_formats(collection) -> None:
+    manager, _ = _manager(collection)
+    columns = manager.export_columns()
+
+    pa = pytest.importorskip("pyarrow")
+    table = columns.to_arrow()
+    assert table.num_rows == 10
+    assert pa.types.is_timestamp(table.schema.field("created").type)
+
+    msgpack = pytest.importorskip("msgpack")
+    assert msgpack.unpackb(columns.to_msgpack()) == columns.to_dict()
@@ -1,9 +1,12 @@
 import random
 from datetime import timedelta
 
+import pytest
+
 from pylicensing import Key, KeyFormat, validation
 
 ITERATIONS = 2000
+REG_FORMAT = KeyFormat(5, 5, "-")
 
 
 def test_nonmatching_section() -> None:
@@ -47,4 +50,132 @@ def test_nonmatching_character_rules() -> None:
         assert validation.conforms_format(key, BAD_FORMAT) == (key_rules == format_rules)
 
 
+def build_mutated_keys(key_format: KeyFormat) -> list[str]:
+    """Creates keys of a format and copies of them with a random character
+    replaced, inserted or dropped."""
+    alphabet = "aZ9§/-_ é²" + key_format.seperator
+    keys = [Key.create(key_format, "Test", 1, timedelta(30)).key for _ in range(20)]
+    for key in keys[:]:
+        i = random.randrange(len(key))
+        keys.append(key[:i] + random.choice(alphabet) + key[i + 1 :])
+        keys.append(key[:i] + random.choice(alphabet) + key[i:])
+        keys.append(key[:i] + key[i + 1 :])
+    return keys
+
+
+def test_batch_matches_single() -> None:
+    for _ in range(ITERATIONS // 10):
+        key_format = KeyFormat(
+            random.randrange(2, 6), random.randrange(2, 6), "-", **build_random_format()
+        )
+        keys = build_mutated_keys(key_format)
+
+        mask, reasons = validation.conforms_format_many(keys, key_format)
+        assert mask == [validation.conforms_format(key, key_format) for key in keys]
+        assert all(
+            ok == (reason == validation.FormatViolation.NONE)
+            for ok, reason in zip(mask, reasons)
+        )
+
+
+def test_batch_numpy() -> None:
+    np = pytest.importorskip("numpy")
+    key_format = KeyFormat(4, 4, "-", numeric_characters=True)
+    keys = build_mutated_keys(key_format)
+
+    mask, reasons = validation.conforms_format_many(np.array(keys), key_format)
+    expected_mask, expected_reasons = validation.conforms_format_many(keys, key_format)
+
+    assert mask.dtype == bool
+    assert mask.tolist() == expected_mask
+    assert reasons.tolist() == expected_reasons
+
+
+def test_multi_class_characters() -> None:
+    """Checks characters belonging to several classes, 'ⅰ' is both lowercase and
+    numeric, against formats allowing only some of their classes"""
+    numeric = KeyFormat(2, 2, "-", uppercase_ascii=False, numeric_characters=True)
+    result = validation.check_format("_ⅰ-45", numeric)
+    assert result.reason == validation.FormatViolation.FORBIDDEN_LOWERCASE
+    assert result.position == 1
+
+    lower = KeyFormat(2, 2, "-", uppercase_ascii=False, lowercase_ascii=True)
+    assert validation.check_format("ⅰb-cd", lower).reason == (
+        validation.FormatViolation.FORBIDDEN_NUMERIC
+    )
+
+    both = KeyFormat(
+        2, 2, "-", uppercase_ascii=False, lowercase_ascii=True, numeric_characters=True
+    )
+    assert validation.check_format("ⅰ_-__", both)
+
+    keys = ["_ⅰ-45", "ⅰb-cd", "Ⅻ1-23", "٣٣-45", "ǅa-b1"]
+    for key_format in (numeric, lower, both):
+        mask, reasons = validation.conforms_format_many(keys, key_format)
+        expected = [validation.check_format(key, key_format) for key in keys]
+        assert mask == [bool(check) for check in expected]
+        assert reasons == [check.reason for check in expected]
+
+
+def test_batch_numpy_non_ascii() -> None:
+    np = pytest.importorskip("numpy")
+    key_format = KeyFormat(2, 2, "-", uppercase_ascii=False, numeric_characters=True)
+    keys = ["_ⅰ-45", "12-34", "²3-45", "§1-23", "ab-12"]
+
+    mask, reasons = validation.conforms_format_many(np.array(keys), key_format)
+    expected_mask, expected_reasons = validation.conforms_format_many(keys, key_format)
+    assert mask.tolist() == expected_mask == [False, True, True, False, False]
+    assert reasons.tolist() == expected_reasons
+
+    objects = np.array([Key(key, "Test", 1, None, None) for key in keys], dtype=object)
+    assert (
+        validation.conforms_format_many(objects, key_format)[0].tolist()
+        == mask.tolist()
+    )
+
+
+def test_batch_reasons() -> None:
+    key_format = KeyFormat(2, 3, "-", numeric_characters=True)
+    _, reasons = validation.conforms_format_many(
+        ["AB1-CDE", "AB1CDE", "AB-1-CD", "AB1-CDEF", "Ab1-CDE", "ABC-DEF"], key_format
+    )
+    assert reasons == [
+        validation.FormatViolation.NONE,
+        validation.FormatViolation.MISSING_SEPERATOR,
+        validation.FormatViolation.SECTION_COUNT,
+        validation.FormatViolation.SECTION_LENGTH,
+        validation.FormatViolation.FORBIDDEN_LOWERCASE,
+        validation.FormatViolation.MISSING_NUMERIC,
+    ]
+
+
+def test_check_format_reason() -> None:
+    key_format = KeyFormat(3, 3, "-", numeric_characters=True)
+
+    assert validation.check_format("AB1-CDE-FGH", key_format)
+
+    result = validation.check_format("AB1-CdE-FGH", key_format)
+    assert result.reason == validation.FormatViolation.FORBIDDEN_LOWERCASE
+    assert result.position == 5
+    assert result.message == "Char 'd' does not match non lower character format."
+
+    result = validation.check_format("AB1-CDEF-GH", key_format)
+    assert result.reason == validation.FormatViolation.SECTION_LENGTH
+    assert result.position == 4
+
+
+def test_single_section_format() -> None:
+    key_format = KeyFormat(1, 8, "-")
+    key = Key.create(key_format, "Test", 1, timedelta(30))
+
+    assert validation.conforms_format(key, key_format)
+    assert not validation.conforms_format(key.key[:4] + "-" + key.key[5:], key_format)
+
+
+def test_show_reason_logs(caplog) -> None:
+    with caplog.at_level("WARNING", logger="pylicensing.validation"):
+        assert not validation.conforms_format("AAAAA", REG_FORMAT)
+        assert not caplog.records
 
+        assert not validation.conforms_format("AAAAA", REG_FORMAT, show_reason=True)
+    assert "Key has no seperator '-'" in caplog.text
@@ -2,7 +2,7 @@ from datetime import timedelta
 
 import pytest
 
-from pylicensing import Key, KeyFormat, exceptions, hwid_tools
+from pylicensing import Key, KeyFormat, exceptions, hwid_tools, validation
 
 REG_FORMAT = KeyFormat(5, 5, "-")
 
@@ -38,3 +38,93 @@ def test_hwid_allowed() -> None:
 
     key.hwids = ["This is not a valid HWID"]
     assert not hwid_tools.device_hwid_allowed(key)
+
+
+class CountingProvider(hwid_tools.HWIDProvider):
+    def __init__(self, hwid: str = "HWID") -> None:
+        self.hwid = hwid
+        self.calls = 0
+
+    def get(self) -> str:
+        self.calls += 1
+        return self.hwid
+
+
+@pytest.fixture
+def provider():
+    previous = hwid_tools.get_provider()
+    counting = CountingProvider()
+    hwid_tools.set_provider(counting)
+    yield counting
+    hwid_tools.set_provider(previous)
+
+
+def test_check_hwid_determines_once(provider) -> None:
+    """Checks that registering a new device determines its HWID only once"""
+    key = Key.create(REG_FORMAT, f"Test", 2, timedelta(30))
+    validation.check_hwid(key)
+    assert key.hwids == ["HWID"] and provider.calls == 1
+
+    validation.check_hwid(key)
+    assert provider.calls == 2
+
+    unlimited = Key.create(REG_FORMAT, f"Test", 0, timedelta(30))
+    validation.check_hwid(unlimited)
+    assert hwid_tools.device_hwid_allowed(unlimited) and provider.calls == 2
+
+
+def test_cached_provider(tmp_path) -> None:
+    """Checks that the HWID is determined once per process and reused from the
+    file by later ones, as long as it was signed with the same salt"""
+    inner = CountingProvider()
+    cached = hwid_tools.CachedProvider(inner)
+    assert cached.get() == cached.get() == "HWID" and inner.calls == 1
+
+    path = tmp_path / "cache" / "hwid"
+    first = hwid_tools.CachedProvider(inner, path, salt="app")
+    assert first.get() == "HWID" and inner.calls == 2 and path.exists()
+
+    reader = CountingProvider("OTHER")
+    assert hwid_tools.CachedProvider(reader, path, salt="app").get() == "HWID"
+    assert reader.calls == 0
+
+    assert hwid_tools.CachedProvider(reader, path, salt="other").get() == "OTHER"
+    assert reader.calls == 1
+
+    path.write_text("garbage")
+    assert hwid_tools.CachedProvider(inner, path, salt="app").get() == "HWID"
+
+    first.clear()
+    assert not path.exists()
+
+
+def test_providers(monkeypatch) -> None:
+    monkeypatch.delenv("PYLICENSING_HWID", raising=False)
+    static = hwid_tools.StaticProvider("STATIC")
+    environment = hwid_tools.EnvironmentProvider(static)
+    assert environment.get() == "STATIC"
+
+    with pytest.raises(exceptions.HWIDNotDeterminedError):
+        hwid_tools.EnvironmentProvider().get()
+
+    monkeypatch.setenv("PYLICENSING_HWID", "OVERRIDE")
+    assert environment.get() == "OVERRIDE"
+
+    composite = hwid_tools.CompositeProvider(static, hwid_tools.StaticProvider("B"))
+    assert composite.get() == composite.get() != static.get()
+    assert composite.get() != hwid_tools.CompositeProvider(static).get()
+
+
+def test_provider_requires_get() -> None:
+    """Checks that providers without a `get` are rejected"""
+
+    class Incomplete(hwid_tools.HWIDProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()  # type: ignore[abstract]
+
+    previous = hwid_tools.get_provider()
+    with pytest.raises(TypeError):
+        hwid_tools.set_provider(object())  # type: ignore[arg-type]
+    assert hwid_tools.get_provider() is previous
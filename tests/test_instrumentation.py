@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import pytest
+
+from pylicensing import Key, KeyFormat, KeyManager, instrumentation
+from pylicensing.cache import KeyCache
+from pylicensing.validation import conforms_format
+
+REG_FORMAT = KeyFormat(5, 5, "-")
+
+
+@pytest.fixture
+def metrics():
+    metrics = instrumentation.Metrics()
+    instrumentation.add_listener(metrics)
+    yield metrics
+    instrumentation.remove_listener(metrics)
+
+
+def test_key_manager_metrics(collection, metrics) -> None:
+    """Checks that calls, round trips, errors and latencies are recorded"""
+    cache = KeyCache()
+    metrics.track_cache("keys", cache)
+    manager = KeyManager(collection, cache=cache)
+    manager.ensure_indexes()
+    keys = Key.create_many(REG_FORMAT, 10, "Test", 1, timedelta(30))
+    manager.add_many(keys, chunk_size=4)
+    manager.get(keys[0].key)
+    with pytest.raises(LookupError):
+        manager.get("missing")
+
+    stats = metrics.snapshot()
+    assert stats["key_manager.add_many"].round_trips == 3
+    assert stats["key_manager.get"].calls == 2
+    assert stats["key_manager.get"].round_trips == 1
+    assert stats["key_manager.get"].errors == {"LookupError": 1}
+    assert sum(stats["key_manager.get"].histogram) == 2
+    assert 0 < stats["key_manager.get"].quantile(0.5) <= 10
+    assert metrics.cache_stats()["keys"]["hits"] == 1
+
+
+def test_no_listeners(collection) -> None:
+    """Checks that calls to the collection are not counted without listeners"""
+    manager = KeyManager(collection)
+    before = instrumentation._round_trips()
+    manager.add_many(Key.create_many(REG_FORMAT, 10, "Test", 1, timedelta(30)))
+    assert instrumentation._round_trips() == before and collection.calls
+
+
+def test_validation_metrics(metrics) -> None:
+    """Checks that validation calls are reported and failing listeners ignored"""
+    def failing(event) -> None:
+        raise RuntimeError
+
+    instrumentation.add_listener(failing)
+    try:
+        assert conforms_format("AAAAA-AAAAA-AAAAA-AAAAA-AAAAA", REG_FORMAT)
+    finally:
+        instrumentation.remove_listener(failing)
+    assert metrics.snapshot()["validation.check_format"].calls == 1
+
+
+def test_no_prints(collection, capsys) -> None:
+    """Checks that operations log rather than print"""
+    manager = KeyManager(collection)
+    key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    manager.add_to_collection(key)
+    key.owner = "Bert"
+    manager.update(key)
+    manager.remove_from_collection(key)
+    assert capsys.readouterr().out == ""
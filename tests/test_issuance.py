@@ -0,0 +1,81 @@
+import csv
+import json
+from datetime import timedelta
+
+import pytest
+
+from pylicensing import KeyFormat, validation
+from pylicensing.issuance import CSVSink, JSONLSink, Sink, issue_keys
+
+REG_FORMAT = KeyFormat(5, 5, "-")
+
+
+def test_issue_jsonl(tmp_path) -> None:
+    """Checks that keys issued across processes are distinct and complete"""
+    with JSONLSink(tmp_path / "keys.jsonl") as sink:
+        written = issue_keys(
+            REG_FORMAT, 3000, sink, "Test", 1, timedelta(30), processes=2, chunk_size=250
+        )
+    assert written == 3000
+
+    with open(tmp_path / "keys.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+
+    assert len({record["key"] for record in records}) == 3000
+    assert all(validation.conforms_format(r["key"], REG_FORMAT) for r in records)
+    assert all(record["owner"] == "Test" for record in records)
+
+
+def test_issue_csv_chunked(tmp_path) -> None:
+    """Checks that the output is split into files of the requested size"""
+    with CSVSink(tmp_path / "keys.csv", records_per_file=400) as sink:
+        issue_keys(REG_FORMAT, 1000, sink, "Test", 2, timedelta(30), processes=1)
+
+    assert [path.name for path in sink.paths] == [
+        "keys-00000.csv",
+        "keys-00001.csv",
+        "keys-00002.csv",
+    ]
+    rows = []
+    for path in sink.paths:
+        with open(path, encoding="utf-8", newline="") as f:
+            rows.extend(csv.DictReader(f))
+
+    assert len({row["key"] for row in rows}) == 1000
+    assert all(row["hwid_limit"] == "2" and row["hwids"] == "[]" for row in rows)
+
+
+def test_issue_signed(tmp_path) -> None:
+    """Checks that signed formats are issued with the secret, across processes"""
+    signed = KeyFormat(
+        5, 5, "-", numeric_characters=True, signature_length=6, embed_metadata=True
+    )
+    with pytest.raises(ValueError):
+        issue_keys(signed, 10, JSONLSink(tmp_path / "x.jsonl"), "Test", 1, timedelta(30))
+
+    with JSONLSink(tmp_path / "keys.jsonl") as sink:
+        issue_keys(
+            signed,
+            500,
+            sink,
+            "Test",
+            3,
+            timedelta(30),
+            secret=b"secret",
+            processes=2,
+            chunk_size=100,
+        )
+
+    with open(tmp_path / "keys.jsonl", encoding="utf-8") as f:
+        keys = [json.loads(line)["key"] for line in f]
+    assert len(set(keys)) == 500
+    assert all(validation.verify_signature(key, signed, b"secret") for key in keys)
+    assert validation.signed_metadata(keys[0], signed, b"secret").hwid_limit == 3
+
+
+def test_sink_validation(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        JSONLSink(tmp_path / "keys.jsonl", records_per_file=0)
+
+    with pytest.raises(TypeError):
+        Sink(tmp_path / "keys.jsonl")
@@ -1,8 +1,11 @@
+import string
 from datetime import datetime, timedelta
 
 import pytest
 
-from pylicensing import Key, KeyFormat
+from pylicensing import Key, KeyFormat, validation
+from pylicensing.key import generate_keys
+from pylicensing.key._generate import keyspace_size
 
 REG_FORMAT = KeyFormat(5, 5, "-")
 
@@ -46,3 +49,44 @@ def test_invalid_formats() -> None:
 
     with pytest.raises(ValueError):
         KeyFormat(5, 5, "/")
+
+    with pytest.raises(ValueError):
+        KeyFormat(1, 1, "-", lowercase_ascii=True)
+
+
+def test_batch_generation() -> None:
+    """Checks that a batch of keys is distinct and conforms to its format"""
+    key_format = KeyFormat(
+        4, 4, "-", lowercase_ascii=True, numeric_characters=True, special_characters=True
+    )
+    keys = generate_keys(key_format, 5000)
+
+    assert len(set(keys)) == 5000
+    assert all(validation.conforms_format(key, key_format) for key in keys)
+
+
+def test_batch_exhausts_keyspace() -> None:
+    """Checks that a batch can use up the whole keyspace but not exceed it"""
+    key_format = KeyFormat(1, 2, "-", lowercase_ascii=True)
+    assert keyspace_size(key_format) == 52 * 52 - 2 * 26 * 26
+
+    assert len(set(generate_keys(key_format, keyspace_size(key_format)))) == 1352
+    with pytest.raises(ValueError):
+        generate_keys(key_format, keyspace_size(key_format) + 1)
+
+
+def test_create_many() -> None:
+    keys = Key.create_many(REG_FORMAT, 100, "Test", 1, timedelta(30))
+    assert len({key.key for key in keys}) == 100
+    assert all(key.owner == "Test" for key in keys)
+
+
+def test_compiled_format() -> None:
+    """Checks that the compiled form of a format is built once and matches it"""
+    key_format = KeyFormat(3, 4, "-", numeric_characters=True)
+    compiled = key_format.compiled
+
+    assert key_format.compiled is compiled
+    assert compiled.length == len("ABCD-EFGH-IJKL") == 14
+    assert compiled.seperator_positions == (4, 9)
+    assert set(compiled.alphabet) == set(string.ascii_uppercase + string.digits)
@@ -0,0 +1,368 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.results import DeleteResult
+
+from pylicensing import ActivationStatus, Key, KeyFormat, KeyManager, exceptions
+from pylicensing.database import BulkUpdateResult
+from pylicensing.storage import MemoryCollection
+
+REG_FORMAT = KeyFormat(5, 5, "-")
+SHORT_FORMAT = KeyFormat(1, 2, "-")
+
+
+def test_add_many(collection) -> None:
+    """Checks that a batch is inserted in chunks and gets its ids assigned"""
+    manager = KeyManager(collection)
+    manager.ensure_indexes()
+    keys = Key.create_many(REG_FORMAT, 250, "Test", 1, timedelta(30))
+
+    result = manager.add_many(keys, chunk_size=100)
+
+    assert len(result.inserted) == 250 and not result.duplicates
+    assert collection.calls.count("insert_many") == 3
+    assert all(collection.find_one({"_id": key._id}) for key in keys)
+
+
+def test_add_many_duplicates(collection) -> None:
+    """Checks that duplicates are reported, or regenerated if the format is known"""
+    manager = KeyManager(collection)
+    manager.ensure_indexes()
+    existing = Key.create(SHORT_FORMAT, "Test", 1, timedelta(30))
+    manager.add_many([existing])
+
+    copies = [Key(existing.key, "Test", 1, existing.created, existing.valid_until)]
+    copies.append(Key(existing.key, "Test", 1, existing.created, existing.valid_until))
+    result = manager.add_many(copies)
+    assert not result.inserted and result.duplicates == copies
+
+    result = manager.add_many(copies, format=SHORT_FORMAT)
+    assert len(result.inserted) == 2 and not result.duplicates
+    assert all(key._id is not None for key in copies)
+    assert len({doc["key"] for doc in collection.find()}) == 3
+
+
+def test_add_many_without_index(collection) -> None:
+    """Checks that duplicates are detected without the unique index as well"""
+    manager = KeyManager(collection)
+    existing = Key.create(SHORT_FORMAT, "Test", 1, timedelta(30))
+    manager.add_many([existing])
+
+    copy = Key(existing.key, "Test", 1, existing.created, existing.valid_until)
+    fresh = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    result = manager.add_many([copy, fresh])
+    assert result.inserted == [fresh] and result.duplicates == [copy]
+    assert collection.count_documents({"key": existing.key}) == 1
+
+    result = manager.add_many([copy], format=SHORT_FORMAT)
+    assert result.inserted == [copy] and copy.key != existing.key
+    assert collection.count_documents({}) == 3
+
+
+def test_add_relies_on_index(collection) -> None:
+    """Checks that with the unique index in place, a key is inserted in one
+    round trip and duplicates are still rejected"""
+    manager = KeyManager(collection)
+    assert manager.ensure_indexes() == ["key_1", "valid_until_1"]
+
+    key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    manager.add_to_collection(key)
+    assert collection.calls == ["create_index", "create_index", "insert_one"]
+
+    copy = Key(key.key, "Test", 1, key.created, key.valid_until)
+    with pytest.raises(exceptions.KeyAlreadyExistsError):
+        manager.add_to_collection(copy)
+
+    assert not manager.add_to_collection(copy, ignore_exists=True)
+    assert copy._id is None and collection.count_documents({}) == 1
+
+    # a fresh manager looks the index up once instead of checking every key
+    collection.calls.clear()
+    fresh = KeyManager(collection)
+    for key in Key.create_many(REG_FORMAT, 2, "Test", 1, timedelta(30)):
+        assert fresh.add_to_collection(key)
+    assert collection.calls == ["index_information", "insert_one", "insert_one"]
+
+    unindexed = MemoryCollection()
+    manager = KeyManager(unindexed)
+    assert manager.add_to_collection(key) and manager.add_to_collection(
+        key, ignore_exists=True
+    )
+    assert unindexed.count_documents({}) == 2
+
+
+def test_iter_keys(collection) -> None:
+    """Checks that keys are streamed lazily, filtered and projected"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 30, "Test", 1, timedelta(30))
+    for key in keys[:10]:
+        key.owner = "Other"
+    manager.add_many(keys)
+
+    iterator = manager.iter_keys({"owner": "Other"}, batch_size=4)
+    assert not isinstance(iterator, list)
+    assert {key.key for key in iterator} == {key.key for key in keys[:10]}
+
+    documents = list(manager.iter_keys({"owner": "Test"}, fields=["key"]))
+    assert len(documents) == 20 and all(list(doc) == ["key"] for doc in documents)
+
+    assert set(manager.iter_ids()) == {key._id for key in keys}
+    assert manager.count_keys({"owner": "Other"}) == 10
+    assert len(manager.get_all_keys()) == 30
+
+
+def test_dirty_fields() -> None:
+    """Checks that a key tracks the fields changed since it was saved"""
+    key = Key.create(REG_FORMAT, "Test", 2, timedelta(30))
+    assert "owner" in key.dirty_fields
+
+    key.mark_saved()
+    assert not key.dirty_fields
+
+    key.owner = "Bert"
+    key.hwids.append("HWID")
+    assert key.dirty_fields == {"owner", "hwids"}
+    assert key.saved_state["owner"] == "Test" and key.saved_state["hwids"] == []
+
+
+def test_from_document() -> None:
+    """Checks that keys are rebuilt from their documents as saved, slotted keys,
+    parsing dates stored as ISO strings"""
+    key = Key.create(REG_FORMAT, "Test", 2, timedelta(30), ip="127.0.0.1")
+    document = key.to_database_data()
+    assert "_id" not in document and document["hwids"] is key.hwids
+
+    loaded = Key.from_document(document)
+    assert loaded == key and not loaded.dirty_fields
+    assert not hasattr(loaded, "__dict__")
+
+    legacy = {**document, "created": key.created.isoformat(), "hwids": ["A"]}
+    legacy["valid_until"] = key.valid_until.isoformat()
+    loaded = Key.from_document(legacy)
+    assert loaded.created == key.created and loaded.valid_until == key.valid_until
+    assert loaded.dirty_fields == set()
+
+    loaded.hwids.append("B")
+    assert loaded.dirty_fields == {"hwids"}
+
+
+def test_update_writes_changes(collection) -> None:
+    """Checks that updates only write what changed, keeping HWIDs registered
+    concurrently and skipping the write if nothing changed"""
+    manager = KeyManager(collection)
+    key = Key.create(REG_FORMAT, "Test", 3, timedelta(30))
+    manager.add_to_collection(key)
+
+    first, second = manager.get(key.key), manager.get(key.key)
+    first.hwids.append("A")
+    second.hwids.append("B")
+    second.owner = "Bert"
+    manager.update(first)
+    manager.update(second)
+
+    stored = manager.get(key.key)
+    assert stored.hwids == ["A", "B"] and stored.owner == "Bert"
+
+    calls = len(collection.calls)
+    manager.update(stored)
+    assert len(collection.calls) == calls
+
+    stored.hwids = ["C"]
+    manager.update(stored)
+    assert manager.get(key.key).hwids == ["C"]
+
+    missing = Key.create(REG_FORMAT, "Test", 3, timedelta(30))
+    with pytest.raises(exceptions.KeyDoesntExistError):
+        manager.update(missing)
+
+
+def test_activate(collection) -> None:
+    """Checks that activating registers HWIDs up to the limit in one round trip"""
+    manager = KeyManager(collection)
+    key = Key.create(REG_FORMAT, "Test", 2, timedelta(30))
+    manager.add_to_collection(key)
+
+    calls = len(collection.calls)
+    result = manager.activate(key.key, "A")
+    assert result and result.key.hwids == ["A"]
+    assert collection.calls[calls:] == ["find_one_and_update"]
+
+    assert manager.activate(key.key, "A").key.hwids == ["A"]
+    assert manager.activate(key.key, "B")
+    result = manager.activate(key.key, "C")
+    assert result.status == ActivationStatus.SEATS_EXHAUSTED
+    assert result.key.hwids == ["A", "B"]
+
+    assert manager.activate("missing", "A").status == ActivationStatus.NOT_FOUND
+
+
+def test_activate_expired_and_unlimited(collection) -> None:
+    """Checks that expired keys are rejected and unlimited keys register nothing"""
+    manager = KeyManager(collection)
+    expired = Key.create(REG_FORMAT, "Test", 1, timedelta(-1))
+    unlimited = Key.create(REG_FORMAT, "Test", 0, timedelta(30))
+    manager.add_to_collection(expired)
+    manager.add_to_collection(unlimited)
+
+    result = manager.activate(expired.key, "A")
+    assert result.status == ActivationStatus.EXPIRED and not result.key.hwids
+
+    result = manager.activate(unlimited.key, "A")
+    assert result and not result.key.hwids
+
+
+def test_bulk_update(collection) -> None:
+    """Checks filtered bulk updates and their counts"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 20, "Test", 2, timedelta(30))
+    for key in keys[:5]:
+        key.owner = "Other"
+        key.hwids = ["A"]
+    manager.add_many(keys)
+
+    result = manager.bulk_update({"owner": "Other"}, {"$set": {"owner": "Bert"}})
+    assert result == BulkUpdateResult(5, 5)
+    assert manager.count_keys({"owner": "Bert"}) == 5
+
+    assert manager.reset_hwids({}) == BulkUpdateResult(20, 5)
+    assert manager.count_keys({"hwids": "A"}) == 0
+
+    manager.extend_validity({"owner": "Bert"}, timedelta(days=10))
+    extended = manager.get(keys[0].key)
+    assert extended.valid_until == keys[0].valid_until + timedelta(days=10)
+
+
+def test_bulk_update_keys(collection) -> None:
+    """Checks that keys are updated in chunks, with a shared update or their
+    own changes"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 25, "Test", 2, timedelta(30))
+    manager.add_many(keys)
+
+    result = manager.bulk_update_keys(keys, {"$set": {"hwid_limit": 5}}, chunk_size=10)
+    assert result == BulkUpdateResult(25, 25)
+    assert collection.calls.count("update_many") == 3
+
+    for i, key in enumerate(keys[:12]):
+        key.owner = f"Owner{i}"
+    calls = len(collection.calls)
+    result = manager.bulk_update_keys(keys, chunk_size=10)
+    assert result == BulkUpdateResult(12, 12)
+    assert collection.calls[calls:] == ["bulk_write", "bulk_write"]
+    assert manager.get(keys[11].key).owner == "Owner11"
+    assert not any(key.dirty_fields for key in keys)
+
+
+def test_bulk_update_keys_missing(collection) -> None:
+    """Checks that keys missing from the collection are reported and stay
+    dirty, while the others are still updated"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 4, "Test", 2, timedelta(30))
+    manager.add_many(keys[:2])
+    collection.delete_one({"key": keys[1].key})
+    collection.insert_one(keys[2].to_database_data())
+    keys[2].mark_saved()
+    keys[3].mark_saved()
+
+    for key in keys:
+        key.owner = "Bert"
+    result = manager.bulk_update_keys(keys)
+    assert result.matched == 2 and result.missing == [keys[1], keys[3]]
+    assert not keys[0].dirty_fields and not keys[2].dirty_fields
+    assert keys[1].dirty_fields == keys[3].dirty_fields == {"owner"}
+    assert manager.get(keys[2].key).owner == "Bert"
+
+    result = manager.bulk_update_keys(keys, {"$set": {"hwid_limit": 5}})
+    assert result.matched == 2 and result.missing == [keys[1], keys[3]]
+
+
+def test_native_dates(collection) -> None:
+    """Checks that dates are stored natively and legacy string dates are read
+    and converted"""
+    manager = KeyManager(collection)
+    key = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    manager.add_to_collection(key)
+    assert isinstance(collection.find_one({})["valid_until"], datetime)
+
+    legacy = Key.create(REG_FORMAT, "Test", 1, timedelta(30))
+    data = legacy.to_database_data()
+    data["created"] = data["created"].isoformat()
+    data["valid_until"] = data["valid_until"].isoformat()
+    collection.insert_one(data)
+    assert manager.get(legacy.key).valid_until == legacy.valid_until
+
+    assert manager.convert_legacy_dates() == 1
+    assert collection.count_documents({"valid_until": {"$type": "string"}}) == 0
+    assert manager.get(legacy.key).valid_until == legacy.valid_until
+
+
+def test_expiry_housekeeping(collection) -> None:
+    """Checks querying and purging expired keys, legacy ones included"""
+    manager = KeyManager(collection)
+    manager.ensure_indexes()
+    expired = Key.create_many(REG_FORMAT, 5, "Test", 1, timedelta(-1))
+    expiring = Key.create_many(REG_FORMAT, 3, "Test", 1, timedelta(2))
+    valid = Key.create_many(REG_FORMAT, 4, "Test", 1, timedelta(30))
+    manager.add_many(expired[1:] + expiring + valid)
+
+    data = expired[0].to_database_data()
+    data["valid_until"] = data["valid_until"].isoformat()
+    collection.insert_one(data)
+
+    soon = datetime.now() + timedelta(days=7)
+    assert len(list(manager.find_expiring(soon))) == 8
+    upcoming = manager.find_expiring(soon, after=datetime.now(), fields=["key"])
+    assert {doc["key"] for doc in upcoming} == {key.key for key in expiring}
+
+    archive = MemoryCollection()
+    assert manager.purge_expired(archive=archive, batch_size=2) == 5
+    assert manager.count_keys() == 7
+    assert {doc["key"] for doc in archive.find()} == {key.key for key in expired}
+
+
+def test_purge_stops_without_deletes() -> None:
+    """Checks that purging stops if a batch can not be deleted, instead of
+    fetching it forever"""
+
+    class Undeletable(MemoryCollection):
+        def delete_many(self, filter: dict, **_) -> DeleteResult:
+            return DeleteResult({"n": 0, "ok": 1.0}, True)
+
+    manager = KeyManager(Undeletable())
+    manager.add_many(Key.create_many(REG_FORMAT, 3, "Test", 1, timedelta(-1)))
+    assert manager.purge_expired(batch_size=2) == 0
+    assert manager.count_keys() == 3
+
+
+def test_exists(collection) -> None:
+    """Checks that existence checks fetch only the key-string, in chunks"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 30, "Test", 1, timedelta(30))
+    manager.add_many(keys[:20])
+
+    assert manager.exists(keys[0].key) and not manager.exists(keys[25].key)
+
+    calls = len(collection.calls)
+    found = manager.exists_many((key.key for key in keys), chunk_size=8)
+    assert found == {key.key for key in keys[:20]}
+    assert collection.calls[calls:] == ["find"] * 4
+
+
+def test_get_many(collection) -> None:
+    """Checks that many keys are fetched in chunks, in order, with misses"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 30, "Test", 1, timedelta(30))
+    manager.add_many(keys[:20])
+    strings = [key.key for key in reversed(keys)]
+
+    calls = len(collection.calls)
+    result = manager.get_many(strings, chunk_size=8)
+    assert collection.calls[calls:] == ["find"] * 4
+    assert list(result) == strings
+    assert [key.key if key else None for key in result.values()] == [
+        key.key if i < 20 else None for i, key in reversed(list(enumerate(keys)))
+    ]
+
+    streamed = manager.iter_many(iter(strings), chunk_size=8)
+    assert next(streamed) == (strings[0], None)
+    assert sum(key is not None for _, key in streamed) == 20
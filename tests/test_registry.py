@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+import pytest
+
+from pylicensing import Key, KeyFormat
+from pylicensing.registry import FormatRegistry
+
+FORMATS = [
+    KeyFormat(5, 5, "-"),
+    KeyFormat(5, 5, "-", lowercase_ascii=True, uppercase_ascii=False),
+    KeyFormat(4, 6, "-", numeric_characters=True),
+    KeyFormat(6, 4, "-", numeric_characters=True),
+    KeyFormat(3, 8, "."),
+]
+
+
+def build_registry() -> FormatRegistry:
+    registry = FormatRegistry()
+    for i, key_format in enumerate(FORMATS):
+        registry.register(key_format, name=f"product{i}")
+    return registry
+
+
+def test_resolve_format() -> None:
+    """Checks that keys of every format resolve to exactly their format"""
+    registry = build_registry()
+    for key_format in FORMATS:
+        for _ in range(50):
+            key = Key.create(key_format, "Test", 1, timedelta(30))
+            assert registry.format_for(key) == key_format
+
+
+def test_resolve_by_shape() -> None:
+    registry = build_registry()
+
+    assert len(registry.candidates("ABCDEF-123456-ABCDEF-123456")) == 1
+    assert len(registry.candidates("ABCDE-FGHIJ-KLMNO-PQRST-UVWXY")) == 2
+    assert not registry.candidates("ABCDEF-123456-ABCDEF-12345")
+    assert not registry.candidates("ABCDEF-123456-ABCDE-F123456")
+    assert registry.resolve("abcde-FGHIJ-KLMNO-PQRST-UVWXY") is None
+
+
+def test_single_section_formats() -> None:
+    """Checks that single section formats of the same length are all
+    candidates, although they have different seperators"""
+    registry = FormatRegistry()
+    letters = registry.register(KeyFormat(1, 8, "-"))
+    digits = registry.register(
+        KeyFormat(1, 8, "_", uppercase_ascii=False, numeric_characters=True)
+    )
+
+    assert registry.candidates("12345678") == [letters, digits]
+    assert registry.resolve("12345678") is digits
+    assert registry.resolve("ABCDEFGH") is letters
+
+
+def test_duplicate_format() -> None:
+    registry = build_registry()
+    with pytest.raises(ValueError):
+        registry.register(KeyFormat(5, 5, "-"))
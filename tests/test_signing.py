@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from pylicensing import Key, KeyFormat, exceptions, validation
+from pylicensing.key._signing import decode_metadata, encode_metadata
+
+SECRET = b"not a very secret secret"
+SIGNED_FORMAT = KeyFormat(5, 5, "-", numeric_characters=True, signature_length=6)
+METADATA_FORMAT = KeyFormat(
+    5, 5, "-", numeric_characters=True, signature_length=6, embed_metadata=True
+)
+
+
+def test_signed_key_verifies() -> None:
+    """Checks that signed keys verify, conform and are rejected when tampered"""
+    keys = Key.create_many(SIGNED_FORMAT, 200, "Test", 1, timedelta(30), secret=SECRET)
+    for key in keys:
+        assert validation.conforms_format(key, SIGNED_FORMAT)
+        assert validation.verify_signature(key, SIGNED_FORMAT, SECRET)
+        assert not validation.verify_signature(key, SIGNED_FORMAT, b"other secret")
+
+        i = key.key.index("-") - 1
+        replacement = "A" if key.key[i] != "A" else "B"
+        forged = key.key[:i] + replacement + key.key[i + 1 :]
+        assert not validation.verify_signature(forged, SIGNED_FORMAT, SECRET)
+
+
+def test_unsigned_key_rejected() -> None:
+    unsigned_format = KeyFormat(5, 5, "-", numeric_characters=True)
+    key = Key.create(unsigned_format, "Test", 1, timedelta(30))
+    assert not validation.verify_signature(key, SIGNED_FORMAT, SECRET)
+
+    with pytest.raises(ValueError):
+        Key.create(SIGNED_FORMAT, "Test", 1, timedelta(30))
+
+
+def test_embedded_metadata() -> None:
+    key = Key.create(METADATA_FORMAT, "Test", 3, timedelta(30), secret=SECRET)
+    metadata = validation.signed_metadata(key, METADATA_FORMAT, SECRET)
+
+    assert metadata.hwid_limit == 3
+    assert metadata.valid_until - key.valid_until < timedelta(hours=1)
+    assert metadata.valid_until >= key.valid_until and not metadata.expired
+
+    # expires within the hour, but not before its actual expiration date
+    soon = Key.create(METADATA_FORMAT, "Test", 3, timedelta(minutes=1), secret=SECRET)
+    metadata = validation.signed_metadata(soon, METADATA_FORMAT, SECRET)
+    assert metadata.valid_until >= soon.valid_until and not metadata.expired
+
+    on_hour = datetime(2030, 1, 1, 12)
+    chars = encode_metadata(METADATA_FORMAT, on_hour, 3)
+    assert decode_metadata(METADATA_FORMAT, chars) == (on_hour, 3)
+    chars = encode_metadata(METADATA_FORMAT, on_hour.replace(minute=1), 3)
+    assert decode_metadata(METADATA_FORMAT, chars)[0] == on_hour.replace(hour=13)
+
+    expired = Key.create(METADATA_FORMAT, "Test", 3, timedelta(hours=-2), secret=SECRET)
+    assert validation.signed_metadata(expired, METADATA_FORMAT, SECRET).expired
+
+    with pytest.raises(exceptions.InvalidSignatureError):
+        validation.signed_metadata(key, METADATA_FORMAT, b"other secret")
+
+
+def test_invalid_signed_formats() -> None:
+    with pytest.raises(ValueError):
+        KeyFormat(5, 5, "-", embed_metadata=True)
+
+    with pytest.raises(ValueError):
+        KeyFormat(1, 6, "-", signature_length=6)
+
+    with pytest.raises(ValueError):
+        KeyFormat(2, 5, "-", signature_length=4, embed_metadata=True)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from pylicensing import Key, KeyFormat, KeyManager, Snapshot, exceptions
+from pylicensing.snapshot import hwid_digest, write_snapshot
+
+REG_FORMAT = KeyFormat(5, 5, "-", numeric_characters=True)
+
+
+def test_snapshot_lookups(collection, tmp_path) -> None:
+    """Checks that keys are found in a snapshot along with their expiration,
+    HWID limit and HWIDs"""
+    manager = KeyManager(collection)
+    keys = Key.create_many(REG_FORMAT, 200, "Test", 3, timedelta(30))
+    keys[0].hwids.extend(["B", "A"])
+    keys[1].valid_until = datetime.now() - timedelta(1)
+    manager.add_many(keys)
+
+    path = tmp_path / "keys.snapshot"
+    assert manager.export_snapshot(path, format=REG_FORMAT) == 200
+
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 200 and snapshot.format == REG_FORMAT
+        assert all(key.key in snapshot for key in keys)
+        assert "AAAAA-AAAAA-AAAAA-AAAAA-AAAAA" not in snapshot
+        assert snapshot.get("TOO-LONG" * 10) is None
+
+        entry = snapshot.get(keys[0].key)
+        assert entry.valid_until == keys[0].valid_until and not entry.expired
+        assert entry.hwid_limit == 3 and entry.hwid_count == 2
+        assert entry.hwids_match(["A", "B"]) and not entry.hwids_match(["A"])
+        assert snapshot.get(keys[1].key).expired
+
+        entries = list(snapshot)
+        assert [entry.key for entry in entries] == sorted(key.key for key in keys)
+
+
+def test_snapshot_documents(tmp_path) -> None:
+    """Checks snapshots written from plain documents, including legacy dates and
+    keys of different lengths"""
+    path = tmp_path / "keys.snapshot"
+    documents = [
+        {"key": "BB", "valid_until": "2030-01-01T00:00:00", "hwid_limit": 1},
+        {"key": "A", "valid_until": None, "hwid_limit": 0, "hwids": []},
+        {"key": "AB§", "valid_until": datetime(2030, 1, 1), "hwids": ["X"]},
+    ]
+    assert write_snapshot(path, documents) == 3
+
+    with Snapshot(path) as snapshot:
+        assert snapshot.format is None
+        assert [entry.key for entry in snapshot] == ["A", "AB§", "BB"]
+        assert snapshot.get("A").valid_until is None
+        assert snapshot.get("BB").valid_until == datetime(2030, 1, 1)
+        assert snapshot.get("AB§").hwid_digest == hwid_digest(["X"])
+        assert "AB" not in snapshot and "B" not in snapshot
+
+    write_snapshot(path, [])
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 0 and "A" not in snapshot
+
+
+def test_snapshot_write_failure(tmp_path) -> None:
+    """Checks that an invalid HWID limit is rejected and leaves neither a
+    snapshot nor a temporary file behind"""
+    path = tmp_path / "keys.snapshot"
+    with pytest.raises(ValueError):
+        write_snapshot(path, [{"key": "A", "valid_until": None, "hwid_limit": -1}])
+    assert not list(tmp_path.iterdir())
+
+    assert write_snapshot(str(path), [{"key": "A", "valid_until": None}]) == 1
+    assert [file.name for file in tmp_path.iterdir()] == ["keys.snapshot"]
+
+
+def test_invalid_snapshot(tmp_path) -> None:
+    path = tmp_path / "keys.snapshot"
+    path.write_bytes(b"")
+    with pytest.raises(exceptions.InvalidSnapshotError):
+        Snapshot(path)
+
+    path.write_bytes(b"not a snapshot at all, really not")
+    with pytest.raises(exceptions.InvalidSnapshotError):
+        Snapshot(path)
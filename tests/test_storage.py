@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from pylicensing import KeyManager
+from pylicensing.storage import KeyStorage, SQLiteCollection
+from pylicensing.storage._base import LocalCollection
+from pylicensing.storage._query import apply_update, matches
+
+NOW = datetime(2024, 1, 1)
+
+
+def fill(collection) -> None:
+    collection.create_index("key", unique=True)
+    collection.insert_many(
+        [
+            {
+                "key": f"K{i}",
+                "owner": "A" if i % 2 else "B",
+                "hwid_limit": i,
+                "hwids": [f"H{i}"] * (i % 3),
+                "valid_until": NOW + timedelta(days=i),
+            }
+            for i in range(10)
+        ]
+    )
+
+
+def test_backends_are_key_storage(collection) -> None:
+    """Checks that the backends satisfy the storage protocol"""
+    assert isinstance(collection.wrapped, KeyStorage)
+    with pytest.raises(TypeError):
+        LocalCollection("keys")  # type: ignore[abstract]
+
+
+def test_query_operators() -> None:
+    """Checks the query semantics the backends rely on"""
+    doc = {"key": "K", "hwids": ["a", "b"], "hwid_limit": 2, "valid_until": NOW}
+    assert matches(doc, {"hwids": "a"}) and not matches(doc, {"hwids": "c"})
+    assert matches(doc, {"hwid_limit": {"$gte": 2, "$lt": 3}})
+    assert not matches(doc, {"hwid_limit": {"$gt": "1"}})
+    assert matches(doc, {"owner": None}) and not matches(doc, {"key": None})
+    assert matches(doc, {"$or": [{"key": "X"}, {"hwids": {"$in": ["b", "c"]}}]})
+    assert matches(doc, {"valid_until": {"$type": "date"}})
+    with pytest.raises(NotImplementedError):
+        matches(doc, {"hwids": {"$size": 2}})
+
+
+def test_update_operators() -> None:
+    """Checks update documents and pipelines"""
+    doc = {"_id": 1, "hwids": ["a"], "hwid_limit": 1}
+    assert apply_update(doc, {"$addToSet": {"hwids": {"$each": ["a", "b"]}}})[
+        "hwids"
+    ] == ["a", "b"]
+    assert apply_update(doc, {"$set": {"hwid_limit": 3}})["hwid_limit"] == 3
+    with pytest.raises(NotImplementedError):
+        apply_update(doc, {"$inc": {"hwid_limit": 2}})
+
+    pipeline = [
+        {
+            "$set": {
+                "hwids": {
+                    "$cond": [
+                        {"$lt": [{"$size": "$hwids"}, "$hwid_limit"]},
+                        {"$concatArrays": ["$hwids", ["b"]]},
+                        "$hwids",
+                    ]
+                }
+            }
+        }
+    ]
+    assert apply_update(doc, pipeline)["hwids"] == ["a"]
+    assert doc["hwids"] == ["a"]
+
+
+def test_find(collection) -> None:
+    """Checks filtering, sorting, skipping, limiting and projecting"""
+    fill(collection)
+
+    assert collection.count_documents({"owner": "A"}) == 5
+    assert collection.count_documents({"key": {"$in": ["K1", "K2", "X"]}}) == 2
+    assert collection.count_documents({"valid_until": {"$lt": NOW + timedelta(3)}}) == 3
+    assert collection.count_documents({"hwids": "H4"}) == 1
+
+    cursor = collection.find({"owner": "B"}, {"key": 1, "_id": 0}).sort("key", -1)
+    assert list(cursor.skip(1).limit(2).batch_size(1)) == [{"key": "K6"}, {"key": "K4"}]
+
+    document = collection.find_one({"key": "K3"})
+    document["hwids"].append("changed")
+    assert collection.find_one(document["_id"])["hwids"] == []
+
+
+def test_writes(collection) -> None:
+    """Checks updates, deletes and the unique index"""
+    fill(collection)
+
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one({"key": "K1"})
+    with pytest.raises(DuplicateKeyError):
+        collection.update_one({"key": "K2"}, {"$set": {"key": "K1"}})
+
+    result = collection.update_many({"owner": "A"}, {"$set": {"owner": "C"}})
+    assert result.matched_count == result.modified_count == 5
+    assert (
+        collection.update_one({"key": "K0"}, {"$set": {"owner": "B"}}).modified_count
+        == 0
+    )
+
+    after = collection.find_one_and_update(
+        {"key": "K0"},
+        {"$addToSet": {"hwids": "X"}},
+        return_document=ReturnDocument.AFTER,
+    )
+    assert after["hwids"] == ["X"]
+
+    assert collection.delete_many({"owner": "C"}).deleted_count == 5
+    assert collection.count_documents({}) == 5
+
+
+def test_bulk_write(collection) -> None:
+    """Checks that bulk writes report their counts and duplicate errors"""
+    fill(collection)
+
+    result = collection.bulk_write(
+        [UpdateOne({"key": "K1"}, {"$set": {"owner": "X"}}), InsertOne({"key": "N"})]
+    )
+    assert result.modified_count == 1 and result.inserted_count == 1
+
+    with pytest.raises(BulkWriteError) as e:
+        collection.insert_many([{"key": "K1"}, {"key": "M"}], ordered=False)
+    assert [error["index"] for error in e.value.details["writeErrors"]] == [0]
+    assert e.value.details["nInserted"] == 1
+
+
+def test_sqlite_persists(tmp_path) -> None:
+    """Checks that a SQLite collection keeps its documents and indexes"""
+    path = str(tmp_path / "keys.db")
+    collection = SQLiteCollection(path)
+    fill(collection)
+    collection.close()
+
+    collection = SQLiteCollection(path)
+    assert collection.find_one({"key": "K5"})["valid_until"] == NOW + timedelta(5)
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one({"key": "K5"})
+    collection.close()
+
+
+def test_sqlite_shared_file(tmp_path) -> None:
+    """Checks that an index created through one handle is used and enforced
+    by another handle on the same file"""
+    path = str(tmp_path / "keys.db")
+    a, b = SQLiteCollection(path), SQLiteCollection(path)
+    a.insert_one({"key": "Y"})
+    KeyManager(b).ensure_indexes()
+
+    a.insert_one({"key": "X"})
+    with pytest.raises(DuplicateKeyError):
+        a.insert_one({"key": "X"})
+    assert a.count_documents({}) == 2 and a.count_documents({"key": "X"}) == 1
+    assert b.count_documents({"key": "X"}) == 1
+    assert a.index_information().keys() == {"_id_", "key_1", "valid_until_1"}
+    a.close()
+    b.close()
+
+
+def test_sqlite_refuses_indexed_arrays() -> None:
+    """Checks that arrays can not be stored in an indexed field, where they
+    would be indistinguishable from each other"""
+    collection = SQLiteCollection()
+    fill(collection)
+    with pytest.raises(ValueError):
+        collection.create_index("hwids")
+    assert collection.index_information().keys() == {"_id_", "key_1"}
+
+    with pytest.raises(ValueError):
+        collection.insert_one({"key": ["K1"]})
+    with pytest.raises(ValueError):
+        collection.update_one({"key": "K1"}, {"$set": {"key": ["A"]}})
+    assert collection.count_documents({"key": "K1"}) == 1
+    assert collection.count_documents({"key": "a"}) == 0
+    collection.close()